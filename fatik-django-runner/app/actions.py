@@ -0,0 +1,624 @@
+import asyncio
+import json
+import os
+import re
+import shutil
+import subprocess
+import time
+import uuid
+from typing import Optional, Dict, Any, List, Tuple
+
+from werkzeug.exceptions import RequestEntityTooLarge, ClientDisconnected
+
+from config import (
+    PROJECTS_DIR, VENVS_DIR, LOGS_DIR, MAX_UPLOAD_BYTES, DEFAULT_PROJECT_MEMORY_MB,
+    LOADTEST_MAX_CONCURRENCY, LOADTEST_MAX_SECONDS,
+)
+from store import ProjectStore
+from jobs import JobQueue, JobQueueFull, JobContext, proc_starttime, wait_job
+from uploads import (
+    UploadStream, StreamingUnzip, UploadError,
+    manifest_path, save_manifest, load_manifest, build_manifest,
+)
+from scanner import scan_project, module_from_path
+from launcher import get_python_from_venv
+from logs import log_files
+from supervisor import SupervisorUnavailable, STOP_GRACE, submit_command, supervisor_status
+from budget import total_budget, check_admission, project_budget
+from runtime import runtime_profile, parse_profile, launch_profile
+from metrics import ring_path
+from httpstats import stats_path
+from loadtest import LoadTest, results_path, save_result
+from proxy import project_prefix
+from installer import (
+    install_requirements_into, record_wheel_stats,
+    requirements_key, venv_path_for_key, venv_ready, mark_venv_ready, venv_lock, release_venv,
+)
+
+# Действия над проектами — общие для форм панели и JSON API (api.py).
+# Долгое (pip, запуск, остановка) уходит в задачи; возвращается запись задачи.
+
+# как часто обновлять прогресс распаковки в задаче "upload"
+UPLOAD_PROGRESS_INTERVAL = 2.0
+# запас сверх времени остановки проекта: супервизору ещё нужно взять команду
+DELETE_STOP_MARGIN = 5.0
+
+
+class ActionError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def get_project(store: ProjectStore, project_id: str) -> Dict[str, Any]:
+    project = store.get_project(project_id)
+    if not project:
+        raise ActionError("Project not found", 404)
+    return project
+
+
+# ---------- Загрузка ----------
+
+def detect_settings_module(manage_path: str, project_root: str, settings_path: Optional[str]) -> Optional[str]:
+    try:
+        with open(manage_path, "r", encoding="utf-8") as f:
+            text = f.read()
+    except Exception:
+        return None
+
+    m = re.search(r"DJANGO_SETTINGS_MODULE[\"']\s*,\s*[\"']([^\"']+)[\"']", text)
+    if m:
+        return m.group(1)
+
+    if not settings_path:
+        return None
+
+    return module_from_path(settings_path, project_root)
+
+
+def register_project(store: ProjectStore, root_dir: str, zip_filename: str,
+                     paths: Optional[List[str]] = None) -> Dict[str, Any]:
+    # один проход сканера находит всё сразу; пути сохраняются в проекте, старт дерево не обходит
+    found = scan_project(root_dir, paths)
+    manage_py = found["manage_py"]
+    requirements = found["requirements"]
+    env_file = found["env_file"]
+    settings_module = detect_settings_module(manage_py, root_dir, found["settings_py"]) if manage_py else None
+
+    if manage_py:
+        project_name = os.path.basename(os.path.dirname(manage_py))
+    else:
+        project_name = os.path.splitext(os.path.basename(zip_filename))[0]
+
+    project_id = os.path.basename(root_dir)
+    # venv общий для проектов с одинаковыми requirements.txt (ключ — хэш зависимостей)
+    venv_key = requirements_key(requirements) if requirements else None
+    venv_path = venv_path_for_key(venv_key) if venv_key else os.path.join(VENVS_DIR, project_id)
+
+    project = {
+        "id": project_id,
+        "name": project_name,
+        "root_dir": root_dir,
+        "manage_py": manage_py,
+        "settings_module": settings_module,
+        "env_file": env_file,
+        "requirements": requirements,
+        "wsgi_path": found["wsgi_path"],
+        "asgi_path": found["asgi_path"],
+        "static_dirs": found["static_dirs"],
+        "venv_path": venv_path,
+        "venv_key": venv_key,
+        # готовый venv с теми же зависимостями — ставить ничего не нужно
+        "requirements_installed": bool(venv_key and venv_ready(venv_path, venv_key)),
+        "last_error": None,
+        "run_pid": None,
+        "is_running": False,
+        "started_at": None,  # timestamp запуска
+        "log_file": os.path.join(LOGS_DIR, f"{project_id}.log"),
+    }
+
+    store.save_project(project)
+
+    return project
+
+
+def upload_error(e: Exception) -> ActionError:
+    if isinstance(e, UploadError):
+        return ActionError(str(e), e.status)
+    if isinstance(e, RequestEntityTooLarge):
+        return ActionError(f"Upload is larger than {MAX_UPLOAD_BYTES} bytes", 413)
+    return ActionError("Upload was interrupted")
+
+
+def receive_upload(store: ProjectStore, request) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    # архив не сохраняется целиком: байты из запроса сразу распаковываются в папку проекта
+    upload = UploadStream(request)
+    chunks = iter(upload)
+    try:
+        # в multipart имя файла приходит в заголовке части: читаем тело до первых байт ZIP
+        first = next(chunks, b"")
+    except (UploadError, RequestEntityTooLarge, ClientDisconnected) as e:
+        raise upload_error(e)
+    if not upload.filename:
+        raise ActionError("Empty file name")
+
+    project_id = str(uuid.uuid4())
+    project_root = os.path.join(PROJECTS_DIR, project_id)
+    os.makedirs(project_root, exist_ok=True)
+
+    job = store.create_job({
+        "id": str(uuid.uuid4()),
+        "project_id": project_id,
+        "kind": "upload",
+        "status": "running",
+        "message": "Receiving archive",
+        "owner_pid": os.getpid(),
+        "owner_starttime": proc_starttime(os.getpid()),
+        "created_at": time.time(),
+        "started_at": time.time(),
+    })
+
+    unzip = StreamingUnzip(project_root)
+    reported_at = time.time()
+    try:
+        unzip.feed(first)
+        for chunk in chunks:
+            unzip.feed(chunk)
+            if time.time() - reported_at > UPLOAD_PROGRESS_INTERVAL:
+                reported_at = time.time()
+                store.update_job(job["id"], message=(
+                    f"Received {upload.received / 1048576:.1f} MB, "
+                    f"extracted {unzip.files} files ({unzip.total_bytes / 1048576:.1f} MB)"
+                ))
+        unzip.finish()
+    except (UploadError, RequestEntityTooLarge, ClientDisconnected) as e:
+        unzip.close()
+        shutil.rmtree(project_root, ignore_errors=True)
+        store.delete_jobs(project_id)
+        raise upload_error(e)
+    except Exception:
+        unzip.close()
+        shutil.rmtree(project_root, ignore_errors=True)
+        store.delete_jobs(project_id)
+        raise
+
+    project = register_project(store, project_root, upload.filename, unzip.paths)
+    save_manifest(project_id, unzip.manifest)
+    store.update_job(
+        job["id"],
+        status="done",
+        finished_at=time.time(),
+        message=(
+            f"{upload.filename}: {unzip.files} files, {unzip.total_bytes / 1048576:.1f} MB extracted "
+            f"from {upload.received / 1048576:.1f} MB in {time.time() - job['started_at']:.1f} s"
+        ),
+    )
+    return project, store.get_job(job["id"]) or job
+
+
+# ---------- Обновление ----------
+
+SHA256_HEX = re.compile(r"^[0-9a-f]{64}$")
+
+
+def project_manifest(project: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    manifest = load_manifest(project["id"])
+    if manifest is None:
+        manifest = build_manifest(project["root_dir"], project.get("static_root"))
+        save_manifest(project["id"], manifest)
+    return manifest
+
+
+def submit_manifest(store: ProjectStore, project_id: str, files: Any) -> Dict[str, Any]:
+    # Предварительный шаг обновления: клиент присылает полный список файлов (путь -> sha256),
+    # в ответ — какие из них нужно положить в архив. Список запоминается до следующего
+    # обновления с ?manifest=1 — по нему проверяется, что архив ничего не упустил.
+    project = get_project(store, project_id)
+    if not isinstance(files, dict) or not all(
+            isinstance(k, str) and isinstance(v, str) and SHA256_HEX.match(v) for k, v in files.items()):
+        raise ActionError('Expected {"files": {"<path>": "<sha256 hex>", ...}}')
+    current = project_manifest(project)
+    save_manifest(project_id, files, pending=True)
+    return {
+        "needed": sorted(p for p, sha in files.items() if current.get(p, {}).get("sha256") != sha),
+        "deleted": sorted(set(current) - set(files)),
+    }
+
+
+def receive_update(store: ProjectStore, jobs: JobQueue, project_id: str, request,
+                   prune: bool = False, use_manifest: bool = False) -> Dict[str, Any]:
+    # Новая версия существующего проекта: полный архив или только изменённые файлы.
+    # Пишутся только файлы с другим содержимым, venv остаётся, если не менялись
+    # зависимости, работающий проект переключается на новую версию через blue/green.
+    project = get_project(store, project_id)
+    root = project["root_dir"]
+    expected = None
+    if use_manifest:
+        expected = load_manifest(project_id, pending=True)
+        if expected is None:
+            raise ActionError("Submit the file manifest first", 409)
+    previous = project_manifest(project)
+
+    upload = UploadStream(request)
+    jobs.fail_orphans()
+    job_id = str(uuid.uuid4())
+    job = store.create_job({
+        "id": job_id,
+        "project_id": project_id,
+        "kind": "update",
+        "status": "running",
+        "message": "Receiving archive",
+        "owner_pid": os.getpid(),
+        "owner_starttime": proc_starttime(os.getpid()),
+        "created_at": time.time(),
+        "started_at": time.time(),
+    }, unique=True)
+    if job["id"] != job_id:
+        # два обновления одного дерева одновременно перепутали бы файлы
+        raise ActionError("Another update of this project is in progress", 409)
+
+    def fail(message: str, status: int = 400):
+        unzip.discard()
+        store.update_job(job["id"], status="failed", message=message, finished_at=time.time())
+        return ActionError(message, status)
+
+    unzip = StreamingUnzip(root, previous)
+    try:
+        for chunk in upload:
+            unzip.feed(chunk)
+        unzip.finish()
+    except UploadError as e:
+        raise fail(str(e), e.status)
+    except RequestEntityTooLarge:
+        raise fail(f"Upload is larger than {MAX_UPLOAD_BYTES} bytes", 413)
+    except ClientDisconnected:
+        raise fail("Upload was interrupted")
+    except Exception as e:
+        fail(f"Update failed: {e}", 500)
+        raise
+
+    # флажок из формы панели приходит полем multipart, API передаёт его в query
+    prune = prune or upload.fields.get("prune") == "1"
+    manifest = dict(previous)
+    manifest.update(unzip.manifest)
+    if expected is not None:
+        missing = [p for p, sha in expected.items() if manifest.get(p, {}).get("sha256") != sha]
+        if missing:
+            raise fail(f"Archive lacks {len(missing)} changed files, e.g. {missing[0]}", 409)
+        keep = set(expected)
+    else:
+        keep = set(unzip.manifest)
+
+    # любая ошибка дальше должна завершить задачу, иначе она останется running
+    # и будет отвечать 409 на все следующие обновления
+    try:
+        unzip.commit()
+
+        # удаляем только по просьбе: в дереве бывают файлы, которых нет в архивах (db.sqlite3, media)
+        deleted = sorted(set(previous) - keep) if prune else []
+        for rel in deleted:
+            try:
+                os.remove(os.path.join(root, rel))
+            except OSError:
+                pass
+            manifest.pop(rel, None)
+        save_manifest(project_id, manifest)
+        if expected is not None:
+            os.remove(manifest_path(project_id, pending=True))
+
+        # пути известны из манифеста — сканер по диску не ходит
+        found = scan_project(root, list(manifest))
+        manage_py = found["manage_py"]
+        fields = {
+            "manage_py": manage_py,
+            "settings_module": detect_settings_module(manage_py, root, found["settings_py"]) if manage_py else None,
+            "env_file": found["env_file"],
+            "requirements": found["requirements"],
+            "wsgi_path": found["wsgi_path"],
+            "asgi_path": found["asgi_path"],
+            "static_dirs": found["static_dirs"],
+        }
+        venv_key = requirements_key(found["requirements"]) if found["requirements"] else None
+        reinstall = bool(venv_key) and not (venv_key == project.get("venv_key") and project.get("requirements_installed"))
+        if reinstall:
+            fields["requirements_installed"] = False
+        project = store.update_project(project_id, **fields) or project
+
+        summary = (f"{len(unzip.changed)} changed, {unzip.unchanged} unchanged, {len(deleted)} deleted "
+                   f"in {time.time() - job['started_at']:.1f} s")
+        store.update_job(job["id"], status="done", finished_at=time.time(), message=summary)
+    except Exception as e:
+        store.update_job(job["id"], status="failed", message=f"Update failed: {e}", finished_at=time.time())
+        raise ActionError(f"Update failed: {e}", 500)
+
+    follow_up = None
+    try:
+        if reinstall:
+            follow_up = jobs.submit(project_id, "install", lambda ctx: update_dependencies(store, ctx))
+        elif project.get("is_running") and (unzip.changed or deleted):
+            follow_up = run_command(store, project_id, "redeploy")
+    except (ActionError, JobQueueFull) as e:
+        store.update_project(project_id, last_error=f"Files updated, but {e}")
+
+    return {
+        "project": project,
+        "job": store.get_job(job["id"]) or job,
+        "follow_up": follow_up,
+        "changed": unzip.changed,
+        "unchanged": unzip.unchanged,
+        "deleted": deleted,
+    }
+
+
+def update_dependencies(store: ProjectStore, ctx: JobContext) -> str:
+    # requirements.txt изменился: новый (или уже готовый общий) venv, затем blue/green —
+    # HUP не поможет, мастер gunicorn работает на интерпретаторе старого venv
+    message = install_job(store, ctx)
+    project = store.get_project(ctx.project_id)
+    if project and project.get("is_running"):
+        ctx.write("Switching the running project to the new virtualenv\n")
+        try:
+            submit_command(store, ctx.project_id, "redeploy", "Queued after dependency update")
+        except SupervisorUnavailable as e:
+            raise RuntimeError(f"{message}; redeploy was not queued: {e}")
+        return f"{message}; redeploy queued"
+    return message
+
+
+# ---------- Зависимости ----------
+
+def install_job(store: ProjectStore, ctx: JobContext) -> str:
+    project = store.get_project(ctx.project_id)
+    if not project:
+        raise RuntimeError("Project was deleted")
+
+    req_path = project.get("requirements")
+    old_venv_path = project.get("venv_path")
+
+    try:
+        venv_key = requirements_key(req_path)
+        venv_path = venv_path_for_key(venv_key)
+        install_stats = None
+
+        with venv_lock(venv_path):
+            if venv_ready(venv_path, venv_key):
+                ctx.write(f"Reusing virtualenv {venv_path} (same requirements)\n")
+            else:
+                # недоустановленный venv (упал pip, перезапуск контейнера) пересоздаём с нуля
+                if os.path.exists(venv_path):
+                    shutil.rmtree(venv_path)
+                ctx.set_message("Creating virtualenv")
+                ctx.run(["python", "-m", "venv", venv_path])
+
+                python_exe = get_python_from_venv(venv_path)
+
+                install_stats = install_requirements_into(ctx, python_exe, req_path)
+                if "hits" in install_stats:
+                    record_wheel_stats(store, install_stats)
+                mark_venv_ready(venv_path, venv_key, req_path)
+
+        result = {
+            "venv_path": venv_path,
+            "venv_key": venv_key,
+            "requirements_installed": True,
+            "last_error": None,
+        }
+        if install_stats:
+            # где уходит время установки: resolve / download / build / install
+            result["install_timings"] = dict(install_stats["timings"], backend=install_stats["backend"],
+                                             at=install_stats["at"])
+            if "hits" in install_stats:
+                result["wheel_cache"] = {k: install_stats[k] for k in ("hits", "misses", "bytes_saved", "offline", "at")}
+    except subprocess.CalledProcessError as e:
+        result = {"requirements_installed": False, "last_error": f"Ошибка установки зависимостей: {e}"}
+    except Exception as e:
+        result = {"requirements_installed": False, "last_error": f"Неожиданная ошибка: {e}"}
+
+    # pip работает минутами — пишем только свои поля, не затирая чужие изменения
+    store.update_project(ctx.project_id, **result)
+    if result["last_error"]:
+        raise RuntimeError(result["last_error"])
+
+    # проект переехал в общий venv — старый удаляем, если он больше никому не нужен.
+    # Пока на нём работает запущенный gunicorn, release_venv его не тронет: удалит
+    # супервизор, когда redeploy или stop погасит старый процесс
+    if old_venv_path and old_venv_path != result["venv_path"]:
+        release_venv(store, old_venv_path)
+
+    if not install_stats:
+        return "Linked to an existing virtualenv with the same requirements"
+    took = install_stats["timings"]["total"]
+    if "hits" not in install_stats:
+        return f"Dependencies installed with {install_stats['backend']} in {took:.1f} s"
+    return (f"Dependencies installed in {took:.1f} s "
+            f"({install_stats['hits']} wheels from cache, {install_stats['misses']} new)")
+
+
+def submit_install(store: ProjectStore, jobs: JobQueue, project_id: str) -> Dict[str, Any]:
+    project = get_project(store, project_id)
+    req_path = project.get("requirements")
+    if not req_path or not os.path.exists(req_path):
+        raise ActionError("requirements.txt not found for this project", 409)
+
+    # pip может работать минутами — выполняем в фоне, воркер панели не блокируется
+    try:
+        return jobs.submit(project_id, "install", lambda ctx: install_job(store, ctx))
+    except JobQueueFull as e:
+        raise ActionError(str(e), 503)
+
+
+# ---------- Процессы ----------
+
+def run_command(store: ProjectStore, project_id: str, kind: str) -> Dict[str, Any]:
+    # процессами проектов владеет супервизор: здесь только проверки и команда ему
+    project = get_project(store, project_id)
+    if kind == "start" and project.get("is_running"):
+        # повторный запуск работающего проекта — blue/green, без окна отказов в соединении
+        kind = "redeploy"
+    elif kind == "start":
+        # другие проекты продолжают работать, если хватает общего бюджета памяти и воркеров
+        error = check_admission(store, project)
+        if error:
+            raise ActionError(error, 409)
+    elif kind == "reload":
+        if not project.get("is_running"):
+            raise ActionError("Project is not running", 409)
+        # с --preload код загружен в мастере, и HUP его не перечитает — нужен blue/green
+        if runtime_profile(project)["preload"]:
+            kind = "redeploy"
+    try:
+        return submit_command(store, project_id, kind)
+    except SupervisorUnavailable as e:
+        raise ActionError(str(e), 503)
+
+
+def update_runtime(store: ProjectStore, project_id: str, form) -> Dict[str, Any]:
+    get_project(store, project_id)
+    try:
+        profile = parse_profile(form)
+        memory_mb = int(form.get("memory_mb") or DEFAULT_PROJECT_MEMORY_MB)
+    except ValueError as e:
+        raise ActionError(f"Runtime profile: {e}")
+
+    total = total_budget()
+    if not 64 <= memory_mb <= total["memory_mb"] or profile["workers"] > total["workers"]:
+        raise ActionError(f"Budget out of range: up to {total['workers']} workers, 64-{total['memory_mb']} MB")
+
+    # применяется при следующем запуске
+    project = store.update_project(project_id, runtime=profile, memory_mb=memory_mb, last_error=None)
+    if not project:
+        raise ActionError("Project not found", 404)
+    return project
+
+
+def submit_delete(store: ProjectStore, jobs: JobQueue, project_id: str) -> Dict[str, Any]:
+    # остановка может идти graceful_timeout секунд — ждём её в фоне, не в запросе
+    project = get_project(store, project_id)
+    if (project.get("is_running") or project.get("desired") == "running") and not supervisor_status()["alive"]:
+        raise ActionError("Process supervisor is not running, try again in a few seconds", 503)
+    try:
+        return jobs.submit(project_id, "delete", lambda ctx: delete_job(store, ctx))
+    except JobQueueFull as e:
+        raise ActionError(str(e), 503)
+
+
+def delete_job(store: ProjectStore, ctx: JobContext) -> str:
+    project_id = ctx.project_id
+    project = store.get_project(project_id)
+    if not project:
+        return "Already deleted"
+
+    # процессами владеет супервизор: останавливаем проект его командой и дожидаемся,
+    # иначе он перезапустил бы упавший gunicorn или процесс пережил бы свои файлы
+    if project.get("is_running") or project.get("desired") == "running":
+        ctx.set_message("Stopping the project")
+        try:
+            job = submit_command(store, project_id, "stop", "Stopping before delete")
+        except SupervisorUnavailable as e:
+            raise RuntimeError(str(e))
+        timeout = runtime_profile(project)["graceful_timeout"] + STOP_GRACE + DELETE_STOP_MARGIN
+        job = wait_job(store, job["id"], timeout)
+        if job is None:
+            raise RuntimeError("Project is still stopping, try deleting it again")
+        if job["status"] == "failed":
+            raise RuntimeError(f"Could not stop the project: {job['message']}")
+    ctx.set_message("Removing files")
+
+    # удаляем файлы (venv — ниже, он может быть общим с другими проектами)
+    try:
+        if project.get("root_dir") and os.path.exists(project["root_dir"]):
+            shutil.rmtree(project["root_dir"], ignore_errors=True)
+        for path in log_files(project.get("log_file")):
+            os.remove(path)
+        for path in (ring_path(project_id), stats_path(project_id), results_path(project_id),
+                     manifest_path(project_id), manifest_path(project_id, pending=True)):
+            if os.path.exists(path):
+                os.remove(path)
+    except Exception:
+        # намеренно глушим, чтобы не сломать UI; можно писать в отдельный системный лог
+        pass
+
+    # чистим из хранилища вместе с историей задач (кроме этой — её результат ещё читают)
+    for job in store.delete_jobs(project_id, keep=ctx.id):
+        if job.get("log_file") and os.path.exists(job["log_file"]):
+            os.remove(job["log_file"])
+    store.delete_project(project_id)
+
+    # venv удаляется, только когда на него не ссылается ни один проект
+    try:
+        release_venv(store, project.get("venv_path"))
+    except Exception:
+        pass
+    return "Project deleted"
+
+
+# ---------- Нагрузочный тест ----------
+
+LOADTEST_DEFAULTS = {"concurrency": 10, "duration": 10, "timeout": 10}
+LOADTEST_MAX_PATHS = 50
+
+
+def parse_loadtest(form) -> Dict[str, Any]:
+    # поля формы панели или JSON API; paths — строка через пробелы/запятые или список
+    params: Dict[str, Any] = {}
+    limits = {"concurrency": LOADTEST_MAX_CONCURRENCY, "duration": LOADTEST_MAX_SECONDS, "timeout": 60}
+    for field, high in limits.items():
+        raw = str(form.get(field) or "").strip()
+        try:
+            value = int(raw) if raw else LOADTEST_DEFAULTS[field]
+        except ValueError:
+            raise ActionError(f"{field} must be a whole number")
+        if not 1 <= value <= high:
+            raise ActionError(f"{field} must be between 1 and {high}")
+        params[field] = value
+    raw_paths = form.get("paths") or "/"
+    paths = raw_paths if isinstance(raw_paths, list) else re.split(r"[\s,]+", raw_paths.strip())
+    paths = [p for p in paths if p]
+    if not paths or len(paths) > LOADTEST_MAX_PATHS:
+        raise ActionError(f"Give 1 to {LOADTEST_MAX_PATHS} paths")
+    for path in paths:
+        if not isinstance(path, str) or not path.startswith("/") or re.search(r"[\s\x00-\x1f]", path):
+            raise ActionError(f"Paths must start with / and contain no spaces: {path!r}")
+    params["paths"] = paths
+    return params
+
+
+def submit_loadtest(store: ProjectStore, jobs: JobQueue, project_id: str, form) -> Dict[str, Any]:
+    project = get_project(store, project_id)
+    if not project.get("is_running") or not project.get("port"):
+        raise ActionError("Start the project before load testing it", 409)
+    params = parse_loadtest(form)
+    try:
+        return jobs.submit(project_id, "loadtest", lambda ctx: loadtest_job(store, ctx, params))
+    except JobQueueFull as e:
+        raise ActionError(str(e), 503)
+
+
+def loadtest_job(store: ProjectStore, ctx: JobContext, params: Dict[str, Any]) -> str:
+    # бьём прямо в порт gunicorn: прокси открывает соединение на каждый запрос и
+    # мерился бы вместе с проектом. Пути — относительно префикса проекта (SCRIPT_NAME).
+    project = store.get_project(ctx.project_id)
+    if not project or not project.get("is_running") or not project.get("port"):
+        raise RuntimeError("Project is not running")
+    prefix = project_prefix(project)
+    test = LoadTest(project["port"], [prefix + p for p in params["paths"]],
+                    params["concurrency"], params["duration"], params["timeout"])
+    ctx.write(f"Load testing 127.0.0.1:{project['port']}{prefix}: {params['concurrency']} connections "
+              f"for {params['duration']} s, paths {' '.join(params['paths'])}\n")
+    result = asyncio.run(test.run(ctx.set_message))
+
+    # рядом с результатом — профиль, с которым проект реально запущен
+    result.update(
+        at=time.time(),
+        job_id=ctx.id,
+        params=params,
+        runtime=project.get("active_runtime") or launch_profile(project),
+        memory_mb=project_budget(project)["memory_mb"],
+    )
+    save_result(ctx.project_id, result)
+    ctx.write(json.dumps(result, indent=2) + "\n")
+    if not result["requests"]:
+        raise RuntimeError(f"No request completed: {result['errors']}")
+    latency = result["latency_ms"]
+    return (f"{result['rps']:.1f} req/s, p50 {latency['p50']:.1f} ms, p99 {latency['p99']:.1f} ms, "
+            f"{result['error_rate'] * 100:.1f}% errors")
@@ -0,0 +1,189 @@
+from flask import Blueprint, request, jsonify, url_for
+from typing import Dict, Any, Optional
+
+from store import ProjectStore
+from jobs import JobQueue
+from logs import tail_file
+from proxy import project_route, project_prefix
+from budget import project_budget
+from runtime import runtime_profile
+from loadtest import load_results
+from actions import (
+    ActionError, receive_upload, receive_update, submit_manifest, submit_install, run_command, update_runtime,
+    submit_loadtest, submit_delete,
+)
+
+# JSON API панели: /api/v1/...
+# Долгие действия (установка, запуск, остановка, перезапуск, удаление) отвечают 202 с задачей —
+# её состояние опрашивается по /api/v1/jobs/<id>. Списки отдаются с ETag.
+COMMANDS = ("start", "stop", "reload", "redeploy")
+
+
+def project_view(p: Dict[str, Any], job: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    # без путей и pid — только то, что нужно клиенту API
+    return {
+        "id": p["id"],
+        "name": p.get("name"),
+        "route": project_route(p),
+        "path": project_prefix(p) + "/",
+        "state": p.get("state") or ("running" if p.get("is_running") else "stopped"),
+        "desired": p.get("desired"),
+        "is_running": bool(p.get("is_running")),
+        "started_at": p.get("started_at"),
+        "restarts": p.get("restarts") or 0,
+        "requirements_installed": bool(p.get("requirements_installed")),
+        "install_timings": p.get("install_timings"),
+        "last_error": p.get("last_error"),
+        "runtime": runtime_profile(p),
+        "active_runtime": p.get("active_runtime") if p.get("is_running") else None,
+        "budget": project_budget(p),
+        "job": job_view(job),
+    }
+
+
+def job_view(job: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if job is None:
+        return None
+    view = {k: v for k, v in job.items() if k != "log_file"}
+    view["url"] = url_for("api.job", job_id=job["id"])
+    return view
+
+
+def error(message: str, status: int):
+    return jsonify({"error": message}), status
+
+
+def accepted(job: Dict[str, Any]):
+    resp = jsonify({"job": job_view(job)})
+    resp.status_code = 202
+    resp.headers["Location"] = url_for("api.job", job_id=job["id"])
+    return resp
+
+
+def conditional(payload: Any):
+    # ETag от содержимого: пока ничего не поменялось, клиент получает 304 без тела
+    resp = jsonify(payload)
+    resp.add_etag()
+    return resp.make_conditional(request)
+
+
+def profile_form(body: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, str]:
+    # JSON -> поля формы для parse_profile; не переданное остаётся как было
+    merged = dict(current, **body)
+    form = {}
+    for key, value in merged.items():
+        if isinstance(value, bool):
+            form[key] = "1" if value else ""
+        elif value is not None:
+            form[key] = str(value)
+    return form
+
+
+def create_api(store: ProjectStore, jobs: JobQueue) -> Blueprint:
+    api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+    @api.errorhandler(ActionError)
+    def action_error(e: ActionError):
+        return error(str(e), e.status)
+
+    @api.route("/projects", methods=["GET"])
+    def projects():
+        latest = store.latest_jobs()
+        return conditional({"projects": [project_view(p, latest.get(p["id"])) for p in store.cached_projects()]})
+
+    @api.route("/projects", methods=["POST"])
+    def upload():
+        # тело — ZIP (application/zip, имя в ?filename= или X-Filename) или multipart с полем zip_file
+        project, job = receive_upload(store, request)
+        resp = jsonify({"project": project_view(project), "job": job_view(job)})
+        resp.status_code = 201
+        resp.headers["Location"] = url_for("api.project", project_id=project["id"])
+        return resp
+
+    @api.route("/projects/<project_id>", methods=["GET"])
+    def project(project_id: str):
+        p = store.cached_project(project_id)
+        if not p:
+            return error("Project not found", 404)
+        return conditional(project_view(p, store.latest_jobs().get(project_id)))
+
+    @api.route("/projects/<project_id>", methods=["DELETE"])
+    def delete(project_id: str):
+        return accepted(submit_delete(store, jobs, project_id))
+
+    @api.route("/projects/<project_id>/manifest", methods=["POST"])
+    def manifest(project_id: str):
+        # {"files": {"<path>": "<sha256>"}} -> какие файлы класть в архив для ?manifest=1
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return error("Expected a JSON object", 400)
+        return jsonify(submit_manifest(store, project_id, body.get("files")))
+
+    @api.route("/projects/<project_id>/update", methods=["POST"])
+    def update(project_id: str):
+        # тело — как у загрузки; ?prune=1 удаляет файлы, которых нет в новой версии,
+        # ?manifest=1 — архив только с изменёнными файлами по присланному манифесту
+        result = receive_update(store, jobs, project_id, request,
+                                prune=request.args.get("prune") == "1",
+                                use_manifest=request.args.get("manifest") == "1")
+        resp = jsonify({
+            "project": project_view(result["project"]),
+            "job": job_view(result["job"]),
+            "follow_up": job_view(result["follow_up"]),
+            "changed": result["changed"],
+            "unchanged": result["unchanged"],
+            "deleted": result["deleted"],
+        })
+        if result["follow_up"]:
+            resp.status_code = 202
+            resp.headers["Location"] = url_for("api.job", job_id=result["follow_up"]["id"])
+        return resp
+
+    @api.route("/projects/<project_id>/install", methods=["POST"])
+    def install(project_id: str):
+        return accepted(submit_install(store, jobs, project_id))
+
+    @api.route("/projects/<project_id>/loadtest", methods=["POST"])
+    def loadtest(project_id: str):
+        # {"concurrency": 10, "duration": 10, "timeout": 10, "paths": ["/", "/api/"]}
+        body = request.get_json(silent=True)
+        if body is not None and not isinstance(body, dict):
+            return error("Expected a JSON object", 400)
+        return accepted(submit_loadtest(store, jobs, project_id, body or {}))
+
+    @api.route("/projects/<project_id>/loadtests", methods=["GET"])
+    def loadtests(project_id: str):
+        if not store.cached_project(project_id):
+            return error("Project not found", 404)
+        return conditional({"results": load_results(project_id)})
+
+    @api.route("/projects/<project_id>/<kind>", methods=["POST"])
+    def command(project_id: str, kind: str):
+        if kind not in COMMANDS:
+            return error(f"Unknown action: {kind}", 404)
+        return accepted(run_command(store, project_id, kind))
+
+    @api.route("/projects/<project_id>/runtime", methods=["PUT", "PATCH"])
+    def runtime(project_id: str):
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return error("Expected a JSON object", 400)
+        current = store.get_project(project_id)
+        if not current:
+            return error("Project not found", 404)
+        base = dict(runtime_profile(current), memory_mb=project_budget(current)["memory_mb"])
+        if request.method == "PUT":
+            base = {}
+        project = update_runtime(store, project_id, profile_form(body, base))
+        return jsonify(project_view(project))
+
+    @api.route("/jobs/<job_id>", methods=["GET"])
+    def job(job_id: str):
+        jobs.fail_orphans()
+        found = store.get_job(job_id)
+        if not found:
+            return error("Job not found", 404)
+        found["output"] = tail_file(found.get("log_file"), lines=request.args.get("lines", default=40, type=int))
+        return jsonify(job_view(found))
+
+    return api
@@ -0,0 +1,67 @@
+import os
+from typing import Optional, Dict, Any
+
+from config import (
+    PROJECTS_MEMORY_MB,
+    PROJECTS_MAX_WORKERS,
+    DEFAULT_PROJECT_MEMORY_MB,
+)
+from store import ProjectStore
+from runtime import effective_workers, WORKER_MEMORY_MB
+
+# часть памяти машины, которую отдаём проектам, если бюджет не задан явно
+MEMORY_SHARE = 0.75
+
+
+def machine_memory_mb() -> int:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+
+
+def total_budget() -> Dict[str, int]:
+    cpus = os.cpu_count() or 1
+    memory_mb = PROJECTS_MEMORY_MB or int(machine_memory_mb() * MEMORY_SHARE)
+    # 2 * CPU + 1 — формула для одного приложения, auto_workers даёт столько же одному
+    # проекту. По умолчанию бюджет воркеров — сколько их помещается в память проектов:
+    # проектов несколько, и упираться они должны в память, а не во второй же запуск.
+    return {
+        "memory_mb": memory_mb,
+        "workers": PROJECTS_MAX_WORKERS or max(cpus * 2 + 1, memory_mb // WORKER_MEMORY_MB),
+    }
+
+
+def project_budget(project: Dict[str, Any]) -> Dict[str, int]:
+    return {
+        "memory_mb": int(project.get("memory_mb") or DEFAULT_PROJECT_MEMORY_MB),
+        "workers": effective_workers(project),
+    }
+
+
+def budget_usage(store: ProjectStore, exclude: Optional[str] = None) -> Dict[str, int]:
+    used = {"memory_mb": 0, "workers": 0}
+    for p in store.cached_projects():
+        if p.get("is_running") and p.get("id") != exclude:
+            b = project_budget(p)
+            used["memory_mb"] += b["memory_mb"]
+            used["workers"] += b["workers"]
+    return used
+
+
+def check_admission(store: ProjectStore, project: Dict[str, Any]) -> Optional[str]:
+    # проект запускается, только если его бюджет помещается рядом с уже запущенными
+    total = total_budget()
+    used = budget_usage(store, exclude=project["id"])
+    need = project_budget(project)
+    if used["memory_mb"] + need["memory_mb"] > total["memory_mb"]:
+        return (f"Memory budget exceeded: {need['memory_mb']} MB requested, "
+                f"{max(total['memory_mb'] - used['memory_mb'], 0)} MB of {total['memory_mb']} MB free")
+    if used["workers"] + need["workers"] > total["workers"]:
+        return (f"Worker budget exceeded: {need['workers']} workers requested, "
+                f"{max(total['workers'] - used['workers'], 0)} of {total['workers']} free")
+    return None
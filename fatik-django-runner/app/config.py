@@ -0,0 +1,91 @@
+import os
+
+# Umbrel монтирует: ${APP_DATA_DIR}/data:/data
+DATA_BASE_DIR = os.environ.get("DATA_BASE_DIR", "/data")
+PROJECTS_DIR = os.path.join(DATA_BASE_DIR, "projects")
+VENVS_DIR = os.path.join(DATA_BASE_DIR, "venvs")
+LOGS_DIR = os.path.join(DATA_BASE_DIR, "logs")
+JOBS_DIR = os.path.join(DATA_BASE_DIR, "jobs")
+# собранные колёса, общие для всех venv проектов
+WHEELHOUSE_DIR = os.path.join(DATA_BASE_DIR, "wheelhouse")
+PIP_CACHE_DIR = os.environ.get("PIP_CACHE_DIR", os.path.join(DATA_BASE_DIR, "pip-cache"))
+
+# Старый формат состояния (один JSON на все проекты) — читается только для миграции
+STATE_FILE = os.path.join(DATA_BASE_DIR, "runner.json")
+DB_FILE = os.path.join(DATA_BASE_DIR, "runner.db")
+
+# Публичный порт: на нём слушает встроенный прокси, проекты — на внутренних портах
+DJANGO_PORT = 9000
+PROJECT_PORT_MIN = int(os.environ.get("PROJECT_PORT_MIN", "9100"))
+PROJECT_PORT_MAX = int(os.environ.get("PROJECT_PORT_MAX", "9199"))
+# проект доступен как :9000/p/<route>/ (или по Host: <route>.<домен>)
+ROUTE_PREFIX = "/p/"
+
+# Blue/green перезапуск: сколько ждать, пока новая версия ответит, и сколько
+# после переключения прокси ещё держать старую (запросы, уже взявшие её порт)
+HEALTH_CHECK_TIMEOUT = int(os.environ.get("HEALTH_CHECK_TIMEOUT", "60"))
+SWITCH_GRACE_SECONDS = 2.0
+
+# Супервизор процессов проектов: файл-пульс (живость и pid), потоки для команд
+# и потолок паузы между перезапусками упавшего проекта
+SUPERVISOR_FILE = os.path.join(DATA_BASE_DIR, "supervisor.json")
+SUPERVISOR_WORKERS = int(os.environ.get("SUPERVISOR_WORKERS", "4"))
+RESTART_BACKOFF_MAX = 60
+
+# Замеры ресурсов процессов проектов: раз в METRICS_INTERVAL секунд,
+# последние METRICS_CAPACITY штук на проект (по умолчанию — час)
+METRICS_DIR = os.path.join(DATA_BASE_DIR, "metrics")
+METRICS_INTERVAL = float(os.environ.get("METRICS_INTERVAL", "5"))
+METRICS_CAPACITY = int(os.environ.get("METRICS_CAPACITY", "720"))
+
+# Логи проектов: вывод gunicorn идёт через отдельный процесс-писатель (logwriter.py),
+# который копит его блоками и ротирует файл по размеру или раз в LOG_ROTATE_SECONDS;
+# прошлые сегменты сжимаются в gzip, хранятся последние LOG_KEEP_ARCHIVES
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_MB", "10")) * 1024 * 1024
+LOG_ROTATE_SECONDS = int(os.environ.get("LOG_ROTATE_SECONDS", "86400"))
+LOG_KEEP_ARCHIVES = int(os.environ.get("LOG_KEEP_ARCHIVES", "5"))
+LOG_BUFFER_BYTES = 64 * 1024
+LOG_FLUSH_SECONDS = 1.0
+
+# Бюджет на все запущенные проекты: память (МБ) и число воркеров gunicorn.
+# 0 — посчитать от ресурсов машины при старте.
+PROJECTS_MEMORY_MB = int(os.environ.get("PROJECTS_MEMORY_MB", "0"))
+PROJECTS_MAX_WORKERS = int(os.environ.get("PROJECTS_MAX_WORKERS", "0"))
+DEFAULT_PROJECT_MEMORY_MB = 256
+
+# Фоновые задачи (установка зависимостей и т.п.) — на каждый воркер панели
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", "8"))
+
+# Нагрузочные тесты проектов из панели: пределы параметров и сколько последних
+# результатов хранить на проект (рядом с замерами, в METRICS_DIR)
+LOADTEST_MAX_CONCURRENCY = int(os.environ.get("LOADTEST_MAX_CONCURRENCY", "256"))
+LOADTEST_MAX_SECONDS = int(os.environ.get("LOADTEST_MAX_SECONDS", "300"))
+LOADTEST_KEEP = 20
+
+# Манифесты файлов проектов (путь -> размер, CRC, sha256) для обновления без полной загрузки
+MANIFESTS_DIR = os.path.join(DATA_BASE_DIR, "manifests")
+
+# Ограничения загрузки ZIP: размер архива, распакованный объём, число файлов и
+# максимальная степень сжатия одного файла (защита от zip-бомб)
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_MB", "2048")) * 1024 * 1024
+MAX_UNZIPPED_BYTES = int(os.environ.get("MAX_UNZIPPED_MB", "8192")) * 1024 * 1024
+MAX_ZIP_ENTRIES = int(os.environ.get("MAX_ZIP_ENTRIES", "100000"))
+MAX_COMPRESSION_RATIO = int(os.environ.get("MAX_COMPRESSION_RATIO", "500"))
+
+# 1 — ставить зависимости только из wheelhouse, без обращения к PyPI
+OFFLINE_INSTALL = os.environ.get("RUNNER_OFFLINE_INSTALL", "0") == "1"
+# Установщик зависимостей: pip, uv или auto (uv, если он есть в образе).
+# pip-бэкенд качает недостающие пакеты сам, по INSTALL_DOWNLOAD_WORKERS параллельно
+INSTALLER = os.environ.get("RUNNER_INSTALLER", "auto")
+INSTALL_DOWNLOAD_WORKERS = int(os.environ.get("INSTALL_DOWNLOAD_WORKERS", "8"))
+INSTALL_DOWNLOAD_TIMEOUT = 60
+UV_CACHE_DIR = os.environ.get("UV_CACHE_DIR", os.path.join(DATA_BASE_DIR, "uv-cache"))
+
+os.makedirs(PROJECTS_DIR, exist_ok=True)
+os.makedirs(VENVS_DIR, exist_ok=True)
+os.makedirs(LOGS_DIR, exist_ok=True)
+os.makedirs(JOBS_DIR, exist_ok=True)
+os.makedirs(WHEELHOUSE_DIR, exist_ok=True)
+os.makedirs(METRICS_DIR, exist_ok=True)
+os.makedirs(MANIFESTS_DIR, exist_ok=True)
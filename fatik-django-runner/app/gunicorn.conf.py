@@ -0,0 +1,67 @@
+# Конфиг gunicorn панели: gunicorn -c gunicorn.conf.py main:app
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+bind = "0.0.0.0:8000"
+workers = 2
+# таймаут побольше — загрузка крупного ZIP идёт внутри запроса
+timeout = 600
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+CHILD_SCRIPTS = ("proxy.py", "supervisor.py")
+# упавший прокси или супервизор поднимается снова; падает сразу после старта — паузы растут
+CHILD_RESTART_MIN = 1.0
+CHILD_RESTART_MAX = 30.0
+CHILD_STABLE_SECONDS = 10.0
+_children = {}
+_stopping = threading.Event()
+_children_lock = threading.Lock()
+
+
+def _spawn(script):
+    return subprocess.Popen([sys.executable, os.path.join(APP_DIR, script)], cwd=APP_DIR)
+
+
+def _watch_children(server):
+    # поток в мастере gunicorn; дочерние процессы он может пожать сам (reap_workers),
+    # тогда poll() всё равно увидит, что процесса нет
+    started = {script: time.monotonic() for script in _children}
+    delay = {script: CHILD_RESTART_MIN for script in _children}
+    while not _stopping.wait(CHILD_RESTART_MIN):
+        for script, child in list(_children.items()):
+            if child.poll() is None:
+                continue
+            if time.monotonic() - started[script] >= CHILD_STABLE_SECONDS:
+                delay[script] = CHILD_RESTART_MIN
+            server.log.error("%s exited with code %s, restarting in %.0f s", script, child.returncode, delay[script])
+            if _stopping.wait(delay[script]):
+                return
+            delay[script] = min(delay[script] * 2, CHILD_RESTART_MAX)
+            with _children_lock:
+                if _stopping.is_set():
+                    return
+                _children[script] = _spawn(script)
+            started[script] = time.monotonic()
+
+
+def on_starting(server):
+    # прокси на DJANGO_PORT и супервизор процессов проектов живут отдельно от воркеров
+    # панели: проекты работают и следятся, даже пока воркеры панели перезапускаются
+    for script in CHILD_SCRIPTS:
+        _children[script] = _spawn(script)
+    threading.Thread(target=_watch_children, args=(server,), name="child-watcher", daemon=True).start()
+
+
+def on_exit(server):
+    with _children_lock:
+        _stopping.set()
+    for child in _children.values():
+        try:
+            child.send_signal(signal.SIGTERM)
+            child.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            child.kill()
@@ -0,0 +1,174 @@
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Optional, Dict, Any, List
+
+from config import METRICS_DIR
+
+# access-лог gunicorn в нужном нам виде: код ответа и длительность в микросекундах
+ACCESS_LOG_FORMAT = "%(s)s %(D)s"
+# границы корзин гистограммы длительности, секунды (как у клиентов Prometheus)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# окно для RPS: счётчики по секундам в кольце фиксированной длины
+RATE_WINDOW = 60
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def stats_path(project_id: str) -> str:
+    return os.path.join(METRICS_DIR, f"{project_id}.http.json")
+
+
+def quantile(counts: List[int], q: float) -> Optional[float]:
+    # оценка по корзинам: линейная интерполяция внутри корзины, куда попал квантиль
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, n in enumerate(counts):
+        if n and seen + n >= rank:
+            low = BUCKETS[i - 1] if i > 0 else 0.0
+            high = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+            return low + (high - low) * (rank - seen) / n
+        seen += n
+    return BUCKETS[-1]
+
+
+# Память не зависит от числа запросов: фиксированные корзины, счётчики кодов ответа
+# и кольцо посекундных счётчиков для RPS.
+class RequestStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(BUCKETS) + 1)  # последняя — больше самой большой границы
+        self.total = 0
+        self.duration_sum = 0.0
+        self.codes: Dict[str, int] = {}
+        self.seconds = [0] * RATE_WINDOW
+        self.second_stamps = [0] * RATE_WINDOW
+
+    def observe(self, status: str, seconds: float, now: Optional[float] = None) -> None:
+        second = int(now if now is not None else time.time())
+        with self.lock:
+            self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+            self.total += 1
+            self.duration_sum += seconds
+            self.codes[status] = self.codes.get(status, 0) + 1
+            slot = second % RATE_WINDOW
+            if self.second_stamps[slot] != second:
+                self.second_stamps[slot] = second
+                self.seconds[slot] = 0
+            self.seconds[slot] += 1
+
+    def snapshot(self, now: Optional[float] = None) -> Dict[str, Any]:
+        now = now if now is not None else time.time()
+        with self.lock:
+            counts = list(self.counts)
+            # текущая секунда ещё не закончилась — RPS по предыдущим RATE_WINDOW - 1
+            current = int(now)
+            recent = sum(n for n, stamp in zip(self.seconds, self.second_stamps)
+                         if current - RATE_WINDOW < stamp < current)
+            snap = {
+                "at": now,
+                "total": self.total,
+                "duration_sum": self.duration_sum,
+                "codes": dict(self.codes),
+                "buckets": counts,
+                "rps": recent / (RATE_WINDOW - 1),
+            }
+        snap["quantiles"] = {str(q): quantile(counts, q) for q in QUANTILES}
+        return snap
+
+    def feed(self, line: str) -> None:
+        parts = line.split()
+        if len(parts) < 2 or not parts[1].isdigit():
+            return
+        self.observe(parts[0], int(parts[1]) / 1_000_000)
+
+
+def read_access_log(fd: int, stats: RequestStats) -> None:
+    # поток на каждый запущенный gunicorn: читает его access-лог из pipe до закрытия
+    with open(fd, "r", encoding="latin-1", errors="replace") as pipe:
+        for line in pipe:
+            stats.feed(line)
+
+
+def write_snapshot(project_id: str, snapshot: Dict[str, Any]) -> None:
+    tmp = stats_path(project_id) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, stats_path(project_id))
+
+
+def read_snapshot(project_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(stats_path(project_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# ---------- Prometheus ----------
+
+def _labels(**labels: Any) -> str:
+    def esc(value: Any) -> str:
+        return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels.items()) + "}"
+
+
+def prometheus_text(projects: List[Dict[str, Any]], resources: Dict[str, Dict[str, Any]]) -> str:
+    # текстовый формат экспозиции Prometheus 0.0.4
+    lines = [
+        "# HELP django_runner_projects_running Projects with a live gunicorn master.",
+        "# TYPE django_runner_projects_running gauge",
+        f"django_runner_projects_running {sum(1 for p in projects if p.get('is_running'))}",
+    ]
+    families = {
+        "up": ("gauge", "1 if the project gunicorn is running."),
+        "process_cpu_percent": ("gauge", "CPU usage of the project process tree, percent of one core."),
+        "process_resident_memory_bytes": ("gauge", "Resident memory of the project process tree."),
+        "process_open_fds": ("gauge", "Open file descriptors in the project process tree."),
+        "http_requests_total": ("counter", "Requests served, by status code."),
+        "http_request_duration_seconds": ("histogram", "Request duration as measured by gunicorn."),
+        "http_request_duration_quantile_seconds": ("gauge", "Estimated request duration quantiles."),
+        "http_requests_per_second": ("gauge", f"Request rate over the last {RATE_WINDOW} seconds."),
+    }
+    samples: Dict[str, List[str]] = {name: [] for name in families}
+    for p in projects:
+        base = {"project_id": p["id"], "project": p.get("name") or p["id"]}
+        samples["up"].append(f"django_runner_up{_labels(**base)} {1 if p.get('is_running') else 0}")
+        res = resources.get(p["id"])
+        if res and p.get("is_running"):
+            samples["process_cpu_percent"].append(
+                f"django_runner_process_cpu_percent{_labels(**base)} {res['cpu_percent']:.3f}")
+            samples["process_resident_memory_bytes"].append(
+                f"django_runner_process_resident_memory_bytes{_labels(**base)} {res['rss_bytes']}")
+            samples["process_open_fds"].append(f"django_runner_process_open_fds{_labels(**base)} {res['fds']}")
+
+        snap = read_snapshot(p["id"])
+        if not snap:
+            continue
+        for code, n in sorted(snap["codes"].items()):
+            samples["http_requests_total"].append(
+                f"django_runner_http_requests_total{_labels(**base, code=code)} {n}")
+        cumulative = 0
+        name = "django_runner_http_request_duration_seconds"
+        for bound, n in zip(list(BUCKETS) + ["+Inf"], snap["buckets"]):
+            cumulative += n
+            samples["http_request_duration_seconds"].append(f"{name}_bucket{_labels(**base, le=bound)} {cumulative}")
+        samples["http_request_duration_seconds"].append(f"{name}_sum{_labels(**base)} {snap['duration_sum']:.6f}")
+        samples["http_request_duration_seconds"].append(f"{name}_count{_labels(**base)} {snap['total']}")
+        for q, value in snap["quantiles"].items():
+            if value is not None:
+                samples["http_request_duration_quantile_seconds"].append(
+                    f"django_runner_http_request_duration_quantile_seconds{_labels(**base, quantile=q)} {value:.6f}")
+        samples["http_requests_per_second"].append(
+            f"django_runner_http_requests_per_second{_labels(**base)} {snap['rps']:.3f}")
+
+    for family, (kind, help_text) in families.items():
+        if samples[family]:
+            lines.append(f"# HELP django_runner_{family} {help_text}")
+            lines.append(f"# TYPE django_runner_{family} {kind}")
+            lines.extend(samples[family])
+    return "\n".join(lines) + "\n"
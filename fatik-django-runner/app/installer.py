@@ -0,0 +1,484 @@
+import fcntl
+import hashlib
+import json
+import os
+import platform
+import re
+import shutil
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Iterator, List, Tuple
+from urllib.parse import urlparse, unquote
+
+from config import (
+    VENVS_DIR, JOBS_DIR, WHEELHOUSE_DIR, PIP_CACHE_DIR, OFFLINE_INSTALL,
+    INSTALLER, INSTALL_DOWNLOAD_WORKERS, INSTALL_DOWNLOAD_TIMEOUT, UV_CACHE_DIR,
+)
+from jobs import JobContext
+from store import ProjectStore
+
+# фазы установки в порядке выполнения; uv показывает только resolve и install
+INSTALL_PHASES = ("resolve", "download", "build", "install")
+# ставится в каждый venv вместе с requirements.txt, в одном разрешении зависимостей
+EXTRA_PACKAGES = ["gunicorn"]
+
+
+def wheelhouse_files() -> Dict[str, int]:
+    files = {}
+    with os.scandir(WHEELHOUSE_DIR) as it:
+        for entry in it:
+            if entry.name.endswith(".whl") and entry.is_file():
+                files[entry.name] = entry.stat().st_size
+    return files
+
+
+@contextmanager
+def wheelhouse_lock() -> Iterator[None]:
+    with open(os.path.join(WHEELHOUSE_DIR, ".lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def pip_env() -> Dict[str, str]:
+    env = os.environ.copy()
+    env["PIP_CACHE_DIR"] = PIP_CACHE_DIR
+    env["PIP_DISABLE_PIP_VERSION_CHECK"] = "1"
+    return env
+
+
+@contextmanager
+def timed(timings: Dict[str, float], phase: str) -> Iterator[None]:
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        timings[phase] = round(timings.get(phase, 0.0) + time.monotonic() - start, 3)
+
+
+def installer_backend(ctx: JobContext) -> str:
+    uv = shutil.which("uv")
+    if INSTALLER == "uv" and not uv:
+        ctx.write("RUNNER_INSTALLER=uv, but uv is not installed in the image; falling back to pip\n")
+    return "uv" if uv and INSTALLER in ("uv", "auto") else "pip"
+
+
+def install_requirements_into(ctx: JobContext, python_exe: str, req_path: str) -> Dict[str, Any]:
+    backend = installer_backend(ctx)
+    timings: Dict[str, float] = {}
+    started = time.monotonic()
+    if backend == "uv":
+        stats = install_with_uv(ctx, python_exe, req_path, timings)
+    else:
+        stats = install_with_pip(ctx, python_exe, req_path, timings)
+    timings["total"] = round(time.monotonic() - started, 3)
+    ctx.write(f"Install phases ({backend}): "
+              + ", ".join(f"{phase} {seconds:.1f} s" for phase, seconds in timings.items()) + "\n")
+    stats.update(backend=backend, timings=timings, offline=OFFLINE_INSTALL, at=time.time())
+    return stats
+
+
+# ---------- pip: одно разрешение, параллельная загрузка, установка из wheelhouse ----------
+
+def resolve_with_pip(ctx: JobContext, python_exe: str, req_path: str) -> List[Dict[str, Any]]:
+    # pip install --dry-run --report (pip >= 22.2): полный список пакетов venv вместе с
+    # gunicorn, ничего не ставя. Для колёс PyPI pip берёт только метаданные (PEP 658),
+    # сами файлы потом качаются параллельно.
+    report_path = os.path.join(JOBS_DIR, f"{ctx.id}.resolve.json")
+    cmd = [python_exe, "-m", "pip", "install", "--dry-run", "--ignore-installed", "--quiet",
+           "--find-links", WHEELHOUSE_DIR, "--report", report_path, "-r", req_path] + EXTRA_PACKAGES
+    if OFFLINE_INSTALL:
+        cmd.insert(4, "--no-index")
+    try:
+        # относительные пути в requirements ("-e .", "./pkg") — от каталога файла, как и в ключе venv
+        ctx.run(cmd, env=pip_env(), cwd=os.path.dirname(req_path))
+        with open(report_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("install", [])
+    finally:
+        if os.path.exists(report_path):
+            os.remove(report_path)
+
+
+def plan_item(item: Dict[str, Any], cached: Dict[str, int], local_paths: Optional[set] = None) -> Dict[str, Any]:
+    # откуда брать пакет: уже в wheelhouse, скачать (колесо или sdist), собрать (VCS) или
+    # поставить прямо с диска проекта (local).
+    # Тот же файл в индексе и в wheelhouse pip может выбрать из индекса — сверяем по имени сами
+    info = item.get("download_info") or {}
+    url = info.get("url", "")
+    parsed = urlparse(url)
+    path = unquote(parsed.path)
+    plan = {
+        "name": item["metadata"]["name"],
+        "version": item["metadata"]["version"],
+        "url": url,
+        "filename": os.path.basename(path),
+    }
+    if (parsed.scheme == "file" and os.path.dirname(path) == WHEELHOUSE_DIR) or plan["filename"] in cached:
+        plan["source"] = "wheelhouse"
+    elif parsed.scheme == "file" and os.path.realpath(path) in (local_paths or set()):
+        # пакет из дерева проекта ("-e .", "./pkg"): в общий wheelhouse не кладём — у двух
+        # проектов это разные пакеты с одинаковыми именем и версией, а editable должен
+        # остаться editable
+        plan["source"] = "local"
+        plan["url"] = path
+        plan["editable"] = bool((info.get("dir_info") or {}).get("editable"))
+    elif "archive_info" in info and parsed.scheme in ("http", "https"):
+        archive = info["archive_info"]
+        sha256 = (archive.get("hashes") or {}).get("sha256")
+        if not sha256 and (archive.get("hash") or "").startswith("sha256="):
+            sha256 = archive["hash"][len("sha256="):]
+        plan["source"] = "download"
+        plan["sha256"] = sha256
+    else:
+        # VCS или архив не с индекса — собирает pip wheel
+        plan["source"] = "build"
+        if "vcs_info" in info:
+            vcs = info["vcs_info"]
+            plan["url"] = f"{vcs['vcs']}+{url}@{vcs['commit_id']}"
+        if info.get("subdirectory"):
+            plan["url"] += f"#subdirectory={info['subdirectory']}"
+    return plan
+
+
+def download_file(url: str, target: str, sha256: Optional[str]) -> int:
+    # во временный файл рядом и rename: pip не увидит недокачанное колесо.
+    # Несовпадение sha256 — ошибка установки, а не повод скачать ещё раз
+    tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with urllib.request.urlopen(url, timeout=INSTALL_DOWNLOAD_TIMEOUT) as resp, open(tmp, "wb") as f:
+            while True:
+                chunk = resp.read(256 * 1024)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        if sha256 and digest.hexdigest() != sha256:
+            raise RuntimeError(f"sha256 mismatch for {os.path.basename(target)}")
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return size
+
+
+def download_all(ctx: JobContext, plans: List[Dict[str, Any]], sdist_dir: str) -> List[str]:
+    # колёса — сразу в wheelhouse, sdist — во временный каталог под сборку
+    targets = []
+    for plan in plans:
+        is_wheel = plan["filename"].endswith(".whl")
+        targets.append(os.path.join(WHEELHOUSE_DIR if is_wheel else sdist_dir, plan["filename"]))
+    fallback = []
+    with ThreadPoolExecutor(max_workers=INSTALL_DOWNLOAD_WORKERS) as pool:
+        futures = {pool.submit(download_file, plan["url"], target, plan["sha256"]): plan
+                   for plan, target in zip(plans, targets)}
+        for future in as_completed(futures):
+            plan = futures[future]
+            try:
+                size = future.result()
+            except OSError as e:
+                # индекс с авторизацией из pip.conf/keyring и т.п. — пусть скачает pip wheel
+                ctx.write(f"Download of {plan['filename']} failed ({e}), leaving it to pip\n")
+                fallback.append(plan["url"])
+                continue
+            ctx.write(f"Downloaded {plan['filename']} ({size / 1048576:.1f} MB)\n")
+    return [t for t in targets if not t.endswith(".whl") and os.path.exists(t)] + fallback
+
+
+def install_with_pip(ctx: JobContext, python_exe: str, req_path: str, timings: Dict[str, float]) -> Dict[str, Any]:
+    # 1) resolve: одно разрешение зависимостей на requirements.txt + gunicorn
+    # 2) download: недостающие файлы параллельно, с проверкой sha256
+    # 3) build: sdist и VCS-зависимости в колёса wheelhouse (один раз на все проекты)
+    # 4) install: ровно разрешённый набор из wheelhouse, без индекса и без второго разрешения;
+    #    пакеты из дерева проекта — прямо с диска, editable остаются editable
+    env = pip_env()
+    before = wheelhouse_files()
+
+    ctx.set_message("Resolving dependencies")
+    with timed(timings, "resolve"):
+        local_paths = local_requirement_paths(req_path)
+        plans = [plan_item(item, before, local_paths) for item in resolve_with_pip(ctx, python_exe, req_path)]
+    to_download = [p for p in plans if p["source"] == "download"]
+    to_build = [p["url"] for p in plans if p["source"] == "build"]
+    local = [p for p in plans if p["source"] == "local"]
+    in_wheelhouse = len(plans) - len(to_download) - len(to_build) - len(local)
+    ctx.write(f"Resolved {len(plans)} packages: {in_wheelhouse} in wheelhouse, {len(to_download)} to download, "
+              f"{len(to_build)} to build from source, {len(local)} from the project tree\n")
+
+    sdist_dir = os.path.join(JOBS_DIR, f"{ctx.id}.sdist")
+    pinned_path = os.path.join(JOBS_DIR, f"{ctx.id}.pinned.txt")
+    no_index = ["--no-index"] if OFFLINE_INSTALL else []
+    try:
+        # два задания, пишущих в один каталог одновременно, могут оставить битое колесо;
+        # установка из wheelhouse — под той же блокировкой, чтобы не прочитать недописанное
+        with wheelhouse_lock():
+            if to_download:
+                ctx.set_message(f"Downloading {len(to_download)} packages")
+                os.makedirs(sdist_dir, exist_ok=True)
+                with timed(timings, "download"):
+                    to_build += download_all(ctx, to_download, sdist_dir)
+            if to_build:
+                ctx.set_message(f"Building {len(to_build)} wheels")
+                cmd = [python_exe, "-m", "pip", "wheel", "--no-deps",
+                       "--wheel-dir", WHEELHOUSE_DIR, "--find-links", WHEELHOUSE_DIR] + no_index + to_build
+                with timed(timings, "build"):
+                    ctx.run(cmd, env=env)
+
+            ctx.set_message("Installing from wheelhouse")
+            with open(pinned_path, "w", encoding="utf-8") as f:
+                f.writelines(f"{p['name']}=={p['version']}\n" for p in plans if p["source"] != "local")
+            with timed(timings, "install"):
+                ctx.run(
+                    [python_exe, "-m", "pip", "install", "--no-index", "--no-deps",
+                     "--find-links", WHEELHOUSE_DIR, "-r", pinned_path],
+                    env=env,
+                )
+    finally:
+        shutil.rmtree(sdist_dir, ignore_errors=True)
+        if os.path.exists(pinned_path):
+            os.remove(pinned_path)
+
+    if local:
+        # зависимости локальных пакетов уже стоят — они были в том же разрешении
+        ctx.set_message(f"Installing {len(local)} packages from the project tree")
+        targets = []
+        for p in local:
+            targets += ["-e", p["url"]] if p["editable"] else [p["url"]]
+        with timed(timings, "install"):
+            ctx.run([python_exe, "-m", "pip", "install", "--no-deps"] + no_index + targets, env=env)
+
+    hits = [p["filename"] for p in plans if p["source"] == "wheelhouse" and p["filename"] in before]
+    return {
+        "hits": len(hits),
+        "misses": len(plans) - len(hits) - len(local),
+        "bytes_saved": sum(before[name] for name in hits),
+    }
+
+
+# ---------- uv: разрешение и установка одним быстрым инструментом ----------
+
+def install_with_uv(ctx: JobContext, python_exe: str, req_path: str, timings: Dict[str, float]) -> Dict[str, Any]:
+    # uv качает и собирает параллельно внутри install, поэтому фазы download и build
+    # отдельно не видны — их время входит в install
+    uv = shutil.which("uv")
+    env = pip_env()
+    env["UV_CACHE_DIR"] = UV_CACHE_DIR
+    index = ["--offline", "--no-index"] if OFFLINE_INSTALL else []
+    extras_path = os.path.join(JOBS_DIR, f"{ctx.id}.extras.in")
+    pinned_path = os.path.join(JOBS_DIR, f"{ctx.id}.pinned.txt")
+    with open(extras_path, "w", encoding="utf-8") as f:
+        f.writelines(name + "\n" for name in EXTRA_PACKAGES)
+    try:
+        ctx.set_message("Resolving dependencies")
+        with timed(timings, "resolve"):
+            ctx.run([uv, "pip", "compile", "--quiet", "--python", python_exe,
+                     "--find-links", WHEELHOUSE_DIR, "-o", pinned_path, req_path, extras_path] + index,
+                    env=env, cwd=os.path.dirname(req_path))
+        ctx.set_message("Installing dependencies")
+        with timed(timings, "install"):
+            ctx.run([uv, "pip", "install", "--python", python_exe, "--no-deps",
+                     "--find-links", WHEELHOUSE_DIR, "-r", pinned_path] + index,
+                    env=env, cwd=os.path.dirname(req_path))
+    finally:
+        for path in (extras_path, pinned_path):
+            if os.path.exists(path):
+                os.remove(path)
+    # wheelhouse uv не наполняет (у него свой кэш) — в статистику кэша колёс не идёт
+    return {}
+
+
+def record_wheel_stats(store: ProjectStore, stats: Dict[str, Any]) -> None:
+    with store.transaction():
+        totals = json.loads(store.get_meta("wheelhouse_stats") or "{}")
+        totals["installs"] = totals.get("installs", 0) + 1
+        for key in ("hits", "misses", "bytes_saved"):
+            totals[key] = totals.get(key, 0) + stats[key]
+        store.set_meta("wheelhouse_stats", json.dumps(totals))
+
+
+def wheelhouse_report(store: ProjectStore) -> Dict[str, Any]:
+    totals = json.loads(store.get_meta("wheelhouse_stats") or "{}")
+    files = wheelhouse_files()
+    hits, misses = totals.get("hits", 0), totals.get("misses", 0)
+    return {
+        "path": WHEELHOUSE_DIR,
+        "wheels": len(files),
+        "size_bytes": sum(files.values()),
+        "installs": totals.get("installs", 0),
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+        "bytes_saved": totals.get("bytes_saved", 0),
+        "offline": OFFLINE_INSTALL,
+    }
+
+
+# ---------- venv по хэшу зависимостей ----------
+
+VENV_MARKER = ".runner-venv.json"
+VENV_LOCKS_DIR = os.path.join(VENVS_DIR, ".locks")
+
+
+def _normalize_requirement(line: str) -> str:
+    # "Django==4.2  # comment" -> "django==4.2"; имена по PEP 503
+    line = line.split(" #", 1)[0].strip()
+    m = re.match(r"^([A-Za-z0-9][A-Za-z0-9._-]*)(.*)$", line)
+    if not m:
+        return line
+    name = re.sub(r"[-_.]+", "-", m.group(1)).lower()
+    return name + re.sub(r"\s+", "", m.group(2))
+
+
+# файлы сборки пакета: у editable-установки код берётся из дерева, venv зависит только от них
+PACKAGE_METADATA = ("pyproject.toml", "setup.py", "setup.cfg")
+SKIP_DIRS = {"__pycache__", ".git", "node_modules"}
+# "-e /abs/path#sha256=..." или "/abs/path#sha256=..." — результат _resolve_local
+LOCAL_LINE = re.compile(r"^(?:-e )?(/[^#]*)#sha256=[0-9a-f]+$")
+
+
+def _local_target(line: str) -> Optional[Tuple[bool, str]]:
+    # -> (editable, путь) для пакетов из локальной ФС: "-e .", "./pkg", "file:...",
+    # "name @ file:..."; None — пакет с индекса или из VCS
+    m = re.match(r"^(-e|--editable)\s*=?\s*(\S+)", line)
+    editable = bool(m)
+    target = m.group(2) if m else line.split(";", 1)[0].strip()
+    if not editable and " @ " in target:
+        target = target.split(" @ ", 1)[1].strip()
+    if target.startswith("file:"):
+        return editable, unquote(urlparse(target).path)
+    if "://" in target or target.startswith("-"):
+        return None
+    if target.startswith((".", "/", "~")) or "/" in target or target.endswith((".whl", ".zip", ".tar.gz")):
+        return editable, target
+    return None
+
+
+def _local_fingerprint(path: str, editable: bool) -> str:
+    # содержимое локального пакета: при другом дереве нужен другой venv
+    digest = hashlib.sha256()
+    if os.path.isfile(path):
+        files = [path]
+    elif editable:
+        files = [os.path.join(path, name) for name in PACKAGE_METADATA]
+    else:
+        files = []
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS and not d.endswith(".egg-info"))
+            files.extend(os.path.join(dirpath, name) for name in sorted(filenames))
+    for file in files:
+        try:
+            with open(file, "rb") as f:
+                digest.update(os.path.relpath(file, path).encode("utf-8") + b"\0")
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        except OSError:
+            continue
+    return digest.hexdigest()[:16]
+
+
+def _resolve_local(line: str, base_dir: str) -> str:
+    # локальный путь в строке requirements не описывает содержимое: "-e ." у двух
+    # проектов — разные пакеты. Заменяем его абсолютным путём и хэшем содержимого,
+    # такой venv достаётся только проекту, в дереве которого лежит пакет.
+    local = _local_target(line)
+    if local is None:
+        return _normalize_requirement(line)
+    editable, target = local
+    path = os.path.realpath(os.path.join(base_dir, os.path.expanduser(target)))
+    return f"{'-e ' if editable else ''}{path}#sha256={_local_fingerprint(path, editable)}"
+
+
+def local_requirement_paths(req_path: str) -> set:
+    # абсолютные пути пакетов из дерева проекта — строки, которые _resolve_local переписал
+    return {m.group(1) for m in (LOCAL_LINE.match(line) for line in read_requirements(req_path)) if m}
+
+
+def read_requirements(req_path: str, seen: Optional[set] = None) -> List[str]:
+    # строки requirements.txt с раскрытыми -r/-c, без комментариев и пустых строк
+    seen = seen if seen is not None else set()
+    real = os.path.realpath(req_path)
+    if real in seen:
+        return []
+    seen.add(real)
+    result = []
+    with open(req_path, "r", encoding="utf-8", errors="replace") as f:
+        for raw in f:
+            line = raw.strip()
+            if not line or line.startswith("#"):
+                continue
+            m = re.match(r"^(-r|--requirement|-c|--constraint)\s*=?\s*(\S+)", line)
+            if m:
+                nested = os.path.join(os.path.dirname(req_path), m.group(2))
+                if os.path.exists(nested):
+                    prefix = "-c " if m.group(1) in ("-c", "--constraint") else ""
+                    result.extend(prefix + r for r in read_requirements(nested, seen))
+                continue
+            result.append(_resolve_local(line, os.path.dirname(req_path)))
+    return result
+
+
+def requirements_key(req_path: str) -> str:
+    # одинаковые (с точностью до порядка, регистра и комментариев) зависимости
+    # на том же интерпретаторе дают один и тот же ключ, а значит и один venv
+    lines = sorted(set(read_requirements(req_path) + EXTRA_PACKAGES))
+    interpreter = f"{sys.implementation.name}-{platform.python_version()}-{platform.machine()}"
+    digest = hashlib.sha256("\n".join([interpreter] + lines).encode("utf-8")).hexdigest()
+    return digest[:20]
+
+
+def venv_path_for_key(key: str) -> str:
+    return os.path.join(VENVS_DIR, f"req-{key}")
+
+
+def venv_ready(venv_path: str, key: str) -> bool:
+    try:
+        with open(os.path.join(venv_path, VENV_MARKER), "r", encoding="utf-8") as f:
+            return json.load(f).get("key") == key
+    except Exception:
+        return False
+
+
+def mark_venv_ready(venv_path: str, key: str, req_path: str) -> None:
+    marker = {
+        "key": key,
+        "python": platform.python_version(),
+        "requirements": read_requirements(req_path),
+        "created_at": time.time(),
+    }
+    tmp = os.path.join(venv_path, VENV_MARKER + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(marker, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(venv_path, VENV_MARKER))
+
+
+@contextmanager
+def venv_lock(venv_path: str) -> Iterator[None]:
+    # сериализует установку в venv и его удаление по refcount
+    os.makedirs(VENV_LOCKS_DIR, exist_ok=True)
+    lock_name = os.path.basename(os.path.normpath(venv_path)) + ".lock"
+    with open(os.path.join(VENV_LOCKS_DIR, lock_name), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def release_venv(store: ProjectStore, venv_path: Optional[str]) -> bool:
+    # удаляет venv, только если на него больше не ссылается ни один проект
+    if not venv_path:
+        return False
+    with venv_lock(venv_path):
+        if store.venv_refcount(venv_path) > 0:
+            return False
+        if os.path.exists(venv_path):
+            shutil.rmtree(venv_path, ignore_errors=True)
+    return True
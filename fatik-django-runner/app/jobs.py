@@ -0,0 +1,165 @@
+import os
+import queue
+import subprocess
+import threading
+import time
+import uuid
+from typing import Callable, Optional, Dict, Any, List
+
+from config import JOBS_DIR, JOB_WORKERS, JOB_QUEUE_SIZE
+from store import ProjectStore
+
+# как часто перепроверять задачи, владелец которых (воркер панели) умер
+ORPHAN_CHECK_INTERVAL = 10.0
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def proc_starttime(pid: Optional[int]) -> Optional[int]:
+    # время старта процесса (в тиках от загрузки системы): pid может достаться другому
+    # процессу, пара (pid, starttime) — нет
+    if not pid:
+        return None
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # имя процесса в скобках может содержать пробелы — считаем поля после последней ')'
+    fields = stat[stat.rindex(b")") + 2:].split()
+    if fields[0] == b"Z":
+        return None
+    return int(fields[19])
+
+
+def same_process(pid: Optional[int], starttime: Optional[int]) -> bool:
+    return starttime is not None and proc_starttime(pid) == starttime
+
+
+def new_job(project_id: str, kind: str, message: str, owner_pid: int,
+            owner_starttime: Optional[int]) -> Dict[str, Any]:
+    # owner_pid/owner_starttime — процесс, который выполнит задачу; умрёт он — задача
+    # станет failed. Одного pid мало: после перезапуска его может получить другой процесс
+    job_id = str(uuid.uuid4())
+    return {
+        "id": job_id,
+        "project_id": project_id,
+        "kind": kind,
+        "status": "queued",
+        "message": message,
+        "log_file": os.path.join(JOBS_DIR, f"{job_id}.log"),
+        "owner_pid": owner_pid,
+        "owner_starttime": owner_starttime,
+        "created_at": time.time(),
+    }
+
+
+def wait_job(store: ProjectStore, job_id: str, timeout: float, interval: float = 0.2) -> Optional[Dict[str, Any]]:
+    # ждёт, пока задача (в том числе чужого процесса) завершится; None — не дождались
+    deadline = time.time() + timeout
+    while True:
+        job = store.get_job(job_id)
+        if job is None or job["status"] not in ("queued", "running"):
+            return job
+        if time.time() >= deadline:
+            return None
+        time.sleep(interval)
+
+
+class JobContext:
+    def __init__(self, store: ProjectStore, job: Dict[str, Any], log):
+        self.store = store
+        self.job = job
+        self.id = job["id"]
+        self.project_id = job["project_id"]
+        self.log = log
+
+    def write(self, text: str) -> None:
+        self.log.write(text)
+        self.log.flush()
+
+    def set_message(self, message: str) -> None:
+        self.store.update_job(self.id, message=message)
+
+    def run(self, cmd: List[str], **kwargs: Any) -> None:
+        # вывод команды пишется в лог задачи, ошибка — CalledProcessError
+        self.write("$ " + " ".join(cmd) + "\n")
+        subprocess.check_call(cmd, stdout=self.log, stderr=subprocess.STDOUT, **kwargs)
+
+
+# Очередь фоновых задач: ограниченная очередь + пул потоков в каждом воркере панели.
+# Статус и вывод лежат в SQLite/файлах, поэтому видны из любого воркера.
+class JobQueue:
+    def __init__(self, store: ProjectStore, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_SIZE):
+        self.store = store
+        self.workers = workers
+        self.max_queued = max_queued
+        self._queue: Optional[queue.Queue] = None
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._orphans_checked_at = 0.0
+
+    def _ensure_workers(self) -> None:
+        # потоки запускаем лениво: gunicorn форкает воркеры после импорта приложения
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue(maxsize=self.max_queued)
+            for i in range(self.workers):
+                threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True).start()
+        self.fail_orphans(force=True)
+
+    def fail_orphans(self, force: bool = False) -> None:
+        now = time.time()
+        if not force and now - self._orphans_checked_at < ORPHAN_CHECK_INTERVAL:
+            return
+        self._orphans_checked_at = now
+        for job in self.store.active_jobs():
+            # у задач, созданных до появления owner_starttime, владельца уже нет
+            if not same_process(job.get("owner_pid"), job.get("owner_starttime")):
+                self.store.update_job(
+                    job["id"],
+                    status="failed",
+                    message="Interrupted: the panel worker running this job has exited",
+                    finished_at=now,
+                )
+
+    def submit(self, project_id: str, kind: str, func: Callable[[JobContext], Optional[str]],
+               message: str = "Queued") -> Dict[str, Any]:
+        self._ensure_workers()
+        self.fail_orphans()
+
+        job = new_job(project_id, kind, message, os.getpid(), proc_starttime(os.getpid()))
+        job_id = job["id"]
+        created = self.store.create_job(job, unique=True)
+        if created["id"] != job_id:
+            # такая задача уже стоит в очереди или выполняется
+            return created
+
+        try:
+            self._queue.put_nowait((job, func))
+        except queue.Full:
+            self.store.update_job(job_id, status="failed", message="Job queue is full", finished_at=time.time())
+            raise JobQueueFull("Job queue is full, try again later")
+        return job
+
+    def _worker(self) -> None:
+        while True:
+            job, func = self._queue.get()
+            execute_job(self.store, job, func)
+            self._queue.task_done()
+
+
+def execute_job(store: ProjectStore, job: Dict[str, Any], func: Callable[[JobContext], Optional[str]]) -> None:
+    # общий цикл жизни задачи: running -> done/failed, вывод — в лог задачи
+    store.update_job(job["id"], status="running", message="Running", started_at=time.time())
+    try:
+        with open(job["log_file"], "a", encoding="utf-8") as log:
+            message = func(JobContext(store, job, log))
+        status, message = "done", message or "Done"
+    except Exception as e:
+        status, message = "failed", str(e)
+    store.update_job(job["id"], status=status, message=message, finished_at=time.time())
@@ -0,0 +1,198 @@
+import http.client
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, Any, List, Optional
+
+from config import LOGS_DIR, HEALTH_CHECK_TIMEOUT
+from store import ProjectStore
+from scanner import scan_project, module_from_path
+from runtime import runtime_profile, gunicorn_args, check_profile
+from proxy import project_prefix
+from staticfiles import static_fingerprint
+from jobs import JobContext
+from httpstats import ACCESS_LOG_FORMAT
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+LOGWRITER = os.path.join(APP_DIR, "logwriter.py")
+
+
+# Host для запросов панели прямо в порт gunicorn проекта (проверка здоровья, нагрузочный
+# тест): один на всех, чтобы ALLOWED_HOSTS проекта судил их одинаково
+PROJECT_HOST = "localhost"
+# итоговая строка collectstatic: "... copied to '<STATIC_ROOT>', ..."
+COLLECTSTATIC_DESTINATION = re.compile(r" to '([^']+)'")
+
+
+class LaunchError(Exception):
+    pass
+
+
+def get_python_from_venv(venv_path: str) -> str:
+    if venv_path:
+        cand = os.path.join(venv_path, "bin", "python")
+        if os.path.exists(cand):
+            return cand
+        cand_win = os.path.join(venv_path, "Scripts", "python.exe")
+        if os.path.exists(cand_win):
+            return cand_win
+    return "python"
+
+
+def read_env_file(path: str) -> Dict[str, str]:
+    env = {}
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            k, v = line.split("=", 1)
+            env[k] = v
+    return env
+
+
+def prepare_launch(store: ProjectStore, project: Dict[str, Any]) -> Dict[str, Any]:
+    # всё, что нужно для запуска gunicorn проекта; LaunchError — текст для last_error
+    manage_py = project.get("manage_py")
+    settings_module = project.get("settings_module")
+    if not manage_py or not settings_module:
+        raise LaunchError("manage.py or settings not found")
+    project_base = os.path.dirname(manage_py)
+
+    # путь к wsgi.py — из индекса, собранного при загрузке
+    if "wsgi_path" not in project or "static_dirs" not in project:
+        # проект загружен до появления индекса: сканируем один раз и запоминаем
+        found = scan_project(project.get("root_dir"))
+        project = store.update_project(project["id"], wsgi_path=found["wsgi_path"],
+                                       asgi_path=found["asgi_path"],
+                                       static_dirs=found["static_dirs"]) or project
+    error = check_profile(project)
+    if error:
+        raise LaunchError(error)
+
+    # uvicorn-воркеры обслуживают ASGI-приложение, остальные — WSGI
+    if runtime_profile(project)["worker_class"] == "uvicorn":
+        app_path = project.get("asgi_path")
+    else:
+        app_path = project.get("wsgi_path")
+    if not app_path:
+        raise LaunchError("Not found wsgi.py")
+
+    env = os.environ.copy()
+    env["DJANGO_SETTINGS_MODULE"] = settings_module
+    # проект живёт за прокси под /p/<route>/ — gunicorn срезает префикс, Django строит ссылки с ним
+    env["SCRIPT_NAME"] = project_prefix(project)
+    env_error = None
+    if project.get("env_file"):
+        try:
+            env.update(read_env_file(project["env_file"]))
+        except Exception as e:
+            env_error = f"Reading error .env: {e}"
+
+    return {
+        "project": project,
+        "project_base": project_base,
+        "manage_py": manage_py,
+        "python_exe": get_python_from_venv(project.get("venv_path")),
+        "app_module": module_from_path(app_path, project_base),
+        "env": env,
+        "env_error": env_error,
+    }
+
+
+def gunicorn_command(launch: Dict[str, Any], port: int, access_log_fd: Optional[int] = None) -> List[str]:
+    command = [
+        launch["python_exe"],
+        "-m", "gunicorn",
+        "--chdir", launch["project_base"],
+        f"{launch['app_module']}:application",
+        "-b", f"127.0.0.1:{port}",
+        *gunicorn_args(launch["project"]),
+        "--log-file", "-",
+        "--capture-output",
+    ]
+    if access_log_fd is not None:
+        # access-лог — в отдельный pipe супервизора, в лог проекта он не попадает
+        command += ["--access-logfile", f"/dev/fd/{access_log_fd}", "--access-logformat", ACCESS_LOG_FORMAT]
+    return command
+
+
+def spawn_gunicorn(launch: Dict[str, Any], port: int, access_log_fd: Optional[int] = None) -> subprocess.Popen:
+    project = launch["project"]
+    log_path = project.get("log_file") or os.path.join(LOGS_DIR, f"{project['id']}.log")
+    project["log_file"] = log_path
+    # вывод gunicorn — в pipe писателя лога: он буферизует блоками и ротирует файл
+    read_fd, write_fd = os.pipe()
+    try:
+        subprocess.Popen([sys.executable, LOGWRITER, log_path], stdin=read_fd, cwd=APP_DIR,
+                         start_new_session=True)
+    finally:
+        os.close(read_fd)
+    try:
+        # cwd — проект: gunicorn читает ./gunicorn.conf.py, и это должен быть не конфиг панели;
+        # своя группа процессов — чтобы после падения мастера добить осиротевших воркеров
+        pass_fds = (access_log_fd,) if access_log_fd is not None else ()
+        return subprocess.Popen(gunicorn_command(launch, port, access_log_fd), env=launch["env"],
+                                cwd=launch["project_base"], stdout=write_fd, stderr=write_fd,
+                                start_new_session=True, pass_fds=pass_fds)
+    finally:
+        # без нашего конца писатель увидит EOF, как только gunicorn и его воркеры выйдут
+        os.close(write_fd)
+
+
+def wait_healthy(process: subprocess.Popen, port: int, prefix: str,
+                 timeout: float = HEALTH_CHECK_TIMEOUT) -> bool:
+    # новая версия готова, когда отвечает по HTTP без 5xx (400 от ALLOWED_HOSTS — тоже ответ)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        try:
+            conn.request("GET", prefix + "/", headers={"Host": PROJECT_HOST})
+            if conn.getresponse().status < 500:
+                return True
+        except (OSError, http.client.HTTPException):
+            pass
+        finally:
+            conn.close()
+        time.sleep(0.5)
+    return False
+
+
+def static_changed(launch: Dict[str, Any]) -> bool:
+    project = launch["project"]
+    return static_fingerprint(project, launch["project_base"]) != project.get("static_fingerprint")
+
+
+def run_collectstatic(store: ProjectStore, ctx: JobContext, launch: Dict[str, Any]) -> Optional[str]:
+    # -> None или текст ошибки. gunicorn к этому моменту уже работает, поэтому сбой
+    # collectstatic не валит задачу, а попадает в last_error проекта.
+    cmd = [launch["python_exe"], os.path.basename(launch["manage_py"]), "collectstatic", "--noinput"]
+    ctx.write("$ " + " ".join(cmd) + "\n")
+    try:
+        result = subprocess.run(cmd, cwd=launch["project_base"], env=launch["env"],
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except OSError as e:
+        error = f"collectstatic failed: {e}"
+    else:
+        output = result.stdout.decode("utf-8", "replace")
+        ctx.write(output)
+        error = f"collectstatic failed with exit code {result.returncode}" if result.returncode else None
+    if error:
+        ctx.write(error + "\n")
+        store.update_project(ctx.project_id, last_error=error)
+        return error
+
+    # "N static files copied to '/app/staticfiles'" — запоминаем STATIC_ROOT для отпечатка
+    m = COLLECTSTATIC_DESTINATION.search(output)
+    fields = {"static_root": m.group(1)} if m else {}
+    # отпечаток снимается после сборки: в него попадает и результат (STATIC_ROOT)
+    current = store.get_project(ctx.project_id)
+    if current:
+        current.update(fields)
+        fields["static_fingerprint"] = static_fingerprint(current, launch["project_base"])
+        store.update_project(ctx.project_id, **fields)
+    return None
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+import time
+from typing import Optional, Dict, Any, List, Callable, Tuple
+
+from config import METRICS_DIR, LOADTEST_KEEP
+from launcher import PROJECT_HOST
+
+# Нагрузочный тест проекта из панели: asyncio-клиент HTTP/1.1 с keep-alive,
+# concurrency соединений бьют прямо в порт gunicorn (мимо прокси) по списку путей.
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+PROGRESS_INTERVAL = 2.0
+MAX_HEAD_BYTES = 64 * 1024
+READ_CHUNK = 64 * 1024
+CONNECT_RETRY_DELAY = 0.05
+
+
+def results_path(project_id: str) -> str:
+    return os.path.join(METRICS_DIR, f"{project_id}.loadtests.json")
+
+
+def load_results(project_id: str) -> List[Dict[str, Any]]:
+    try:
+        with open(results_path(project_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def save_result(project_id: str, result: Dict[str, Any]) -> None:
+    # последние LOADTEST_KEEP прогонов, новые в конце
+    results = (load_results(project_id) + [result])[-LOADTEST_KEEP:]
+    tmp = results_path(project_id) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(results, f)
+    os.replace(tmp, results_path(project_id))
+
+
+def percentile(ordered: List[float], q: float) -> Optional[float]:
+    # по рангу (nearest-rank) из отсортированных задержек
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(q * len(ordered) + 0.5) - 1))]
+
+
+class LoadTest:
+    def __init__(self, port: int, paths: List[str], concurrency: int, duration: float,
+                 timeout: float, host: str = PROJECT_HOST):
+        self.port = port
+        self.paths = paths
+        self.concurrency = concurrency
+        self.duration = duration
+        self.timeout = timeout
+        self.host = host
+        self.latencies: List[float] = []
+        self.codes: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.bytes = 0
+        self.deadline = 0.0
+
+    def _error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    async def _request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                       path: str) -> Tuple[int, bool]:
+        # -> (код ответа, можно ли переиспользовать соединение)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\nUser-Agent: django-runner-loadtest\r\n"
+                     f"Accept: */*\r\n\r\n".encode("latin-1"))
+        await writer.drain()
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        status = int(lines[0].split(" ", 2)[1])
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip().lower()
+        received = len(head)
+        if "content-length" in headers:
+            received += len(await reader.readexactly(int(headers["content-length"])))
+        elif headers.get("transfer-encoding") == "chunked":
+            while True:
+                size_line = await reader.readuntil(b"\r\n")
+                size = int(size_line.split(b";", 1)[0], 16)
+                received += len(await reader.readexactly(size + 2))
+                if size == 0:
+                    break
+        elif status not in (204, 304):
+            # тело до закрытия соединения
+            while True:
+                chunk = await reader.read(READ_CHUNK)
+                if not chunk:
+                    break
+                received += len(chunk)
+            self.bytes += received
+            return status, False
+        self.bytes += received
+        return status, headers.get("connection") != "close"
+
+    async def _worker(self, index: int) -> None:
+        reader = writer = None
+        n = index
+        while time.monotonic() < self.deadline:
+            path = self.paths[n % len(self.paths)]
+            n += self.concurrency
+            started = time.monotonic()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.wait_for(
+                        asyncio.open_connection("127.0.0.1", self.port, limit=MAX_HEAD_BYTES), self.timeout)
+                status, keep = await asyncio.wait_for(self._request(reader, writer, path), self.timeout)
+            except asyncio.TimeoutError:
+                self._error("timeout")
+                keep = False
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, IndexError):
+                self._error("connection")
+                keep = False
+                # порт не принимает соединения — не крутимся вхолостую
+                await asyncio.sleep(CONNECT_RETRY_DELAY)
+            else:
+                self.latencies.append(time.monotonic() - started)
+                self.codes[str(status)] = self.codes.get(str(status), 0) + 1
+                if status >= 500:
+                    self._error(str(status))
+            if not keep and writer is not None:
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    async def _progress(self, report: Callable[[str], None]) -> None:
+        started = time.monotonic()
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            elapsed = time.monotonic() - started
+            report(f"Load test: {len(self.latencies)} requests, "
+                   f"{len(self.latencies) / elapsed:.0f} req/s, {int(self.deadline - time.monotonic())} s left")
+
+    async def run(self, report: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        started = time.monotonic()
+        self.deadline = started + self.duration
+        progress = asyncio.ensure_future(self._progress(report)) if report else None
+        try:
+            await asyncio.gather(*(self._worker(i) for i in range(self.concurrency)))
+        finally:
+            if progress:
+                progress.cancel()
+        return self.summary(time.monotonic() - started)
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+        # 5xx — ответ получен (есть задержка), timeout и connection — нет
+        server = sum(n for kind, n in self.errors.items() if kind.isdigit())
+        attempts = len(ordered) + sum(self.errors.values()) - server
+
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 3) if value is not None else None
+        return {
+            "elapsed": round(elapsed, 3),
+            "requests": len(ordered),
+            "ok": len(ordered) - server,
+            "rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+            "bytes": self.bytes,
+            "latency_ms": dict(
+                {f"p{int(q * 100)}": ms(percentile(ordered, q)) for q in QUANTILES},
+                mean=ms(sum(ordered) / len(ordered)) if ordered else None,
+                max=ms(ordered[-1]) if ordered else None,
+            ),
+            "codes": self.codes,
+            "errors": self.errors,
+            "error_rate": round(sum(self.errors.values()) / attempts, 4) if attempts else 0.0,
+        }
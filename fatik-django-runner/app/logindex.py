@@ -0,0 +1,386 @@
+import fcntl
+import mmap
+import os
+import re
+import struct
+import time
+import zlib
+import gzip
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any, List, Iterator, Tuple
+
+# Разреженный индекс сегмента лога: один блок ~ BLOCK_SIZE байт целыми строками.
+# На блок — смещение, номер первой строки, диапазон времени, встреченные уровни и
+# bloom-фильтр триграмм (в нижнем регистре). Поиск читает только блоки, которые
+# по индексу могут содержать совпадение. Сжатые сегменты пишутся gzip-членом на блок,
+# поэтому блок архива читается с его смещения, без распаковки всего файла.
+BLOCK_SIZE = 256 * 1024
+BLOOM_BYTES = 8192
+BLOOM_BITS = BLOOM_BYTES * 8
+BLOOM_HASHES = (0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D)
+
+HEADER = struct.Struct("<4sQQ")  # magic, inode текущего лога (0 — архив), проиндексировано байт
+MAGIC = b"LIX1"
+# смещение, размер на диске, размер текста, первая строка, строк, время первой и последней
+# строки, время и уровень, унаследованные от прошлого блока, уровень в конце, маска уровней
+RECORD = struct.Struct("<QIIQIdddBBB")
+ENTRY_SIZE = RECORD.size + BLOOM_BYTES
+FIELDS = ("offset", "stored", "raw", "first_line", "lines", "first_ts", "last_ts",
+          "in_ts", "in_level", "out_level", "levels")
+
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+LEVEL_CODES = {name.encode(): i + 1 for i, name in enumerate(LEVELS)}
+LEVEL_CODES[b"WARN"] = LEVEL_CODES[b"WARNING"]
+
+# метка времени в начале строки: [2024-05-01 12:00:00 +0000] (gunicorn), 2024-05-01T12:00:00.123Z и т.п.
+TS_RE = re.compile(rb"(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2}:\d{2})(?:[.,]\d+)?\s?(Z|[+-]\d{2}:?\d{2})?")
+LEVEL_RE = re.compile(rb"\b(DEBUG|INFO|WARNING|WARN|ERROR|CRITICAL)\b")
+TS_HEAD = 64
+LEVEL_HEAD = 120
+
+
+def index_path(segment: str) -> str:
+    return segment + ".idx"
+
+
+# ---------- Разбор строк ----------
+
+_ts_cache: Dict[bytes, float] = {}
+
+
+def parse_line_ts(match: "re.Match") -> float:
+    key = match.group(0)
+    cached = _ts_cache.get(key)
+    if cached is not None:
+        return cached
+    moment = datetime.strptime((match.group(1) + b" " + match.group(2)).decode(), "%Y-%m-%d %H:%M:%S")
+    zone = match.group(3)
+    if zone:
+        if zone == b"Z":
+            moment = moment.replace(tzinfo=timezone.utc)
+        else:
+            digits = zone.replace(b":", b"")
+            offset = timedelta(hours=int(digits[1:3]), minutes=int(digits[3:5]))
+            moment = moment.replace(tzinfo=timezone(-offset if digits[:1] == b"-" else offset))
+    # строки подряд обычно из одной секунды; кэш сбрасывается целиком, чтобы не рос
+    if len(_ts_cache) > 4096:
+        _ts_cache.clear()
+    _ts_cache[key] = value = moment.timestamp()
+    return value
+
+
+def classify(line: bytes, ts: float, level: int) -> Tuple[float, int]:
+    # строка без метки (продолжение traceback) наследует время и уровень предыдущей
+    match = TS_RE.search(line, 0, TS_HEAD)
+    if match:
+        ts = parse_line_ts(match)
+        found = LEVEL_RE.search(line, 0, LEVEL_HEAD)
+        level = LEVEL_CODES[found.group(1)] if found else 0
+    return ts, level
+
+
+def split_lines(block: bytes) -> List[bytes]:
+    lines = block.split(b"\n")
+    if block.endswith(b"\n"):
+        lines.pop()
+    return lines
+
+
+def trigram_bits(data: bytes) -> Iterator[int]:
+    for a, b, c in set(zip(data, data[1:], data[2:])):
+        value = a | b << 8 | c << 16
+        for mult in BLOOM_HASHES:
+            yield ((value * mult) >> 7) % BLOOM_BITS
+
+
+def analyze(block: bytes, in_ts: float, in_level: int) -> Dict[str, Any]:
+    ts, level = in_ts, in_level
+    first_ts = 0.0
+    levels = 0
+    lines = split_lines(block)
+    for line in lines:
+        ts, level = classify(line, ts, level)
+        if ts and not first_ts:
+            first_ts = ts
+        levels |= 1 << level
+    bloom = bytearray(BLOOM_BYTES)
+    for bit in trigram_bits(block.lower()):
+        bloom[bit >> 3] |= 1 << (bit & 7)
+    return {
+        "lines": len(lines), "first_ts": first_ts, "last_ts": ts, "in_ts": in_ts, "in_level": in_level,
+        "out_level": level, "levels": levels, "bloom": bytes(bloom),
+    }
+
+
+def iter_blocks(f, start: int = 0, complete_only: bool = False) -> Iterator[Tuple[int, bytes]]:
+    # блоки целыми строками; complete_only — недобранный хвост растущего лога не трогаем
+    pos = start
+    buf = b""
+    while True:
+        chunk = f.read(BLOCK_SIZE - len(buf))
+        buf += chunk
+        if len(buf) < BLOCK_SIZE:
+            if buf and not complete_only:
+                yield pos, buf
+            return
+        cut = buf.rfind(b"\n") + 1 or len(buf)
+        yield pos, buf[:cut]
+        pos += cut
+        buf = buf[cut:]
+
+
+def pack_entry(offset: int, stored: int, raw: int, first_line: int, info: Dict[str, Any]) -> bytes:
+    return RECORD.pack(offset, stored, raw, first_line, info["lines"], info["first_ts"], info["last_ts"],
+                       info["in_ts"], info["in_level"], info["out_level"], info["levels"]) + info["bloom"]
+
+
+# ---------- Построение ----------
+
+def update_index(log_path: str) -> Tuple[str, int]:
+    # Дописывает в индекс текущего лога блоки, накопившиеся с прошлого раза.
+    # Возвращает путь к индексу и сколько байт лога им покрыто; остальное — хвост,
+    # который поиск читает целиком (меньше BLOCK_SIZE).
+    path = index_path(log_path)
+    st = os.stat(log_path)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        # два воркера панели могут искать одновременно — индекс дописывает один
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        header = os.pread(fd, HEADER.size, 0)
+        valid = False
+        if len(header) == HEADER.size:
+            magic, inode, indexed = HEADER.unpack(header)
+            valid = magic == MAGIC and inode == st.st_ino and indexed <= st.st_size
+        if not valid:
+            # лог ротирован или обрезан — индекс строится заново
+            os.ftruncate(fd, 0)
+            indexed = 0
+            os.pwrite(fd, HEADER.pack(MAGIC, st.st_ino, 0), 0)
+        size = os.fstat(fd).st_size
+        count = (size - HEADER.size) // ENTRY_SIZE
+        os.ftruncate(fd, HEADER.size + count * ENTRY_SIZE)
+        if st.st_size - indexed < BLOCK_SIZE:
+            return path, indexed
+        first_line, in_ts, in_level = 0, 0.0, 0
+        if count:
+            last = dict(zip(FIELDS, RECORD.unpack(os.pread(fd, RECORD.size, HEADER.size + (count - 1) * ENTRY_SIZE))))
+            first_line, in_ts, in_level = last["first_line"] + last["lines"], last["last_ts"], last["out_level"]
+        entries = []
+        with open(log_path, "rb") as f:
+            f.seek(indexed)
+            for offset, block in iter_blocks(f, indexed, complete_only=True):
+                info = analyze(block, in_ts, in_level)
+                entries.append(pack_entry(offset, len(block), len(block), first_line, info))
+                first_line += info["lines"]
+                in_ts, in_level = info["last_ts"], info["out_level"]
+                indexed = offset + len(block)
+        os.pwrite(fd, b"".join(entries), HEADER.size + count * ENTRY_SIZE)
+        os.pwrite(fd, HEADER.pack(MAGIC, st.st_ino, indexed), 0)
+        return path, indexed
+    finally:
+        os.close(fd)
+
+
+def compress_indexed(source: str, target: str) -> None:
+    # сегмент -> gzip из членов по блоку (zcat читает его как обычный) + индекс рядом
+    entries = []
+    first_line, in_ts, in_level = 0, 0.0, 0
+    written = 0
+    raw_total = 0
+    with open(source, "rb") as src, open(target + ".tmp", "wb") as dst:
+        for _, block in iter_blocks(src):
+            info = analyze(block, in_ts, in_level)
+            member = gzip.compress(block, compresslevel=6)
+            dst.write(member)
+            entries.append(pack_entry(written, len(member), len(block), first_line, info))
+            written += len(member)
+            raw_total += len(block)
+            first_line += info["lines"]
+            in_ts, in_level = info["last_ts"], info["out_level"]
+    with open(index_path(target) + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, 0, raw_total))
+        f.write(b"".join(entries))
+    os.replace(index_path(target) + ".tmp", index_path(target))
+    os.replace(target + ".tmp", target)
+
+
+# ---------- Поиск ----------
+
+class Query:
+    def __init__(self, text: str = "", regex: bool = False, since: Optional[float] = None,
+                 until: Optional[float] = None, levels: Optional[List[str]] = None):
+        self.needle = b""
+        self.pattern = None
+        if regex and text:
+            # re.error — наверх, панель покажет его как 400
+            # шаблон проверяется только построчно: на блоке целиком \A, \Z, (?!\s) и
+            # встроенные флаги значат другое, и отсев по блоку терял бы совпадения
+            self.pattern = re.compile(text.encode(), re.MULTILINE)
+        elif text:
+            self.needle = text.encode().lower()
+        self.since = since
+        self.until = until
+        self.levels = 0
+        for name in levels or []:
+            code = LEVEL_CODES.get(name.strip().upper().encode())
+            if code:
+                self.levels |= 1 << code
+        self.trigram_bits = list(trigram_bits(self.needle)) if len(self.needle) >= 3 else []
+
+    def block_candidate(self, rec: Dict[str, Any], mm: mmap.mmap, bloom_at: int) -> bool:
+        if self.levels and not rec["levels"] & self.levels:
+            return False
+        # у блока без меток времени диапазон неизвестен — его не отбрасываем
+        if self.since is not None and rec["last_ts"] and rec["last_ts"] < self.since:
+            return False
+        if self.until is not None and rec["first_ts"] and rec["first_ts"] > self.until:
+            return False
+        for bit in self.trigram_bits:
+            if not mm[bloom_at + (bit >> 3)] & (1 << (bit & 7)):
+                return False
+        return True
+
+    def block_matches(self, block: bytes, first_line: int, in_ts: float, in_level: int) -> List[Dict[str, Any]]:
+        # быстрый отсев всего блока до разбора по строкам
+        if self.needle and self.needle not in block.lower():
+            return []
+        found = []
+        ts, level = in_ts, in_level
+        for i, line in enumerate(split_lines(block)):
+            ts, level = classify(line, ts, level)
+            if self.levels and not self.levels & (1 << level):
+                continue
+            if self.since is not None and (not ts or ts < self.since):
+                continue
+            if self.until is not None and (not ts or ts > self.until):
+                continue
+            if self.needle and self.needle not in line.lower():
+                continue
+            if self.pattern is not None and not self.pattern.search(line):
+                continue
+            found.append({
+                "line": first_line + i + 1,
+                "ts": ts or None,
+                "level": LEVELS[level - 1] if level else None,
+                "text": line.decode("utf-8", errors="replace"),
+            })
+        return found
+
+
+def read_entries(path: str) -> Optional[Tuple[mmap.mmap, int]]:
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                return None
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if mm[:4] != MAGIC:
+        mm.close()
+        return None
+    return mm, (size - HEADER.size) // ENTRY_SIZE
+
+
+def read_block(f, rec: Dict[str, Any], compressed: bool) -> bytes:
+    f.seek(rec["offset"])
+    data = f.read(rec["stored"])
+    return zlib.decompress(data, wbits=31) if compressed else data
+
+
+def search_segment(segment: str, query: Query, limit: int, stats: Dict[str, int]) -> List[Dict[str, Any]]:
+    # последние limit совпадений сегмента по порядку строк; блоки — от новых к старым
+    compressed = segment.endswith(".gz")
+    if compressed:
+        indexed = read_entries(index_path(segment))
+        tail_from = None
+    else:
+        idx, tail_from = update_index(segment)
+        indexed = read_entries(idx)
+    if indexed is None:
+        return scan_unindexed(segment, query, limit, stats)
+    mm, count = indexed
+    results: List[Dict[str, Any]] = []
+    try:
+        with open(segment, "rb") as f:
+            if tail_from is not None:
+                # хвост текущего лога за последним блоком индекса
+                first_line, in_ts, in_level = 0, 0.0, 0
+                if count:
+                    last = dict(zip(FIELDS, RECORD.unpack_from(mm, HEADER.size + (count - 1) * ENTRY_SIZE)))
+                    first_line, in_ts, in_level = last["first_line"] + last["lines"], last["last_ts"], last["out_level"]
+                f.seek(tail_from)
+                tail = f.read()
+                stats["blocks_total"] += 1
+                if tail:
+                    stats["blocks_scanned"] += 1
+                    results = query.block_matches(tail, first_line, in_ts, in_level)[-limit:]
+            for i in range(count - 1, -1, -1):
+                if len(results) >= limit:
+                    break
+                at = HEADER.size + i * ENTRY_SIZE
+                rec = dict(zip(FIELDS, RECORD.unpack_from(mm, at)))
+                stats["blocks_total"] += 1
+                if not query.block_candidate(rec, mm, at + RECORD.size):
+                    continue
+                stats["blocks_scanned"] += 1
+                block = read_block(f, rec, compressed)
+                found = query.block_matches(block, rec["first_line"], rec["in_ts"], rec["in_level"])
+                results = found[-(limit - len(results)):] + results
+    finally:
+        mm.close()
+    return results
+
+
+def scan_unindexed(segment: str, query: Query, limit: int, stats: Dict[str, int]) -> List[Dict[str, Any]]:
+    # архивы, сжатые до появления индекса: читаем подряд, держим только последние limit
+    results: List[Dict[str, Any]] = []
+    first_line, ts, level = 0, 0.0, 0
+    opener = gzip.open if segment.endswith(".gz") else open
+    with opener(segment, "rb") as f:
+        for _, block in iter_blocks(f):
+            stats["blocks_total"] += 1
+            stats["blocks_scanned"] += 1
+            results = (results + query.block_matches(block, first_line, ts, level))[-limit:]
+            for line in split_lines(block):
+                ts, level = classify(line, ts, level)
+            first_line += len(split_lines(block))
+    return results
+
+
+def search(segments: List[str], query: Query, limit: int) -> Dict[str, Any]:
+    # сегменты — от новых к старым; в ответе последние limit совпадений по времени
+    started = time.monotonic()
+    stats = {"blocks_total": 0, "blocks_scanned": 0}
+    matches: List[Dict[str, Any]] = []
+    for segment in segments:
+        if len(matches) >= limit:
+            break
+        if not os.path.exists(segment):
+            continue
+        found = search_segment(segment, query, limit - len(matches), stats)
+        name = os.path.basename(segment)
+        matches = [dict(m, segment=name) for m in found] + matches
+    return {
+        "matches": matches,
+        "truncated": len(matches) >= limit,
+        "took_ms": round((time.monotonic() - started) * 1000, 1),
+        **stats,
+    }
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    # 2024-05-01, 2024-05-01 12:00, 2024-05-01T12:00:30 (местное время) или unix-время
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized time: {value}")
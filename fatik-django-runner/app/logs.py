@@ -0,0 +1,257 @@
+import fcntl
+import glob
+import os
+import re
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+from config import LOG_MAX_BYTES, LOG_ROTATE_SECONDS, LOG_KEEP_ARCHIVES
+from logindex import compress_indexed, index_path
+
+TAIL_BLOCK_SIZE = 64 * 1024
+# больше строк за один запрос не отдаём, сколько бы ни попросил клиент
+MAX_TAIL_LINES = 5000
+
+
+def read_tail_bytes(f, lines: int) -> bytes:
+    # читаем файл блоками с конца, пока не наберём lines переводов строки
+    f.seek(0, os.SEEK_END)
+    pos = f.tell()
+    if pos == 0 or lines <= 0:
+        return b""
+
+    blocks = []
+    newlines = 0
+    # завершающий \n последней строки не считается началом новой
+    f.seek(pos - 1)
+    if f.read(1) == b"\n":
+        newlines -= 1
+
+    while pos > 0 and newlines < lines:
+        size = min(TAIL_BLOCK_SIZE, pos)
+        pos -= size
+        f.seek(pos)
+        block = f.read(size)
+        blocks.append(block)
+        newlines += block.count(b"\n")
+
+    data = b"".join(reversed(blocks))
+    if newlines >= lines:
+        # отрезаем лишнее по границе \n — байт 0x0A не встречается внутри
+        # многобайтовых символов UTF-8, поэтому символ на стыке блоков не рвётся
+        cut = len(data)
+        for _ in range(lines + (1 if data.endswith(b"\n") else 0)):
+            cut = data.rfind(b"\n", 0, cut)
+        data = data[cut + 1:]
+    return data
+
+
+def tail_file(path: str, lines: int = 100) -> str:
+    if not path or not os.path.exists(path):
+        return ""
+    lines = max(0, min(lines, MAX_TAIL_LINES))
+    try:
+        with open(path, "rb") as f:
+            data = read_tail_bytes(f, lines)
+        return data.decode("utf-8", errors="replace")
+    except Exception:
+        return ""
+
+
+# ---------- Инкрементальное чтение (лог-вьюер) ----------
+
+MAX_CHUNK_BYTES = 256 * 1024
+
+
+def utf8_complete_length(data: bytes) -> int:
+    # длина префикса без оборванного в конце многобайтового символа
+    i = len(data) - 1
+    # идём назад по байтам-продолжениям 10xxxxxx (не больше 3)
+    while i >= 0 and len(data) - i <= 4 and (data[i] & 0xC0) == 0x80:
+        i -= 1
+    if i < 0:
+        return len(data)
+    lead = data[i]
+    if lead < 0x80:
+        return len(data)
+    if lead >= 0xF0:
+        need = 4
+    elif lead >= 0xE0:
+        need = 3
+    elif lead >= 0xC0:
+        need = 2
+    else:
+        return len(data)
+    return len(data) if len(data) - i >= need else i
+
+
+def read_since(path: str, offset: int, max_bytes: int = MAX_CHUNK_BYTES) -> bytes:
+    # байты, дописанные в файл после offset (не больше max_bytes, без оборванных символов)
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(max_bytes)
+    return data[:utf8_complete_length(data)]
+
+
+# ---------- Ротация ----------
+
+# сегмент: <лог>.<ГГГГММДД-ЧЧММСС-мс>.gz, имена сортируются по времени ротации
+ARCHIVE_SUFFIX = re.compile(r"\.(\d{8}-\d{6}-\d{3})(\.gz)?$")
+# задержка перед сжатием: писатель второй версии (blue/green) ещё может дописать в старый файл
+COMPRESS_DELAY = 2.0
+LOCK_SUFFIX = ".lock"
+
+
+def archive_paths(log_path: str) -> List[str]:
+    # сжатые сегменты лога, от новых к старым
+    if not log_path:
+        return []
+    found = [p for p in glob.glob(glob.escape(log_path) + ".*.gz")
+             if ARCHIVE_SUFFIX.search(p[len(log_path):])]
+    return sorted(found, reverse=True)
+
+
+def list_archives(log_path: str) -> List[Dict[str, Any]]:
+    archives = []
+    for path in archive_paths(log_path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        archives.append({"name": os.path.basename(path), "path": path,
+                         "size": st.st_size, "rotated_at": st.st_mtime})
+    return archives
+
+
+def segment_lock(path: str) -> Optional[int]:
+    # сегмент сжимает ровно один писатель: при blue/green второй logwriter при старте
+    # видит тот же несжатый сегмент. Блокировка берётся до паузы перед сжатием — чужой
+    # свежий сегмент, в который ещё дописывает старая версия, не трогаем.
+    fd = os.open(path + LOCK_SUFFIX, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def compress_segment(path: str, log_path: str, delay: float = 0.0) -> None:
+    lock = segment_lock(path)
+    if lock is None:
+        return
+    try:
+        time.sleep(delay)
+        # другой писатель мог сжать сегмент до того, как мы взяли блокировку
+        if not os.path.exists(path):
+            return
+        # сжатие заодно строит индекс сегмента для поиска (logindex)
+        compress_indexed(path, path + ".gz")
+        os.remove(path)
+    finally:
+        try:
+            os.remove(path + LOCK_SUFFIX)
+        except OSError:
+            pass
+        os.close(lock)
+    for old in archive_paths(log_path)[LOG_KEEP_ARCHIVES:]:
+        for stale in (old, index_path(old)):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def log_files(log_path: str) -> List[str]:
+    # всё, что относится к логу проекта: сам лог, сегменты и их индексы
+    if not log_path:
+        return []
+    files = [log_path, index_path(log_path)]
+    for archive in archive_paths(log_path):
+        files += [archive, index_path(archive)]
+    # блокировки сегментов, оставшиеся после аварийного выхода писателя
+    files += glob.glob(glob.escape(log_path) + ".*" + LOCK_SUFFIX)
+    return [p for p in files if os.path.exists(p)]
+
+
+class RotatingLog:
+    # Пишет в лог проекта целыми строками (O_APPEND) и переключает сегменты.
+    # Писателей одного лога может быть два (старая и новая версия при blue/green),
+    # поэтому состояние не хранится: размер и время берутся из самого файла,
+    # а файл, сменившийся у другого писателя, просто переоткрывается.
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = -1
+        self.compressors: List[threading.Thread] = []
+        self.open()
+        # сегменты, не сжатые из-за прошлого аварийного выхода
+        for leftover in glob.glob(glob.escape(path) + ".*"):
+            match = ARCHIVE_SUFFIX.search(leftover[len(path):])
+            if match and not match.group(2):
+                self.compress(leftover, 0.0)
+
+    def open(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def write(self, data: bytes) -> None:
+        if not data:
+            return
+        try:
+            current = os.stat(self.path).st_ino
+        except OSError:
+            # лог удалили вместе с проектом — дописываем в уже открытый, он исчезнет с нами
+            current = None
+        own = os.fstat(self.fd)
+        if current is not None and current != own.st_ino:
+            self.open()
+            own = os.fstat(self.fd)
+        if current is not None and self.due(own, len(data)):
+            self.rotate()
+        os.write(self.fd, data)
+
+    def due(self, st: os.stat_result, incoming: int) -> bool:
+        if st.st_size == 0:
+            return False
+        if st.st_size + incoming > LOG_MAX_BYTES:
+            return True
+        # окна по времени выровнены по эпохе: решение не зависит от того, кто и когда открыл файл
+        return LOG_ROTATE_SECONDS > 0 and int(time.time() // LOG_ROTATE_SECONDS) != int(st.st_mtime // LOG_ROTATE_SECONDS)
+
+    def rotate(self) -> None:
+        now = time.time()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime(now)) + f"-{int(now * 1000) % 1000:03d}"
+        segment = f"{self.path}.{stamp}"
+        try:
+            os.rename(self.path, segment)
+        except OSError:
+            # второй писатель успел первым — пишем в его свежий файл
+            self.open()
+            return
+        self.open()
+        self.compress(segment, COMPRESS_DELAY)
+
+    def compress(self, segment: str, delay: float) -> None:
+        # сжатие не задерживает чтение pipe: gunicorn не должен ждать, пока мы пишем
+        thread = threading.Thread(target=compress_segment, args=(segment, self.path, delay))
+        thread.start()
+        self.compressors.append(thread)
+
+    def close(self) -> None:
+        os.close(self.fd)
+        for thread in self.compressors:
+            thread.join()
+
+
+# ---------- Сегменты ----------
+
+def find_segment(log_path: str, name: Optional[str]) -> Optional[str]:
+    # только текущий лог или его сегменты — имя из запроса путём не становится
+    if not name or name == "current":
+        return log_path
+    for path in archive_paths(log_path):
+        if os.path.basename(path) == name:
+            return path
+    return None
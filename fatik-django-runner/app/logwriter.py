@@ -0,0 +1,44 @@
+# Писатель лога проекта: python logwriter.py <путь к логу>, вывод gunicorn — на stdin.
+# Отдельный процесс, а не поток супервизора: переживает его перезапуск вместе с gunicorn
+# и завершается сам, когда закрыты все концы pipe (мастер и воркеры вышли).
+import os
+import select
+import sys
+import time
+
+from config import LOG_BUFFER_BYTES, LOG_FLUSH_SECONDS
+from logs import RotatingLog
+
+
+def main() -> None:
+    log = RotatingLog(sys.argv[1])
+    pending = bytearray()
+    first_at = 0.0
+    while True:
+        timeout = None
+        if pending:
+            timeout = max(first_at + LOG_FLUSH_SECONDS - time.monotonic(), 0)
+        ready, _, _ = select.select([0], [], [], timeout)
+        chunk = os.read(0, LOG_BUFFER_BYTES) if ready else b""
+        if ready and not chunk:
+            break
+        if chunk:
+            if not pending:
+                first_at = time.monotonic()
+            pending += chunk
+        if len(pending) >= LOG_BUFFER_BYTES or (pending and time.monotonic() - first_at >= LOG_FLUSH_SECONDS):
+            # пишем целые строки: сегменты режутся по их границам, а строки двух
+            # писателей (blue/green) не перемешиваются; недописанная ждёт, пока не вырастет
+            cut = pending.rfind(b"\n") + 1
+            if cut == 0 and len(pending) >= LOG_BUFFER_BYTES:
+                cut = len(pending)
+            if cut:
+                log.write(bytes(pending[:cut]))
+                del pending[:cut]
+            first_at = time.monotonic()
+    log.write(bytes(pending))
+    log.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,158 +1,88 @@
-from flask import Flask, request, render_template_string, redirect, url_for, Response
+from flask import Flask, request, render_template, redirect, url_for, Response, jsonify, send_file
 import os
-import zipfile
-import uuid
-import json
 import re
-import subprocess
-import signal
-import errno
 import time
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any
+
+from config import (
+    DJANGO_PORT,
+    MAX_UPLOAD_BYTES,
+    METRICS_INTERVAL,
+    METRICS_CAPACITY,
+    LOADTEST_MAX_CONCURRENCY,
+    LOADTEST_MAX_SECONDS,
+)
+from logs import tail_file, read_since, MAX_TAIL_LINES, archive_paths, list_archives, find_segment
+from logindex import Query, parse_time, search as search_logs
+from store import ProjectStore
+from jobs import JobQueue
+from proxy import project_route, project_prefix
+from supervisor import supervisor_status
+from budget import total_budget, budget_usage, project_budget
+from runtime import WORKER_CLASSES, runtime_profile
+from metrics import read_samples, sparkline
+from httpstats import read_snapshot, prometheus_text
+from loadtest import load_results
+from installer import wheelhouse_report, INSTALL_PHASES
+from actions import (
+    ActionError, receive_upload, receive_update, submit_install, run_command, update_runtime,
+    submit_loadtest, submit_delete,
+)
+from api import create_api
 
 app = Flask(__name__)
-
-# Umbrel монтирует: ${APP_DATA_DIR}/data:/data
-DATA_BASE_DIR = "/data"
-PROJECTS_DIR = os.path.join(DATA_BASE_DIR, "projects")
-VENVS_DIR = os.path.join(DATA_BASE_DIR, "venvs")
-LOGS_DIR = os.path.join(DATA_BASE_DIR, "logs")
-STATE_FILE = os.path.join(DATA_BASE_DIR, "runner.json")
-DJANGO_PORT = 9000
-
-os.makedirs(PROJECTS_DIR, exist_ok=True)
-os.makedirs(VENVS_DIR, exist_ok=True)
-os.makedirs(LOGS_DIR, exist_ok=True)
-
+# werkzeug сам оборвёт тело запроса больше лимита (413)
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+
+# сколько последних замеров рисовать в спарклайнах карточки
+SPARKLINE_SAMPLES = 60
+# карточек на странице главной; остальное — по ссылкам страниц и фильтру
+INDEX_PAGE_SIZE = 20
+INDEX_MAX_PAGE_SIZE = 100
+CARD_STATES = ("running", "crashed", "restoring", "stopped")
+# хвост лога в карточке — грузится по клику, а не вместе со страницей
+CARD_LOG_LINES = 100
 
 # ---------- Работа с состоянием ----------
 
-def load_state() -> Dict[str, Any]:
-    if not os.path.exists(STATE_FILE):
-        return {"projects": []}
-    try:
-        with open(STATE_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {"projects": []}
-
-
-def save_state(state: Dict[str, Any]) -> None:
-    tmp_file = STATE_FILE + ".tmp"
-    with open(tmp_file, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
-    os.replace(tmp_file, STATE_FILE)
+# runner.json переехал в SQLite (/data/runner.db); старый файл мигрируется один раз
+store = ProjectStore()
+# установка зависимостей и другие долгие операции
+jobs = JobQueue(store)
+# JSON API для скриптов и CI: те же действия, долгие — через задачи (202 + id задачи)
+app.register_blueprint(create_api(store, jobs))
 
 
 # ---------- Утилиты ----------
 
-def find_first(root: str, filename: str) -> Optional[str]:
-    for dirpath, dirnames, filenames in os.walk(root):
-        if filename in filenames:
-            return os.path.join(dirpath, filename)
-    return None
-
-
-def detect_settings_module(manage_path: str, project_root: str) -> Optional[str]:
-    try:
-        with open(manage_path, "r", encoding="utf-8") as f:
-            text = f.read()
-    except Exception:
-        return None
-
-    m = re.search(r"DJANGO_SETTINGS_MODULE[\"']\s*,\s*[\"']([^\"']+)[\"']", text)
-    if m:
-        return m.group(1)
-
-    settings_path = find_first(project_root, "settings.py")
-    if not settings_path:
+def metrics_summary(project_id: str) -> Optional[Dict[str, Any]]:
+    # последние замеры для спарклайнов на карточке проекта
+    samples = read_samples(project_id, SPARKLINE_SAMPLES)
+    if not samples:
         return None
-
-    rel = os.path.relpath(settings_path, project_root)
-    if rel.endswith(".py"):
-        rel = rel[:-3]
-    return rel.replace(os.sep, ".")
-
-
-def tail_file(path: str, lines: int = 100) -> str:
-    if not path or not os.path.exists(path):
-        return ""
-    try:
-        with open(path, "r", encoding="utf-8", errors="replace") as f:
-            data = f.readlines()
-        return "".join(data[-lines:])
-    except Exception:
-        return ""
-
-
-def get_python_from_venv(venv_path: str) -> str:
-    if venv_path:
-        cand = os.path.join(venv_path, "bin", "python")
-        if os.path.exists(cand):
-            return cand
-        cand_win = os.path.join(venv_path, "Scripts", "python.exe")
-        if os.path.exists(cand_win):
-            return cand_win
-    return "python"
-
-
-def register_project(root_dir: str, zip_filename: str) -> Dict[str, Any]:
-    manage_py = find_first(root_dir, "manage.py")
-    requirements = find_first(root_dir, "requirements.txt")
-    env_file = find_first(root_dir, ".env")
-    settings_module = detect_settings_module(manage_py, root_dir) if manage_py else None
-
-    if manage_py:
-        project_name = os.path.basename(os.path.dirname(manage_py))
-    else:
-        project_name = os.path.splitext(os.path.basename(zip_filename))[0]
-
-    project_id = os.path.basename(root_dir)
-    venv_path = os.path.join(VENVS_DIR, project_id)
-
-    project = {
-        "id": project_id,
-        "name": project_name,
-        "root_dir": root_dir,
-        "manage_py": manage_py,
-        "settings_module": settings_module,
-        "env_file": env_file,
-        "requirements": requirements,
-        "venv_path": venv_path,
-        "requirements_installed": False,
-        "last_error": None,
-        "run_pid": None,
-        "is_running": False,
-        "started_at": None,  # timestamp запуска
-        "log_file": os.path.join(LOGS_DIR, f"{project_id}.log"),
+    last = samples[-1]
+    return {
+        "cpu": last["cpu_percent"],
+        "rss_mb": last["rss_bytes"] / 1048576,
+        "fds": last["fds"],
+        "threads": last["threads"],
+        "processes": last["processes"],
+        "io_kb": (last["read_bytes"] + last["write_bytes"]) / 1024,
+        "cpu_line": sparkline([s["cpu_percent"] for s in samples]),
+        "rss_line": sparkline([s["rss_bytes"] for s in samples]),
+        "stale": time.time() - last["ts"] > 3 * METRICS_INTERVAL,
+        "http": read_snapshot(project_id),
     }
 
-    state = load_state()
-    state["projects"] = [p for p in state["projects"] if p.get("id") != project_id]
-    state["projects"].append(project)
-    save_state(state)
 
-    return project
-
-
-def stop_running_project(project: Dict[str, Any]) -> bool:
-    pid = project.get("run_pid")
-    if not pid:
-        project["is_running"] = False
-        project["run_pid"] = None
-        project["started_at"] = None
-        return False
-    try:
-        os.kill(pid, signal.SIGTERM)
-    except OSError as e:
-        if e.errno != errno.ESRCH:
-            project["last_error"] = f"Stop error: {e}"
-            return False
-    project["run_pid"] = None
-    project["is_running"] = False
-    project["started_at"] = None
-    return True
+def card_state(project: Dict[str, Any]) -> str:
+    # то же, что показывает значок статуса на карточке
+    if project.get("is_running"):
+        return "running"
+    if project.get("state") in ("crashed", "restoring"):
+        return project["state"]
+    return "stopped"
 
 
 def format_uptime(seconds: float) -> str:
@@ -330,6 +260,27 @@ INDEX_TEMPLATE = """
         border-color: rgba(148,163,184,0.45);
         color: var(--muted);
       }
+      .status-crashed {
+        background: rgba(248,113,113,0.08);
+        border-color: rgba(248,113,113,0.45);
+        color: #fecaca;
+      }
+      .metrics {
+        display: flex;
+        flex-wrap: wrap;
+        align-items: center;
+        gap: 0.4rem 1rem;
+        margin-top: 0.5rem;
+        font-size: 0.8rem;
+      }
+      .metrics svg {
+        vertical-align: middle;
+      }
+      .metrics polyline {
+        fill: none;
+        stroke: var(--accent);
+        stroke-width: 1.5;
+      }
       .project-meta {
         font-size: 0.82rem;
         line-height: 1.4;
@@ -364,6 +315,50 @@ INDEX_TEMPLATE = """
         color: var(--muted);
         margin-bottom: 0.25rem;
       }
+      .budget-form {
+        display: flex;
+        align-items: center;
+        gap: 0.4rem;
+        flex-wrap: wrap;
+        margin-top: 0.6rem;
+      }
+      .budget-form input, .budget-form select {
+        width: 5.5rem;
+        padding: 0.3rem 0.5rem;
+        border-radius: 0.5rem;
+        border: 1px solid rgba(148, 163, 184, 0.4);
+        background: transparent;
+        color: inherit;
+      }
+      .budget-form input[type="checkbox"] {
+        width: auto;
+      }
+      .budget-form input.paths {
+        width: 11rem;
+      }
+      .list-bar {
+        display: flex;
+        flex-wrap: wrap;
+        gap: 0.4rem;
+        align-items: center;
+        margin-bottom: 0.75rem;
+      }
+      .list-bar input, .list-bar select {
+        padding: 0.3rem 0.5rem;
+        border-radius: 0.5rem;
+        border: 1px solid rgba(148, 163, 184, 0.4);
+        background: transparent;
+        color: inherit;
+      }
+      .pager {
+        display: flex;
+        gap: 0.6rem;
+        align-items: center;
+        margin-top: 0.9rem;
+      }
+      details.log-box > summary {
+        cursor: pointer;
+      }
       .hint {
         margin-top: 0.4rem;
         font-size: 0.78rem;
@@ -385,16 +380,47 @@ INDEX_TEMPLATE = """
 
       <div class="card" style="margin-bottom:1.5rem;">
         <h2 class="section-title" style="margin-top:0;">Upload Django project (ZIP)</h2>
-        <form class="upload-area" action="{{ url_for('upload_zip') }}" method="post" enctype="multipart/form-data">
+        <form id="upload-form" class="upload-area" action="{{ url_for('upload_zip') }}" method="post" enctype="multipart/form-data">
           <input type="file" name="zip_file" accept=".zip" required>
           <button type="submit">Upload</button>
           <span class="muted">The archive must contain <code>manage.py</code>, <code>settings.py</code> and (preferably) <code>requirements.txt</code>.</span>
         </form>
+        <div id="upload-progress" class="hint"></div>
       </div>
 
       <h2 class="section-title">Projects</h2>
+      {% if not supervisor.alive %}
+        <div class="error" style="margin-bottom:0.75rem;">
+          Process supervisor is not responding: project statuses may be stale and Start/Stop will not work.
+        </div>
+      {% endif %}
+      <div class="muted" style="margin-bottom:0.75rem;">
+        Wheel cache: {{ wheelhouse.wheels }} wheels, {{ (wheelhouse.size_bytes / 1048576) | round(1) }} MB
+        {% if wheelhouse.hit_rate is not none %}
+          · hit rate {{ (wheelhouse.hit_rate * 100) | round | int }}%
+          · saved {{ (wheelhouse.bytes_saved / 1048576) | round(1) }} MB of downloads and builds
+        {% endif %}
+        {% if wheelhouse.offline %}· offline mode{% endif %}
+        <br>Running projects use {{ budget_used.workers }} of {{ budget_total.workers }} workers
+        and {{ budget_used.memory_mb }} of {{ budget_total.memory_mb }} MB
+      </div>
+      {% if total %}
+        <form class="list-bar muted" method="get" action="{{ url_for('index') }}">
+          <input type="search" name="q" value="{{ filters.q or '' }}" placeholder="Name or id">
+          <select name="state">
+            <option value="">any state</option>
+            {% for state in card_states %}
+              <option value="{{ state }}" {% if filters.state == state %}selected{% endif %}>{{ state }}</option>
+            {% endfor %}
+          </select>
+          {% if filters.per_page %}<input type="hidden" name="per_page" value="{{ filters.per_page }}">{% endif %}
+          <button type="submit" class="btn-secondary">Filter</button>
+          {% if filters.q or filters.state %}<a href="{{ url_for('index') }}">reset</a>{% endif %}
+          <span>{{ matched }} of {{ total }} projects</span>
+        </form>
+      {% endif %}
       {% if not projects %}
-        <p class="muted">No projects have been uploaded yet.</p>
+        <p class="muted">{{ "No projects match the filter." if total else "No projects have been uploaded yet." }}</p>
       {% else %}
         <div class="projects-grid">
           {% for p in projects %}
@@ -404,6 +430,10 @@ INDEX_TEMPLATE = """
                 <div class="project-id">({{ p.id }})</div>
                 {% if p.is_running %}
                   <span class="status-badge status-running">Launched</span>
+                {% elif p.state == "crashed" %}
+                  <span class="status-badge status-crashed">Crashed, restarting</span>
+                {% elif p.state == "restoring" %}
+                  <span class="status-badge status-stopped">Restoring</span>
                 {% else %}
                   <span class="status-badge status-stopped">Stopped</span>
                 {% endif %}
@@ -415,22 +445,56 @@ INDEX_TEMPLATE = """
                 settings: {{ p.settings_module or "undetermined" }}<br>
                 .env: {{ p.env_file or "not found" }}<br>
                 requirements.txt: {{ p.requirements or "not found" }}<br>
-                PID: {{ p.run_pid or "—" }}, uptime: {{ p.uptime }}<br>
+                PID: {{ p.run_pid or "—" }}, uptime: {{ p.uptime }}{% if p.restarts %}, restarts after crashes: {{ p.restarts }}{% endif %}<br>
+                Route: {{ p.route_path }}{% if p.port %} → 127.0.0.1:{{ p.port }}{% endif %}<br>
                 Dependencies: {{ "installed" if p.requirements_installed else "not established" }}
+                {% if p.wheel_cache %}
+                  ({{ p.wheel_cache.hits }} wheels from cache, {{ p.wheel_cache.misses }} new)
+                {% endif %}
+                {% if p.install_timings %}
+                  <br>Last install ({{ p.install_timings.backend }}, {{ p.install_timings.total | round(1) }} s):
+                  {% for phase in install_phases if phase in p.install_timings %}
+                    {{ phase }} {{ p.install_timings[phase] | round(1) }} s{% if not loop.last %} ·{% endif %}
+                  {% endfor %}
+                {% endif %}
               </div>
 
+              {% if p.metrics and p.is_running and not p.metrics.stale %}
+                <div class="metrics muted">
+                  <span title="CPU, last {{ sparkline_minutes }} min">
+                    CPU {{ p.metrics.cpu | round(1) }}%
+                    <svg width="120" height="24"><polyline points="{{ p.metrics.cpu_line }}"/></svg>
+                  </span>
+                  <span title="Resident memory, last {{ sparkline_minutes }} min">
+                    RSS {{ p.metrics.rss_mb | round(1) }} MB
+                    <svg width="120" height="24"><polyline points="{{ p.metrics.rss_line }}"/></svg>
+                  </span>
+                  <span>{{ p.metrics.processes }} proc · {{ p.metrics.threads }} threads · {{ p.metrics.fds }} fds
+                    · I/O {{ p.metrics.io_kb | round(1) }} KB/{{ metrics_interval | int }}s</span>
+                  {% if p.runtime.request_metrics and p.metrics.http and p.metrics.http.total %}
+                    <span title="From the gunicorn access log, {{ p.metrics.http.total }} requests total">
+                      {{ p.metrics.http.rps | round(1) }} req/s
+                      · p50 {{ (p.metrics.http.quantiles["0.5"] * 1000) | round(1) }} ms
+                      · p95 {{ (p.metrics.http.quantiles["0.95"] * 1000) | round(1) }} ms
+                      · p99 {{ (p.metrics.http.quantiles["0.99"] * 1000) | round(1) }} ms
+                    </span>
+                  {% endif %}
+                  <a href="{{ url_for('project_metrics', project_id=p.id) }}" target="_blank" rel="noopener noreferrer">JSON</a>
+                </div>
+              {% endif %}
+
               {% if p.last_error %}
                 <div class="error">Last error: {{ p.last_error }}</div>
               {% endif %}
 
               <div class="project-actions">
                 <form action="{{ url_for('install_requirements', project_id=p.id) }}" method="post">
-                  <button type="submit">Establish dependencies</button>
+                  <button type="submit" {% if p.job_active %}disabled{% endif %}>Establish dependencies</button>
                 </form>
 
                 <form action="{{ url_for('start_project', project_id=p.id) }}" method="post">
                   <button type="submit"
-                    {% if not p.manage_py or not p.requirements_installed %}disabled{% endif %}>
+                    {% if not p.manage_py or not p.requirements_installed or p.job_active %}disabled{% endif %}>
                     Start
                   </button>
                 </form>
@@ -441,8 +505,22 @@ INDEX_TEMPLATE = """
                   </button>
                 </form>
 
+                <form action="{{ url_for('reload_project', project_id=p.id) }}" method="post">
+                  <button type="submit" class="btn-secondary" title="Graceful worker restart (SIGHUP)"
+                    {% if not p.is_running or p.job_active %}disabled{% endif %}>
+                    Reload
+                  </button>
+                </form>
+
+                <form action="{{ url_for('redeploy_project', project_id=p.id) }}" method="post">
+                  <button type="submit" class="btn-secondary" title="Boot the current code on a spare port, then switch traffic"
+                    {% if not p.is_running or p.job_active %}disabled{% endif %}>
+                    Redeploy
+                  </button>
+                </form>
+
                 <a class="btn-secondary"
-                   href="http://{{ request_host }}:{{ django_port }}/"
+                   href="http://{{ request_host }}:{{ django_port }}{{ p.route_path }}"
                    target="_blank"
                    rel="noopener noreferrer">
                   Go to Django
@@ -461,18 +539,166 @@ INDEX_TEMPLATE = """
                 </form>
               </div>
 
-              <div class="log-box">
-                <div class="log-title">Log (last {{ p.log_lines }} lines):</div>
-                <div>{{ p.log_tail or "No logs yet — try running the project." }}</div>
-              </div>
+              <form class="budget-form muted" action="{{ url_for('update_project', project_id=p.id) }}" method="post"
+                    enctype="multipart/form-data">
+                Update from ZIP:
+                <input type="file" name="zip_file" accept=".zip" required>
+                <label title="Remove files that are not in the new archive"><input type="checkbox" name="prune" value="1"> remove missing files</label>
+                <button type="submit" class="btn-secondary" {% if p.job_active %}disabled{% endif %}>Update</button>
+                <span>only changed files are written{% if p.is_running %}, then redeployed{% endif %}</span>
+              </form>
+
+              <form class="budget-form muted" action="{{ url_for('project_runtime', project_id=p.id) }}" method="post">
+                Runtime:
+                <select name="worker_class">
+                  {% for name in worker_classes %}
+                    <option value="{{ name }}" {% if p.runtime.worker_class == name %}selected{% endif %}>{{ name }}</option>
+                  {% endfor %}
+                </select>
+                <input type="number" name="workers" min="0" max="{{ budget_total.workers }}" value="{{ p.runtime.workers }}"
+                       title="0 — auto ({{ p.budget.workers }} now)"> workers
+                <input type="number" name="threads" min="1" max="64" value="{{ p.runtime.threads }}"> threads
+                <input type="number" name="memory_mb" min="64" max="{{ budget_total.memory_mb }}" step="64" value="{{ p.budget.memory_mb }}"> MB
+                <label><input type="checkbox" name="preload" value="1" {% if p.runtime.preload %}checked{% endif %}> preload</label>
+                <label title="Access log with request durations, exported on /metrics"><input type="checkbox" name="request_metrics" value="1" {% if p.runtime.request_metrics %}checked{% endif %}> request metrics</label>
+                <br>
+                <input type="number" name="max_requests" min="0" value="{{ p.runtime.max_requests }}"> max requests
+                (± <input type="number" name="max_requests_jitter" min="0" value="{{ p.runtime.max_requests_jitter }}">)
+                <input type="number" name="timeout" min="5" max="3600" value="{{ p.runtime.timeout }}"> s timeout
+                <input type="number" name="graceful_timeout" min="1" max="3600" value="{{ p.runtime.graceful_timeout }}"> s graceful
+                <button type="submit" class="btn-secondary">Save</button>
+                <span>{{ p.budget.workers }} workers{% if not p.runtime.workers %} (auto){% endif %}{% if p.is_running %}, applies on next start{% endif %}</span>
+              </form>
+
+              <form class="budget-form muted" action="{{ url_for('project_loadtest', project_id=p.id) }}" method="post">
+                Load test:
+                <input type="number" name="concurrency" min="1" max="{{ loadtest_max_concurrency }}" value="10"> connections
+                <input type="number" name="duration" min="1" max="{{ loadtest_max_seconds }}" value="10"> s
+                <input type="text" class="paths" name="paths" value="/" title="Paths under the project route, separated by spaces">
+                <button type="submit" class="btn-secondary" {% if not p.is_running or p.job_active %}disabled{% endif %}>Run</button>
+                {% if p.loadtest %}
+                  {% set t = p.loadtest %}
+                  <span title="{{ t.params.concurrency }} connections for {{ t.params.duration }} s">
+                    last: {{ t.rps | round(1) }} req/s{% if t.requests %},
+                    p50 {{ t.latency_ms.p50 | round(1) }} ms, p99 {{ t.latency_ms.p99 | round(1) }} ms{% endif %},
+                    {{ (t.error_rate * 100) | round(1) }}% errors
+                    ({{ t.runtime.workers }} × {{ t.runtime.worker_class }}{% if t.runtime.threads > 1 %}, {{ t.runtime.threads }} threads{% endif %})
+                    · <a href="{{ url_for('project_loadtests', project_id=p.id) }}">all runs</a>
+                  </span>
+                {% endif %}
+              </form>
+
+              {% if p.job %}
+                <div class="log-box job-box"
+                     data-job-url="{{ url_for('job_status', job_id=p.job.id) }}"
+                     data-active="{{ 1 if p.job_active else 0 }}">
+                  <div class="log-title">
+                    Job "{{ p.job.kind }}": <span class="job-status">{{ p.job.status }}</span>
+                    — <span class="job-message">{{ p.job.message or "" }}</span>
+                  </div>
+                  <div class="job-output"></div>
+                </div>
+              {% endif %}
+
+              <details class="log-box lazy-log" data-tail-url="{{ url_for('logs_tail', project_id=p.id, lines=card_log_lines) }}">
+                <summary class="log-title">Log (last {{ card_log_lines }} lines)</summary>
+                <div class="log-text">Loading…</div>
+              </details>
             </div>
           {% endfor %}
         </div>
+        {% if pages > 1 %}
+          <div class="pager muted">
+            {% if page > 1 %}<a href="{{ url_for('index', page=page - 1, **filters) }}">← previous</a>{% endif %}
+            <span>page {{ page }} of {{ pages }}</span>
+            {% if page < pages %}<a href="{{ url_for('index', page=page + 1, **filters) }}">next →</a>{% endif %}
+          </div>
+        {% endif %}
         <div class="hint">
-          Tip: Only one project can be launched at a time. When a new one is launched, the old one will be stopped.
+          Tip: Several projects can run at once, each under its own route on port {{ django_port }}
+          (<code>/p/&lt;route&gt;/</code> or <code>&lt;route&gt;.{{ request_host }}</code>); other paths go to the most recently started project.
+          A project starts only if its budget fits into what the running ones leave free.
         </div>
       {% endif %}
     </div>
+
+    <script>
+      // архив уходит «сырым» телом запроса: сервер распаковывает его на лету, а здесь виден прогресс
+      const uploadForm = document.getElementById('upload-form');
+      const uploadProgress = document.getElementById('upload-progress');
+      uploadForm.addEventListener('submit', (event) => {
+        const file = uploadForm.querySelector('input[type="file"]').files[0];
+        if (!file || !window.XMLHttpRequest) return;
+        event.preventDefault();
+        const button = uploadForm.querySelector('button');
+        button.disabled = true;
+
+        const xhr = new XMLHttpRequest();
+        xhr.open('POST', uploadForm.action + '?filename=' + encodeURIComponent(file.name));
+        xhr.setRequestHeader('Content-Type', 'application/zip');
+        xhr.upload.addEventListener('progress', (e) => {
+          if (!e.lengthComputable) return;
+          const mb = (n) => (n / 1048576).toFixed(1);
+          uploadProgress.textContent = 'Uploading and extracting… ' + Math.round(e.loaded * 100 / e.total)
+            + '% (' + mb(e.loaded) + ' / ' + mb(e.total) + ' MB)';
+        });
+        xhr.addEventListener('load', () => {
+          if (xhr.status < 400) {
+            window.location.href = '{{ url_for("index") }}';
+          } else {
+            uploadProgress.textContent = 'Upload failed: ' + xhr.responseText;
+            button.disabled = false;
+          }
+        });
+        xhr.addEventListener('error', () => {
+          uploadProgress.textContent = 'Upload failed: network error';
+          button.disabled = false;
+        });
+        xhr.send(file);
+      });
+
+      // хвост лога карточки читается, только когда его раскрыли
+      document.querySelectorAll('.lazy-log').forEach((box) => {
+        box.addEventListener('toggle', async () => {
+          if (!box.open) return;
+          const textEl = box.querySelector('.log-text');
+          try {
+            const res = await fetch(box.dataset.tailUrl, {cache: "no-store"});
+            const text = await res.text();
+            textEl.textContent = text || "No logs yet — try running the project.";
+          } catch (e) {
+            textEl.textContent = "Log error: " + e;
+          }
+        });
+      });
+
+      // активные задачи опрашиваем каждые 2 секунды; по завершении перерисовываем страницу
+      document.querySelectorAll('.job-box[data-active="1"]').forEach((box) => {
+        const statusEl = box.querySelector('.job-status');
+        const messageEl = box.querySelector('.job-message');
+        const outputEl = box.querySelector('.job-output');
+
+        async function poll() {
+          try {
+            const res = await fetch(box.dataset.jobUrl, {cache: "no-store"});
+            const job = await res.json();
+            statusEl.textContent = job.status;
+            messageEl.textContent = job.message || "";
+            outputEl.textContent = job.output || "";
+            outputEl.scrollTop = outputEl.scrollHeight;
+            if (job.status !== "queued" && job.status !== "running") {
+              window.location.reload();
+              return;
+            }
+          } catch (e) {
+            messageEl.textContent = "Status error: " + e;
+          }
+          setTimeout(poll, 2000);
+        }
+
+        poll();
+      });
+    </script>
   </body>
 </html>
 """
@@ -537,6 +763,28 @@ LOG_PAGE_TEMPLATE = """
         font-size: 0.8rem;
         color: #9ca3af;
       }
+      .archives {
+        margin-top: 1rem;
+        font-size: 0.8rem;
+        color: #9ca3af;
+      }
+      .archives form {
+        display: flex;
+        flex-wrap: wrap;
+        gap: 0.4rem;
+        margin-bottom: 0.5rem;
+      }
+      .archives input, .archives select {
+        padding: 0.3rem 0.5rem;
+        border-radius: 6px;
+        border: 1px solid #374151;
+        background: #020617;
+        color: #e5e7eb;
+        font-size: 0.8rem;
+      }
+      .archives a {
+        color: #93c5fd;
+      }
     </style>
   </head>
   <body>
@@ -545,12 +793,47 @@ LOG_PAGE_TEMPLATE = """
       <div class="muted">{{ project.root_dir }}</div>
       <div class="toolbar">
         <div class="status">
-          Updates every 3 seconds. PID: {{ project.run_pid or "—" }},
+          Live: new lines are appended as they arrive. PID: {{ project.run_pid or "—" }},
           status: {{ "launched" if project.is_running else "stopped" }}.
         </div>
         <button id="btn-refresh">Update</button>
       </div>
       <div id="log" class="log-box">Loading logs...</div>
+
+      <div class="archives">
+        <form action="{{ url_for('logs_search', project_id=project.id) }}" target="_blank">
+          <input type="search" name="q" placeholder="Search text">
+          <label><input type="checkbox" name="regex" value="1"> regex</label>
+          <select name="level">
+            <option value="">Any level</option>
+            <option value="WARNING,ERROR,CRITICAL">Warnings and errors</option>
+            <option value="ERROR,CRITICAL">Errors</option>
+          </select>
+          <input type="datetime-local" name="since" title="From">
+          <input type="datetime-local" name="until" title="To">
+          <select name="segment">
+            <option value="all">All segments</option>
+            <option value="current">Current log</option>
+            {% for a in archives %}
+              <option value="{{ a.name }}">{{ a.name }}</option>
+            {% endfor %}
+          </select>
+          <button type="submit">Search</button>
+        </form>
+        {% if archives %}
+          Rotated segments (gzip, newest first):
+          <ul>
+            {% for a in archives %}
+              <li>
+                <a href="{{ url_for('logs_archive', project_id=project.id, name=a.name) }}">{{ a.name }}</a>
+                — {{ (a.size / 1024) | round(1) }} KB, rotated {{ a.rotated }}
+              </li>
+            {% endfor %}
+          </ul>
+        {% else %}
+          No rotated segments yet.
+        {% endif %}
+      </div>
     </div>
 
     <script>
@@ -563,42 +846,111 @@ LOG_PAGE_TEMPLATE = """
         autoScroll = nearBottom;
       });
 
-      async function loadLog() {
-        try {
-          const res = await fetch('{{ url_for("logs_tail", project_id=project.id) }}?lines=500', {cache: "no-store"});
-          const text = await res.text();
+      const streamUrl = '{{ url_for("logs_stream", project_id=project.id) }}';
+      // в окне держим не больше ~1 млн символов, старое обрезаем сверху
+      const MAX_CHARS = 1000000;
+      let offset = null;
+      let inode = "";
+      let etag = null;
+      let timer = null;
+      let loading = false;
+
+      function render(text, replace) {
+        if (replace) {
           logEl.textContent = text || "Лог пуст.";
-          if (autoScroll) {
-            logEl.scrollTop = logEl.scrollHeight;
+        } else if (text) {
+          if (logEl.textContent === "Лог пуст.") {
+            logEl.textContent = "";
+          }
+          logEl.appendChild(document.createTextNode(text));
+          if (logEl.textContent.length > MAX_CHARS) {
+            logEl.textContent = logEl.textContent.slice(-MAX_CHARS);
+          }
+        }
+        if (autoScroll) {
+          logEl.scrollTop = logEl.scrollHeight;
+        }
+      }
+
+      async function loadLog(full) {
+        if (loading) return;
+        loading = true;
+        clearTimeout(timer);
+        let more = false;
+        try {
+          const params = new URLSearchParams({lines: "500"});
+          const headers = {};
+          if (offset !== null && !full) {
+            params.set("since", offset);
+            params.set("inode", inode);
+            if (etag) headers["If-None-Match"] = etag;
+          }
+          const res = await fetch(streamUrl + "?" + params.toString(), {cache: "no-store", headers});
+          if (res.status === 200) {
+            const text = await res.text();
+            offset = Number(res.headers.get("X-Log-Offset") || 0);
+            inode = res.headers.get("X-Log-Inode") || "";
+            etag = res.headers.get("ETag");
+            render(text, res.headers.get("X-Log-Reset") === "1");
+            more = res.headers.get("X-Log-More") === "1";
+          } else if (res.status !== 304) {
+            logEl.textContent = "Log upload error: HTTP " + res.status;
           }
         } catch (e) {
           logEl.textContent = "Log upload error: " + e;
         }
+        loading = false;
+        timer = setTimeout(loadLog, more ? 0 : 1000);
       }
 
-      btn.addEventListener('click', loadLog);
-      loadLog();
-      setInterval(loadLog, 3000);
+      btn.addEventListener('click', () => loadLog(true));
+      loadLog(true);
     </script>
   </body>
 </html>
 """
 
+# шаблоны компилируются один раз при импорте, а не на каждый запрос
+INDEX_PAGE = app.jinja_env.from_string(INDEX_TEMPLATE)
+LOG_PAGE = app.jinja_env.from_string(LOG_PAGE_TEMPLATE)
+
 
 # ---------- Роуты ----------
 
 @app.route("/")
 def index():
-    state = load_state()
-    projects = state.get("projects", [])
+    # фильтр и страница выбираются по кэшу записей; всё дорогое (задачи, замеры,
+    # файлы метрик) считается только для карточек текущей страницы
+    every = store.cached_projects()
+    query = (request.args.get("q") or "").strip()
+    state = request.args.get("state") if request.args.get("state") in CARD_STATES else None
+    per_page = max(1, min(request.args.get("per_page", default=INDEX_PAGE_SIZE, type=int), INDEX_MAX_PAGE_SIZE))
+
+    needle = query.lower()
+    matched = [
+        p for p in every
+        if (not needle or needle in (p.get("name") or "").lower() or needle in p["id"])
+        and (not state or card_state(p) == state)
+    ]
+    pages = max(1, -(-len(matched) // per_page))
+    page = max(1, min(request.args.get("page", default=1, type=int), pages))
+    # копии: кэш общий для всех запросов процесса
+    projects = [dict(p) for p in matched[(page - 1) * per_page:page * per_page]]
 
+    jobs.fail_orphans()
+    latest_jobs = store.latest_jobs([p["id"] for p in projects])
     now = time.time()
 
-    # подтягиваем хвост логов и считаем uptime
     for p in projects:
-        log_path = p.get("log_file")
-        p["log_tail"] = tail_file(log_path, lines=100)
-        p["log_lines"] = 100
+        p["job"] = latest_jobs.get(p["id"])
+        p["job_active"] = bool(p["job"] and p["job"]["status"] in ("queued", "running"))
+
+        p["route"] = project_route(p)
+        p["route_path"] = project_prefix(p) + "/"
+        p["budget"] = project_budget(p)
+        p["metrics"] = metrics_summary(p["id"])
+        p["runtime"] = runtime_profile(p)
+        p["loadtest"] = (load_results(p["id"]) or [None])[-1]
 
         started_at = p.get("started_at")
         if p.get("is_running") and started_at:
@@ -606,10 +958,32 @@ def index():
         else:
             p["uptime"] = "—"
 
+    # параметры списка для ссылок страниц (пустые не тащим в URL)
+    filters = {"q": query or None, "state": state,
+               "per_page": per_page if per_page != INDEX_PAGE_SIZE else None}
+    filters = {k: v for k, v in filters.items() if v}
+
     request_host = request.host.split(":")[0]  # umbrel.local или IP
-    return render_template_string(
-        INDEX_TEMPLATE,
+    return render_template(
+        INDEX_PAGE,
         projects=projects,
+        total=len(every),
+        matched=len(matched),
+        page=page,
+        pages=pages,
+        filters=filters,
+        card_states=CARD_STATES,
+        card_log_lines=CARD_LOG_LINES,
+        wheelhouse=wheelhouse_report(store),
+        install_phases=INSTALL_PHASES,
+        loadtest_max_concurrency=LOADTEST_MAX_CONCURRENCY,
+        loadtest_max_seconds=LOADTEST_MAX_SECONDS,
+        supervisor=supervisor_status(),
+        metrics_interval=METRICS_INTERVAL,
+        sparkline_minutes=round(SPARKLINE_SAMPLES * METRICS_INTERVAL / 60),
+        budget_total=total_budget(),
+        worker_classes=list(WORKER_CLASSES),
+        budget_used=budget_usage(store),
         request_host=request_host,
         django_port=DJANGO_PORT,
     )
@@ -617,234 +991,157 @@ def index():
 
 @app.route("/upload", methods=["POST"])
 def upload_zip():
-    if "zip_file" not in request.files:
-        return "File not found in request (zip_file field expected)", 400
-
-    zip_file = request.files["zip_file"]
-
-    if zip_file.filename == "":
-        return "Empty file name", 400
-
-    project_id = str(uuid.uuid4())
-    project_root = os.path.join(PROJECTS_DIR, project_id)
-    os.makedirs(project_root, exist_ok=True)
+    try:
+        receive_upload(store, request)
+    except ActionError as e:
+        return str(e), e.status
+    return redirect(url_for("index"))
 
-    zip_path = os.path.join(project_root, "upload.zip")
-    zip_file.save(zip_path)
 
+def form_action(project_id: str, action):
+    # формы панели: ошибка действия показывается на карточке проекта, 404 — как раньше текстом
     try:
-        with zipfile.ZipFile(zip_path, "r") as z:
-            z.extractall(project_root)
-    except zipfile.BadZipFile:
-        return "Error: The uploaded file is not a valid ZIP archive.", 400
-    finally:
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
-
-    register_project(project_root, zip_file.filename)
+        action()
+    except ActionError as e:
+        if e.status == 404:
+            return "Project not found", 404
+        store.update_project(project_id, last_error=str(e))
     return redirect(url_for("index"))
 
 
+@app.route("/projects/<project_id>/update", methods=["POST"])
+def update_project(project_id: str):
+    return form_action(project_id, lambda: receive_update(store, jobs, project_id, request))
+
+
 @app.route("/projects/<project_id>/install", methods=["POST"])
 def install_requirements(project_id: str):
-    state = load_state()
-    project = next((p for p in state.get("projects", []) if p.get("id") == project_id), None)
-    if not project:
-        return f"Project {project_id} not found", 404
+    return form_action(project_id, lambda: submit_install(store, jobs, project_id))
 
-    req_path = project.get("requirements")
-    if not req_path or not os.path.exists(req_path):
-        project["last_error"] = "requirements.txt not found for this project"
-        save_state(state)
-        return redirect(url_for("index"))
 
-    venv_path = project.get("venv_path") or os.path.join(VENVS_DIR, project_id)
-    os.makedirs(os.path.dirname(venv_path), exist_ok=True)
+@app.route("/wheelhouse")
+def wheelhouse():
+    return jsonify(wheelhouse_report(store))
 
-    try:
-        if not os.path.exists(venv_path):
-            subprocess.check_call(["python", "-m", "venv", venv_path])
 
-        python_exe = get_python_from_venv(venv_path)
+@app.route("/jobs/<job_id>")
+def job_status(job_id: str):
+    jobs.fail_orphans()
+    job = store.get_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    job["output"] = tail_file(job.get("log_file"), lines=40)
+    return jsonify(job)
 
-        subprocess.check_call([python_exe, "-m", "pip", "install", "-r", req_path])
-        subprocess.check_call([python_exe, "-m", "pip", "install", "gunicorn"])
 
-        project["venv_path"] = venv_path
-        project["requirements_installed"] = True
-        project["last_error"] = None
-    except subprocess.CalledProcessError as e:
-        project["requirements_installed"] = False
-        project["last_error"] = f"Ошибка установки зависимостей: {e}"
-    except Exception as e:
-        project["requirements_installed"] = False
-        project["last_error"] = f"Неожиданная ошибка: {e}"
+@app.route("/projects/<project_id>/loadtest", methods=["POST"])
+def project_loadtest(project_id: str):
+    return form_action(project_id, lambda: submit_loadtest(store, jobs, project_id, request.form))
 
-    state["projects"] = [p if p.get("id") != project_id else project for p in state.get("projects", [])]
-    save_state(state)
 
-    return redirect(url_for("index"))
+@app.route("/projects/<project_id>/loadtests")
+def project_loadtests(project_id: str):
+    # все сохранённые прогоны (новые в конце) — для сравнения профилей запуска
+    if not store.cached_project(project_id):
+        return jsonify({"error": "Project not found"}), 404
+    return jsonify({"project_id": project_id, "results": load_results(project_id)})
 
 
 @app.route("/projects/<project_id>/stop", methods=["POST"])
 def stop_project(project_id):
-    state = load_state()
-    projects = state.get("projects", [])
-    project = next((p for p in projects if p.get("id") == project_id), None)
-    if not project:
-        return "Project not found", 404
-
-    stop_running_project(project)
-
-    state["projects"] = [p if p.get("id") != project_id else project for p in projects]
-    save_state(state)
-    return redirect(url_for("index"))
-
+    return form_action(project_id, lambda: run_command(store, project_id, "stop"))
 
-@app.route("/projects/<project_id>/start", methods=["POST"])
-def start_project(project_id):
-    state = load_state()
-    projects = state.get("projects", [])
-    project = next((p for p in projects if p.get("id") == project_id), None)
 
-    if not project:
-        return "Project not found", 404
+@app.route("/projects/<project_id>/runtime", methods=["POST"])
+def project_runtime(project_id: str):
+    return form_action(project_id, lambda: update_runtime(store, project_id, request.form))
 
-    manage_py = project.get("manage_py")
-    settings_module = project.get("settings_module")
-    venv_path = project.get("venv_path")
-    root_dir = project.get("root_dir")
 
-    if not manage_py or not settings_module:
-        project["last_error"] = "manage.py or settings not found"
-        save_state(state)
-        return redirect(url_for("index"))
+@app.route("/projects/<project_id>/reload", methods=["POST"])
+def reload_project(project_id: str):
+    return form_action(project_id, lambda: run_command(store, project_id, "reload"))
 
-    project_base = os.path.dirname(manage_py)
-
-    # Останавливаем все другие проекты
-    for p in projects:
-        if p.get("id") != project_id and p.get("is_running"):
-            stop_running_project(p)
-
-    # путь к wsgi.py
-    wsgi_path = find_first(root_dir, "wsgi.py")
-    if not wsgi_path:
-        project["last_error"] = "Not found wsgi.py"
-        save_state(state)
-        return redirect(url_for("index"))
-
-    rel = os.path.relpath(wsgi_path, project_base)
-    wsgi_module = rel.replace("/", ".").replace("\\", ".").replace(".py", "")
-
-    env = os.environ.copy()
-    env["DJANGO_SETTINGS_MODULE"] = settings_module
-
-    if project.get("env_file"):
-        try:
-            with open(project["env_file"], "r") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line or line.startswith("#") or "=" not in line:
-                        continue
-                    k, v = line.split("=", 1)
-                    env[k] = v
-        except Exception as e:
-            project["last_error"] = f"Reading error .env: {e}"
-
-    python_exe = get_python_from_venv(venv_path)
-
-    # collectstatic
-    try:
-        subprocess.check_call(
-            [python_exe, os.path.basename(manage_py), "collectstatic", "--noinput"],
-            cwd=project_base,
-            env=env,
-        )
-    except subprocess.CalledProcessError as e:
-        project["last_error"] = f"collectstatic ended with an error: {e}"
-
-    # gunicorn
-    log_path = project.get("log_file") or os.path.join(LOGS_DIR, f"{project_id}.log")
-    project["log_file"] = log_path
-    log_file = open(log_path, "a", buffering=1)
-
-    cmd = [
-        python_exe,
-        "-m", "gunicorn",
-        "--chdir", project_base,
-        f"{wsgi_module}:application",
-        "-b", f"0.0.0.0:{DJANGO_PORT}",
-        "--workers", "3",
-        "--log-file", "-",
-        "--capture-output",
-    ]
 
-    try:
-        process = subprocess.Popen(cmd, env=env, stdout=log_file, stderr=log_file)
-        project["run_pid"] = process.pid
-        project["is_running"] = True
-        project["started_at"] = time.time()
-    except Exception as e:
-        project["is_running"] = False
-        project["last_error"] = f"Gunicorn startup error: {e}"
+@app.route("/projects/<project_id>/redeploy", methods=["POST"])
+def redeploy_project(project_id: str):
+    return form_action(project_id, lambda: run_command(store, project_id, "redeploy"))
 
-    state["projects"] = [p if p.get("id") != project_id else project for p in projects]
-    save_state(state)
 
-    return redirect(url_for("index"))
+@app.route("/projects/<project_id>/start", methods=["POST"])
+def start_project(project_id):
+    return form_action(project_id, lambda: run_command(store, project_id, "start"))
 
 
 @app.route("/projects/<project_id>/delete", methods=["POST"])
 def delete_project(project_id: str):
-    state = load_state()
-    projects: List[Dict[str, Any]] = state.get("projects", [])
-    project = next((p for p in projects if p.get("id") == project_id), None)
-    if not project:
-        return redirect(url_for("index"))
-
-    # останавливаем, если запущен
-    if project.get("is_running"):
-        stop_running_project(project)
-
-    # удаляем файлы
-    import shutil
-    try:
-        if project.get("root_dir") and os.path.exists(project["root_dir"]):
-            shutil.rmtree(project["root_dir"], ignore_errors=True)
-        if project.get("venv_path") and os.path.exists(project["venv_path"]):
-            shutil.rmtree(project["venv_path"], ignore_errors=True)
-        if project.get("log_file") and os.path.exists(project["log_file"]):
-            os.remove(project["log_file"])
-    except Exception:
-        # намеренно глушим, чтобы не сломать UI; можно писать в отдельный системный лог
-        pass
-
-    # чистим из runner.json
-    state["projects"] = [p for p in projects if p.get("id") != project_id]
-    save_state(state)
-
-    return redirect(url_for("index"))
+    return form_action(project_id, lambda: submit_delete(store, jobs, project_id))
 
 @app.route("/projects/<project_id>/logs")
 def project_logs(project_id: str):
-    state = load_state()
-    projects: List[Dict[str, Any]] = state.get("projects", [])
-    project = next((p for p in projects if p.get("id") == project_id), None)
+    project = store.cached_project(project_id)
     if not project:
         return "Project not found", 404
 
-    return render_template_string(
-        LOG_PAGE_TEMPLATE,
+    archives = list_archives(project.get("log_file"))
+    for a in archives:
+        a["rotated"] = datetime.fromtimestamp(a["rotated_at"]).strftime("%Y-%m-%d %H:%M")
+
+    return render_template(
+        LOG_PAGE,
         project=project,
+        archives=archives,
     )
 
 
+@app.route("/projects/<project_id>/logs/archives/<name>")
+def logs_archive(project_id: str, name: str):
+    project = store.cached_project(project_id)
+    path = find_segment(project.get("log_file"), name) if project and name != "current" else None
+    if not path:
+        return Response("Segment not found\n", status=404, mimetype="text/plain")
+    return send_file(path, mimetype="application/gzip", as_attachment=True, download_name=name)
+
+
+@app.route("/projects/<project_id>/logs/search")
+def logs_search(project_id: str):
+    # ?q=&regex=1&since=&until=&level=ERROR,CRITICAL&segment=all|current|<сегмент>&format=json
+    project = store.cached_project(project_id)
+    if not project:
+        return Response("Project not found\n", status=404, mimetype="text/plain")
+    log_path = project.get("log_file")
+    segment = request.args.get("segment") or "all"
+    if segment == "all":
+        segments = [log_path] + archive_paths(log_path) if log_path else []
+    else:
+        found = find_segment(log_path, segment)
+        segments = [found] if found else []
+    levels = [name for value in request.args.getlist("level") for name in value.split(",") if name]
+    limit = max(1, min(request.args.get("limit", default=500, type=int), MAX_TAIL_LINES))
+    try:
+        query = Query(
+            request.args.get("q", ""),
+            regex=request.args.get("regex") in ("1", "on", "true"),
+            since=parse_time(request.args.get("since")),
+            until=parse_time(request.args.get("until")),
+            levels=levels,
+        )
+    except (ValueError, re.error) as e:
+        return Response(f"Bad query: {e}\n", status=400, mimetype="text/plain")
+
+    result = search_logs(segments, query, limit)
+    if request.args.get("format") == "json":
+        return jsonify(result)
+    text = "".join(f"{m['segment']}:{m['line']}: {m['text']}\n" for m in result["matches"])
+    resp = Response(text, mimetype="text/plain")
+    resp.headers["X-Search-Took-Ms"] = str(result["took_ms"])
+    resp.headers["X-Search-Blocks"] = f"{result['blocks_scanned']}/{result['blocks_total']}"
+    resp.headers["X-Search-Truncated"] = "1" if result["truncated"] else "0"
+    return resp
+
+
 @app.route("/projects/<project_id>/logs/tail")
 def logs_tail(project_id: str):
-    state = load_state()
-    projects: List[Dict[str, Any]] = state.get("projects", [])
-    project = next((p for p in projects if p.get("id") == project_id), None)
+    project = store.cached_project(project_id)
     if not project:
         return Response("Project not found\n", status=404, mimetype="text/plain")
 
@@ -853,10 +1150,90 @@ def logs_tail(project_id: str):
         lines_int = int(lines)
     except ValueError:
         lines_int = 500
+    lines_int = max(1, min(lines_int, MAX_TAIL_LINES))
 
     text = tail_file(project.get("log_file"), lines=lines_int)
     return Response(text, mimetype="text/plain")
 
+@app.route("/projects/<project_id>/logs/stream")
+def logs_stream(project_id: str):
+    # ?since=<байт>: отдаём только дописанное после offset. Новый offset — в X-Log-Offset.
+    # Если файл подменили (другой inode) или обрезали — X-Log-Reset: 1 и свежий хвост.
+    project = store.cached_project(project_id)
+    if not project:
+        return Response("Project not found\n", status=404, mimetype="text/plain")
+
+    log_path = project.get("log_file")
+    try:
+        st = os.stat(log_path) if log_path else None
+    except OSError:
+        st = None
+    if st is None:
+        resp = Response("", mimetype="text/plain")
+        resp.headers["X-Log-Offset"] = "0"
+        resp.headers["X-Log-Inode"] = ""
+        resp.headers["X-Log-Reset"] = "1"
+        return resp
+
+    inode = str(st.st_ino)
+    # mtime — на случай, если файл переписали тем же размером
+    etag = f"{inode}-{st.st_size}-{st.st_mtime_ns}"
+    since = request.args.get("since", type=int)
+    reset = since is None or since > st.st_size or request.args.get("inode", inode) != inode
+
+    # 304 — только если клиент прислал этот же ETag; без него отвечаем пустым 200
+    if not reset and since == st.st_size and request.if_none_match.contains(etag):
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        resp.headers["X-Log-Offset"] = str(since)
+        resp.headers["X-Log-Inode"] = inode
+        return resp
+
+    if reset:
+        lines_int = max(1, min(request.args.get("lines", default=500, type=int), MAX_TAIL_LINES))
+        text = tail_file(log_path, lines=lines_int)
+        offset = st.st_size
+    else:
+        data = read_since(log_path, since)
+        text = data.decode("utf-8", errors="replace")
+        offset = since + len(data)
+
+    resp = Response(text, mimetype="text/plain")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Log-Offset"] = str(offset)
+    resp.headers["X-Log-Inode"] = inode
+    resp.headers["X-Log-Reset"] = "1" if reset else "0"
+    resp.headers["X-Log-More"] = "1" if offset < st.st_size else "0"
+    return resp
+
+@app.route("/projects/<project_id>/metrics")
+def project_metrics(project_id: str):
+    if not store.cached_project(project_id):
+        return jsonify({"error": "Project not found"}), 404
+    try:
+        limit = int(request.args.get("limit", METRICS_CAPACITY))
+    except ValueError:
+        limit = METRICS_CAPACITY
+    return jsonify({
+        "project_id": project_id,
+        "interval": METRICS_INTERVAL,
+        "samples": read_samples(project_id, limit),
+    })
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    # для Prometheus: ресурсы процессов из колец и задержки запросов из access-логов
+    projects = store.cached_projects()
+    resources = {}
+    for p in projects:
+        samples = read_samples(p["id"], 1)
+        if samples and time.time() - samples[-1]["ts"] <= 3 * METRICS_INTERVAL:
+            resources[p["id"]] = samples[-1]
+    return Response(prometheus_text(projects, resources), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/health")
 def health():
     return "ok"
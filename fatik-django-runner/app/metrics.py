@@ -0,0 +1,166 @@
+import mmap
+import os
+import struct
+import time
+from typing import Optional, Dict, Any, List, Iterable
+
+from config import METRICS_DIR, METRICS_INTERVAL, METRICS_CAPACITY
+
+# Кольцевой буфер замеров на проект: файл фиксированного размера, отображённый в память.
+# Пишет только супервизор, панель читает тот же файл — без базы и без блокировок.
+HEADER = struct.Struct("<4sIIQ")  # magic, ёмкость, индекс следующей записи, всего записано
+MAGIC = b"RMT1"
+# время, CPU %, RSS, открытые fd, потоки, процессы, прочитано и записано байт за интервал
+SAMPLE = struct.Struct("<dfQIIIQQ")
+FIELDS = ("ts", "cpu_percent", "rss_bytes", "fds", "threads", "processes", "read_bytes", "write_bytes")
+
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def ring_path(project_id: str) -> str:
+    return os.path.join(METRICS_DIR, f"{project_id}.ring")
+
+
+class MetricsRing:
+    def __init__(self, path: str, capacity: int = METRICS_CAPACITY):
+        size = HEADER.size + capacity * SAMPLE.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                # новый файл или другая ёмкость — начинаем с пустого буфера
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                os.pwrite(fd, HEADER.pack(MAGIC, capacity, 0, 0), 0)
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.capacity = capacity
+
+    def append(self, sample: Iterable) -> None:
+        _, capacity, head, total = HEADER.unpack_from(self.mm, 0)
+        SAMPLE.pack_into(self.mm, HEADER.size + head * SAMPLE.size, *sample)
+        # заголовок — после записи: читатель не увидит недописанный замер
+        HEADER.pack_into(self.mm, 0, MAGIC, capacity, (head + 1) % capacity, total + 1)
+
+    def close(self) -> None:
+        self.mm.close()
+
+
+def read_samples(project_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    # замеры от старых к новым; файла ещё нет — пустой список
+    try:
+        with open(ring_path(project_id), "rb") as f:
+            data = f.read()
+    except OSError:
+        return []
+    if len(data) < HEADER.size:
+        return []
+    magic, capacity, head, total = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or len(data) < HEADER.size + capacity * SAMPLE.size:
+        return []
+    count = min(total, capacity)
+    if limit is not None:
+        count = min(count, max(limit, 0))
+    samples = []
+    for i in range(head - count, head):
+        values = SAMPLE.unpack_from(data, HEADER.size + (i % capacity) * SAMPLE.size)
+        samples.append(dict(zip(FIELDS, values)))
+    return samples
+
+
+# ---------- Сбор из /proc ----------
+
+def process_tree(pid: int) -> List[int]:
+    # мастер gunicorn и все его потомки (воркеры, их подпроцессы)
+    tree, queue = [], [pid]
+    while queue:
+        current = queue.pop()
+        tree.append(current)
+        try:
+            for tid in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{tid}/children") as f:
+                    queue.extend(int(c) for c in f.read().split())
+        except OSError:
+            continue
+    return tree
+
+
+def read_process(pid: int) -> Optional[Dict[str, int]]:
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+        fields = stat[stat.rindex(b")") + 2:].split()
+        with open(f"/proc/{pid}/statm") as f:
+            resident = int(f.read().split()[1])
+        fds = len(os.listdir(f"/proc/{pid}/fd"))
+    except (OSError, ValueError):
+        return None
+    info = {
+        "ticks": int(fields[11]) + int(fields[12]),  # utime + stime
+        "threads": int(fields[17]),
+        "rss": resident * PAGE_SIZE,
+        "fds": fds,
+        "read_bytes": 0,
+        "write_bytes": 0,
+    }
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("read_bytes", "write_bytes"):
+                    info[key] = int(value)
+    except OSError:
+        pass
+    return info
+
+
+class Collector:
+    def __init__(self):
+        self.rings: Dict[str, MetricsRing] = {}
+        # прошлые счётчики (CPU и I/O растут монотонно — в буфер пишем разницу)
+        self.previous: Dict[str, Dict[str, float]] = {}
+        self.sampled_at = 0.0
+
+    def tick(self, pids: Dict[str, int]) -> None:
+        now = time.time()
+        if now - self.sampled_at < METRICS_INTERVAL:
+            return
+        self.sampled_at = now
+        for project_id, pid in pids.items():
+            self.sample(project_id, pid, now)
+        for project_id in set(self.rings) - set(pids):
+            # проект остановлен: буфер на диске остаётся для графиков, держать его открытым незачем
+            self.rings.pop(project_id).close()
+            self.previous.pop(project_id, None)
+
+    def sample(self, project_id: str, pid: int, now: float) -> None:
+        procs = [p for p in (read_process(child) for child in process_tree(pid)) if p]
+        if not procs:
+            return
+        totals = {key: sum(p[key] for p in procs) for key in procs[0]}
+        prev = self.previous.get(project_id)
+        self.previous[project_id] = {"at": now, "pid": pid, **totals}
+        if prev is None or prev["pid"] != pid:
+            # первый замер или новый мастер после blue/green — разницу считать не с чем
+            return
+        elapsed = max(now - prev["at"], 1e-6)
+        # потомки, завершившиеся за интервал, уносят свои счётчики — разница может уйти в минус
+        cpu = max(totals["ticks"] - prev["ticks"], 0) / CLK_TCK / elapsed * 100
+        ring = self.rings.get(project_id)
+        if ring is None:
+            ring = self.rings[project_id] = MetricsRing(ring_path(project_id))
+        ring.append((
+            now, cpu, totals["rss"], totals["fds"], totals["threads"], len(procs),
+            max(totals["read_bytes"] - prev["read_bytes"], 0),
+            max(totals["write_bytes"] - prev["write_bytes"], 0),
+        ))
+
+
+def sparkline(values: List[float], width: int = 120, height: int = 24) -> str:
+    # точки для <polyline> в SVG; масштаб — от нуля до максимума ряда
+    if len(values) < 2:
+        return ""
+    top = max(values) or 1.0
+    step = width / (len(values) - 1)
+    return " ".join(f"{i * step:.1f},{height - v / top * height:.1f}" for i, v in enumerate(values))
@@ -0,0 +1,226 @@
+import asyncio
+import errno
+import os
+import signal
+import socket
+import time
+from typing import Optional, Dict, Any, Tuple
+
+from config import DJANGO_PORT, PROJECT_PORT_MIN, PROJECT_PORT_MAX, ROUTE_PREFIX
+from store import ProjectStore
+
+MAX_HEAD_BYTES = 64 * 1024
+PIPE_CHUNK = 64 * 1024
+UPSTREAM_CONNECT_TIMEOUT = 5.0
+# hop-by-hop заголовки не пересылаются (RFC 7230, 6.1)
+HOP_HEADERS = {"connection", "keep-alive", "proxy-connection", "te", "trailer"}
+
+
+# ---------- Порты ----------
+
+def port_is_free(port: int) -> bool:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        # как и gunicorn: соединения в TIME_WAIT не мешают занять порт
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            s.bind(("127.0.0.1", port))
+        except OSError:
+            return False
+    return True
+
+
+def _ports_in_use(store: ProjectStore, project_id: str) -> set:
+    # порты держат только запущенные (или запускаемые) проекты; порт остановленного
+    # проекта свободен, при следующем старте он получит его обратно или другой
+    used = set()
+    for p in store.list_projects():
+        if p["id"] != project_id and (p.get("is_running") or p.get("desired") == "running"):
+            used.update((p.get("port"), p.get("spare_port")))
+    return used
+
+
+def _take_free_port(store: ProjectStore, project_id: str, field: str, used: set) -> int:
+    # вызывается внутри транзакции; desired=running сразу резервирует порт — пока
+    # gunicorn загружается, другой запуск не выдаст его повторно
+    for port in range(PROJECT_PORT_MIN, PROJECT_PORT_MAX + 1):
+        if port not in used and port_is_free(port):
+            store.update_project(project_id, desired="running", **{field: port})
+            return port
+    raise RuntimeError(f"No free ports left in {PROJECT_PORT_MIN}-{PROJECT_PORT_MAX}")
+
+
+def allocate_port(store: ProjectStore, project_id: str) -> int:
+    # проект по возможности сохраняет свой внутренний порт; выдаём под блокировкой БД
+    with store.transaction():
+        project = store.get_project(project_id)
+        used = _ports_in_use(store, project_id)
+        port = project.get("port") if project else None
+        if port and port not in used and port_is_free(port):
+            store.update_project(project_id, desired="running")
+            return port
+        return _take_free_port(store, project_id, "port", used)
+
+
+def allocate_spare_port(store: ProjectStore, project_id: str) -> int:
+    # второй порт на время blue/green перезапуска; после переключения становится основным
+    with store.transaction():
+        project = store.get_project(project_id)
+        used = _ports_in_use(store, project_id) | {project.get("port") if project else None}
+        return _take_free_port(store, project_id, "spare_port", used)
+
+
+def project_route(project: Dict[str, Any]) -> str:
+    return project.get("route") or project["id"][:8]
+
+
+def project_prefix(project: Dict[str, Any]) -> str:
+    # SCRIPT_NAME для gunicorn проекта: Django строит ссылки уже с этим префиксом
+    return f"{ROUTE_PREFIX}{project_route(project)}"
+
+
+# ---------- Маршрутизация ----------
+
+class Router:
+    def __init__(self, store: ProjectStore):
+        self.store = store
+
+    def routes(self) -> Tuple[Dict[str, Dict[str, Any]], Optional[Dict[str, Any]]]:
+        # маршруты — запущенные проекты с портом; «по умолчанию» — запущенный последним
+        running = [p for p in self.store.cached_projects() if p.get("is_running") and p.get("port")]
+        by_route = {project_route(p): p for p in running}
+        default = max(running, key=lambda p: p.get("started_at") or 0, default=None)
+        return by_route, default
+
+    def resolve(self, path: str, host: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        # 1) /p/<route>/... — только этот проект; 2) Host: <route>.<что угодно> ;
+        # 3) проект по умолчанию.
+        # Путь всегда приводится к виду /p/<route>/..., gunicorn срежет его как SCRIPT_NAME.
+        by_route, default = self.routes()
+        if path.startswith(ROUTE_PREFIX):
+            route = path[len(ROUTE_PREFIX):].split("/", 1)[0].split("?", 1)[0]
+            # явный маршрут остановленного или неизвестного проекта не уходит в чужой
+            return by_route.get(route), path
+        label = host.split(":", 1)[0].split(".", 1)[0]
+        project = by_route.get(label) or default
+        if not project:
+            return None, path
+        return project, project_prefix(project) + (path if path.startswith("/") else "/" + path)
+
+
+# ---------- HTTP-прокси ----------
+
+class Proxy:
+    def __init__(self, store: ProjectStore):
+        self.router = Router(store)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        upstream_writer = None
+        try:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            lines = head.decode("latin-1").split("\r\n")
+            try:
+                method, target, version = lines[0].split(" ", 2)
+            except ValueError:
+                await self._error(writer, 400, "Bad Request")
+                return
+            headers = [tuple(h.split(":", 1)) for h in lines[1:] if ":" in h]
+            host = next((v.strip() for k, v in headers if k.strip().lower() == "host"), "")
+
+            if target.startswith("http://") or target.startswith("https://"):
+                # absolute-form: http://host/path -> /path
+                target = "/" + target.split("/", 3)[3] if target.count("/") >= 3 else "/"
+
+            project, path = self.router.resolve(target, host)
+            if not project:
+                await self._error(writer, 502, "No running Django project for this address")
+                return
+
+            try:
+                up_reader, upstream_writer = await asyncio.wait_for(
+                    asyncio.open_connection("127.0.0.1", project["port"]), UPSTREAM_CONNECT_TIMEOUT
+                )
+            except (OSError, asyncio.TimeoutError):
+                await self._error(writer, 502, f"Project {project.get('name')} is not accepting connections")
+                return
+
+            upgrade = any(k.strip().lower() == "upgrade" for k, _ in headers)
+            peer = writer.get_extra_info("peername")
+            out = [f"{method} {path} {version}"]
+            for k, v in headers:
+                name = k.strip().lower()
+                if name in HOP_HEADERS and not (upgrade and name == "connection"):
+                    continue
+                if name.startswith("x-forwarded-"):
+                    continue
+                out.append(f"{k.strip()}: {v.strip()}")
+            if not upgrade:
+                # одно соединение — один запрос: следующий запрос может уйти в другой проект
+                out.append("Connection: close")
+            out.append(f"X-Forwarded-For: {peer[0] if peer else ''}")
+            out.append(f"X-Forwarded-Host: {host}")
+            out.append("X-Forwarded-Proto: http")
+            out.append(f"X-Forwarded-Prefix: {project_prefix(project)}")
+            upstream_writer.write(("\r\n".join(out) + "\r\n\r\n").encode("latin-1"))
+
+            # тело запроса (и websocket-трафик) — в проект, ответ — клиенту
+            to_upstream = asyncio.ensure_future(self._pipe(reader, upstream_writer))
+            await self._pipe(up_reader, writer)
+            to_upstream.cancel()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            for w in (upstream_writer, writer):
+                if w is not None:
+                    w.close()
+
+    @staticmethod
+    async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                data = await reader.read(PIPE_CHUNK)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+
+    @staticmethod
+    async def _error(writer: asyncio.StreamWriter, status: int, message: str) -> None:
+        body = (
+            "<!doctype html><html><head><meta charset=\"utf-8\"><title>Django Runner</title></head>"
+            f"<body style=\"font-family:system-ui;background:#020617;color:#e5e7eb;padding:2rem\">"
+            f"<h1>{status}</h1><p>{message}.</p>"
+            "<p>Start the project from the Django Runner panel.</p></body></html>"
+        ).encode("utf-8")
+        reason = {400: "Bad Request", 502: "Bad Gateway"}.get(status, "Error")
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: text/html; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+    async def serve(self, host: str = "0.0.0.0", port: int = DJANGO_PORT) -> None:
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEAD_BYTES, reuse_address=True)
+        async with server:
+            await server.serve_forever()
+
+
+def main() -> None:
+    signal.signal(signal.SIGTERM, lambda *_: os._exit(0))
+    proxy = Proxy(ProjectStore())
+    while True:
+        try:
+            asyncio.run(proxy.serve())
+        except OSError as e:
+            # порт ещё занят старым процессом (перезапуск контейнера) — пробуем снова
+            if e.errno != errno.EADDRINUSE:
+                raise
+            time.sleep(1)
+
+
+if __name__ == "__main__":
+    main()
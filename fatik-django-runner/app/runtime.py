@@ -0,0 +1,121 @@
+import glob
+import os
+from typing import Optional, Dict, Any, List
+
+from config import DEFAULT_PROJECT_MEMORY_MB
+
+# Профиль запуска gunicorn проекта (хранится в записи проекта, поле "runtime")
+WORKER_CLASSES = {
+    "sync": "sync",
+    "gthread": "gthread",
+    # ASGI: нужен asgi.py и uvicorn в venv проекта
+    "uvicorn": "uvicorn.workers.UvicornWorker",
+}
+
+DEFAULT_PROFILE: Dict[str, Any] = {
+    "workers": 0,  # 0 — посчитать от CPU и бюджета памяти проекта
+    "worker_class": "sync",
+    "threads": 1,
+    "preload": False,
+    "max_requests": 0,
+    "max_requests_jitter": 0,
+    "timeout": 30,
+    "graceful_timeout": 30,
+    # access-лог с длительностью запроса -> гистограммы задержек и RPS на /metrics
+    "request_metrics": False,
+}
+
+# (минимум, максимум) для числовых полей формы
+LIMITS = {
+    "workers": (0, 64),
+    "threads": (1, 64),
+    "max_requests": (0, 1000000),
+    "max_requests_jitter": (0, 100000),
+    "timeout": (5, 3600),
+    "graceful_timeout": (1, 3600),
+}
+
+# примерный RSS одного воркера Django; с --preload код приложения общий (copy-on-write)
+WORKER_MEMORY_MB = 96
+PRELOADED_WORKER_MEMORY_MB = 64
+
+
+def runtime_profile(project: Dict[str, Any]) -> Dict[str, Any]:
+    profile = dict(DEFAULT_PROFILE)
+    profile.update(project.get("runtime") or {})
+    return profile
+
+
+def auto_workers(profile: Dict[str, Any], memory_mb: int) -> int:
+    # классика (2 * CPU + 1), но не больше, чем помещается в память проекта;
+    # потоковым и асинхронным воркерам процессов нужно меньше
+    cpus = os.cpu_count() or 1
+    by_cpu = cpus * 2 + 1 if profile["worker_class"] == "sync" and profile["threads"] <= 1 else cpus
+    per_worker = PRELOADED_WORKER_MEMORY_MB if profile["preload"] else WORKER_MEMORY_MB
+    return max(1, min(by_cpu, memory_mb // per_worker))
+
+
+def effective_workers(project: Dict[str, Any]) -> int:
+    profile = runtime_profile(project)
+    if profile["workers"]:
+        return profile["workers"]
+    return auto_workers(profile, int(project.get("memory_mb") or DEFAULT_PROJECT_MEMORY_MB))
+
+
+def launch_profile(project: Dict[str, Any]) -> Dict[str, Any]:
+    # профиль, с которым проект запускается сейчас: workers уже посчитаны
+    return dict(runtime_profile(project), workers=effective_workers(project))
+
+
+def parse_profile(form) -> Dict[str, Any]:
+    # значения из формы панели; ValueError — с понятным пользователю текстом
+    profile: Dict[str, Any] = {}
+    for field, (low, high) in LIMITS.items():
+        raw = (form.get(field) or "").strip()
+        try:
+            value = int(raw) if raw else DEFAULT_PROFILE[field]
+        except ValueError:
+            raise ValueError(f"{field} must be a whole number")
+        if not low <= value <= high:
+            raise ValueError(f"{field} must be between {low} and {high}")
+        profile[field] = value
+    worker_class = form.get("worker_class") or "sync"
+    if worker_class not in WORKER_CLASSES:
+        raise ValueError(f"Unknown worker class: {worker_class}")
+    profile["worker_class"] = worker_class
+    profile["preload"] = form.get("preload") in ("1", "on", "true")
+    profile["request_metrics"] = form.get("request_metrics") in ("1", "on", "true")
+    return profile
+
+
+def venv_has_module(venv_path: str, module: str) -> bool:
+    return bool(glob.glob(os.path.join(venv_path, "lib", "python*", "site-packages", module)))
+
+
+def gunicorn_args(project: Dict[str, Any]) -> List[str]:
+    profile = runtime_profile(project)
+    args = [
+        "--workers", str(effective_workers(project)),
+        "--worker-class", WORKER_CLASSES[profile["worker_class"]],
+        "--timeout", str(profile["timeout"]),
+        "--graceful-timeout", str(profile["graceful_timeout"]),
+    ]
+    if profile["worker_class"] != "uvicorn" and (profile["worker_class"] == "gthread" or profile["threads"] > 1):
+        args += ["--threads", str(profile["threads"])]
+    if profile["preload"]:
+        args.append("--preload")
+    if profile["max_requests"]:
+        args += ["--max-requests", str(profile["max_requests"]),
+                 "--max-requests-jitter", str(profile["max_requests_jitter"])]
+    return args
+
+
+def check_profile(project: Dict[str, Any]) -> Optional[str]:
+    # ошибка запуска, которую можно показать до старта gunicorn
+    profile = runtime_profile(project)
+    if profile["worker_class"] == "uvicorn":
+        if not project.get("asgi_path"):
+            return "Not found asgi.py (required for the uvicorn worker class)"
+        if project.get("venv_path") and not venv_has_module(project["venv_path"], "uvicorn"):
+            return "uvicorn is not installed in the project venv: add it to requirements.txt"
+    return None
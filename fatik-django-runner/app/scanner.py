@@ -0,0 +1,87 @@
+import os
+from collections import deque
+from typing import Optional, Dict, Iterable, Any, List
+
+# файлы, которые ищем в проекте; ключ — поле в записи проекта
+SCAN_TARGETS = {
+    "manage.py": "manage_py",
+    "requirements.txt": "requirements",
+    ".env": "env_file",
+    "settings.py": "settings_py",
+    "wsgi.py": "wsgi_path",
+    "asgi.py": "asgi_path",
+}
+
+# тяжёлые каталоги, где нужных файлов не бывает — внутрь не заходим
+PRUNE_DIRS = {
+    ".git", ".hg", ".svn", ".idea", ".vscode",
+    "node_modules", "bower_components",
+    "__pycache__", ".mypy_cache", ".pytest_cache", ".ruff_cache", ".tox", ".nox",
+    "venv", ".venv", "site-packages",
+    "static", "staticfiles", "media",
+}
+# каталоги со статикой: исходники приложений (app/static) и результат collectstatic
+STATIC_DIR_NAMES = {"static", "staticfiles"}
+
+
+def scan_project(root: str, paths: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    # Один проход по дереву (os.scandir, в ширину — ближайший к корню файл выигрывает)
+    # вместо отдельного os.walk на каждый искомый файл. Если известен список путей
+    # (распаковка ZIP), по диску не ходим вовсе. Заодно запоминаются static-каталоги
+    # (пути от root) — отпечаток статики при старте обходит только их.
+    if paths is not None:
+        return _scan_paths(root, paths)
+
+    found: Dict[str, Any] = {field: None for field in SCAN_TARGETS.values()}
+    static_dirs: List[str] = []
+    queue = deque([root])
+    while queue:
+        current = queue.popleft()
+        try:
+            entries = sorted(os.scandir(current), key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            field = SCAN_TARGETS.get(entry.name)
+            if field and found[field] is None and entry.is_file():
+                found[field] = entry.path
+            elif entry.is_dir(follow_symlinks=False):
+                if entry.name in STATIC_DIR_NAMES:
+                    static_dirs.append(os.path.relpath(entry.path, root))
+                elif entry.name not in PRUNE_DIRS:
+                    subdirs.append(entry.path)
+        queue.extend(subdirs)
+    found["static_dirs"] = sorted(static_dirs)
+    return found
+
+
+def _scan_paths(root: str, paths: Iterable[str]) -> Dict[str, Any]:
+    found: Dict[str, Any] = {field: None for field in SCAN_TARGETS.values()}
+    best_depth: Dict[str, tuple] = {}
+    static_dirs = set()
+    for rel in paths:
+        parts = rel.replace("\\", "/").split("/")
+        for i, part in enumerate(parts[:-1]):
+            if part in STATIC_DIR_NAMES:
+                static_dirs.add(os.path.join(*parts[:i + 1]))
+            if part in PRUNE_DIRS:
+                break
+        field = SCAN_TARGETS.get(parts[-1])
+        if not field or any(p in PRUNE_DIRS for p in parts[:-1]):
+            continue
+        # тот же порядок, что и у обхода в ширину: сначала глубина, потом имя
+        key = (len(parts), parts[:-1])
+        if field not in best_depth or key < best_depth[field]:
+            best_depth[field] = key
+            found[field] = os.path.join(root, *parts)
+    found["static_dirs"] = sorted(static_dirs)
+    return found
+
+
+def module_from_path(path: str, base_dir: str) -> str:
+    # /root/proj/proj/wsgi.py + /root/proj -> proj.wsgi
+    rel = os.path.relpath(path, base_dir)
+    if rel.endswith(".py"):
+        rel = rel[:-3]
+    return rel.replace(os.sep, ".").replace("/", ".")
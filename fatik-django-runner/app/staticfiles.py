@@ -0,0 +1,60 @@
+import hashlib
+import os
+from typing import Dict, Any, List
+
+from scanner import PRUNE_DIRS, STATIC_DIR_NAMES
+
+# сюда статика не попадает — внутрь не заходим
+SKIP_DIRS = PRUNE_DIRS - STATIC_DIR_NAMES
+
+
+def static_locations(project: Dict[str, Any]) -> List[str]:
+    # static-каталоги из индекса, собранного сканером при загрузке, и STATIC_ROOT,
+    # который сообщил последний collectstatic; вложенные друг в друга — один раз
+    root = project.get("root_dir") or ""
+    dirs = [os.path.join(root, rel) for rel in project.get("static_dirs") or []]
+    if project.get("static_root"):
+        dirs.append(project["static_root"])
+    result: List[str] = []
+    for path in sorted(set(os.path.normpath(d) for d in dirs)):
+        if not any(path.startswith(parent + os.sep) for parent in result):
+            result.append(path)
+    return result
+
+
+def static_fingerprint(project: Dict[str, Any], project_base: str) -> str:
+    # Отпечаток входов collectstatic: размер и mtime каждого файла в static-каталогах
+    # (файлы не читаются), settings.py и venv (статика admin и пакетов лежит в нём).
+    # Снимается после collectstatic, поэтому удалённый STATIC_ROOT тоже даёт новый отпечаток.
+    h = hashlib.sha256()
+    h.update(f"venv={project.get('venv_key') or project.get('venv_path')}\n".encode())
+    settings_module = project.get("settings_module")
+    if settings_module:
+        try:
+            st = os.stat(os.path.join(project_base, *settings_module.split(".")) + ".py")
+            h.update(f"settings={st.st_size}:{st.st_mtime_ns}\n".encode())
+        except OSError:
+            pass
+
+    # обходятся только известные static-каталоги, а не всё дерево проекта
+    for location in static_locations(project):
+        h.update(f"dir={location}\n".encode("utf-8", "surrogateescape"))
+        stack = [location]
+        while stack:
+            current = stack.pop()
+            try:
+                entries = sorted(os.scandir(current), key=lambda e: e.name)
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in SKIP_DIRS:
+                        stack.append(entry.path)
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                rel = os.path.relpath(entry.path, project_base)
+                h.update(f"{rel}\0{st.st_size}:{st.st_mtime_ns}\n".encode("utf-8", "surrogateescape"))
+    return h.hexdigest()
@@ -0,0 +1,306 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Iterator
+
+from config import DB_FILE, STATE_FILE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    project_id TEXT,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    message TEXT,
+    log_file TEXT,
+    owner_pid INTEGER,
+    owner_starttime INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_project ON jobs (project_id, created_at);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+"""
+
+JOB_COLUMNS = ("id", "project_id", "kind", "status", "message", "log_file",
+               "owner_pid", "owner_starttime", "created_at", "started_at", "finished_at")
+ACTIVE_JOBS_SQL = "status IN ('queued', 'running')"
+
+
+# Хранилище проектов в SQLite (WAL): одна строка на проект, поиск по первичному ключу id.
+class ProjectStore:
+    def __init__(self, path: str = DB_FILE, legacy_state_file: Optional[str] = STATE_FILE):
+        self.path = path
+        self.legacy_state_file = legacy_state_file
+        self._local = threading.local()
+        # кэш для read-only роутов: разобранные проекты + индекс id -> проект
+        self._cache_lock = threading.Lock()
+        self._cache_key = None
+        self._cache_list: List[Dict[str, Any]] = []
+        self._cache_index: Dict[str, Dict[str, Any]] = {}
+        self._version_conn: Optional[sqlite3.Connection] = None
+        self._version_pid: Optional[int] = None
+        self._local_writes = 0
+        self._init_db()
+
+    # ---------- Соединение и транзакции ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # после fork (gunicorn, supervisor) соединение родителя использовать нельзя
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connect()
+        # вложенный вызов просто присоединяется к внешней транзакции
+        if conn.in_transaction:
+            yield conn
+            return
+        # IMMEDIATE сразу берёт блокировку записи: read-modify-write без потерянных обновлений
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        self._local_writes += 1
+
+    def _init_db(self) -> None:
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        # базы, созданные до появления owner_starttime
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "owner_starttime" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN owner_starttime INTEGER")
+        with self.transaction() as conn:
+            self._migrate_legacy_state(conn)
+
+    def _migrate_legacy_state(self, conn: sqlite3.Connection) -> None:
+        if self.get_meta("legacy_state_migrated"):
+            return
+        path = self.legacy_state_file
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    projects = json.load(f).get("projects", [])
+            except Exception:
+                projects = []
+            now = time.time()
+            for i, project in enumerate(projects):
+                if project.get("id"):
+                    # сохраняем исходный порядок проектов из runner.json
+                    self._put(conn, project, created_at=now + i * 1e-6)
+            os.replace(path, path + ".migrated")
+        self.set_meta("legacy_state_migrated", str(time.time()))
+
+    # ---------- Низкоуровневые операции ----------
+
+    @staticmethod
+    def _get(conn: sqlite3.Connection, project_id: str) -> Optional[Dict[str, Any]]:
+        row = conn.execute("SELECT data FROM projects WHERE id = ?", (project_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @staticmethod
+    def _put(conn: sqlite3.Connection, project: Dict[str, Any], created_at: Optional[float] = None) -> None:
+        now = time.time()
+        conn.execute(
+            "INSERT INTO projects (id, created_at, updated_at, data) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET updated_at = excluded.updated_at, data = excluded.data",
+            (project["id"], created_at or now, now, json.dumps(project, ensure_ascii=False)),
+        )
+
+    # ---------- Публичное API ----------
+
+    def list_projects(self) -> List[Dict[str, Any]]:
+        rows = self._connect().execute("SELECT data FROM projects ORDER BY created_at").fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def get_project(self, project_id: str) -> Optional[Dict[str, Any]]:
+        return self._get(self._connect(), project_id)
+
+    def save_project(self, project: Dict[str, Any]) -> None:
+        with self.transaction() as conn:
+            self._put(conn, project)
+
+    def update_project(self, project_id: str, **fields: Any) -> Optional[Dict[str, Any]]:
+        # атомарно сливает поля в запись проекта; None — если проекта уже нет
+        with self.transaction() as conn:
+            project = self._get(conn, project_id)
+            if project is None:
+                return None
+            project.update(fields)
+            self._put(conn, project)
+            return project
+
+    @contextmanager
+    def edit_project(self, project_id: str) -> Iterator[Optional[Dict[str, Any]]]:
+        # with store.edit_project(pid) as p: ... — изменения p сохраняются при выходе
+        with self.transaction() as conn:
+            project = self._get(conn, project_id)
+            yield project
+            if project is not None:
+                self._put(conn, project)
+
+    def delete_project(self, project_id: str) -> bool:
+        with self.transaction() as conn:
+            cur = conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+            return cur.rowcount > 0
+
+    def venv_refcount(self, venv_path: str) -> int:
+        # сколько проектов используют venv (venv общий для одинаковых requirements).
+        # Запущенный gunicorn держит venv, с которым стартовал (active_venv), даже если
+        # проект уже переключён на новый и ждёт blue/green
+        row = self._connect().execute(
+            "SELECT COUNT(*) FROM projects WHERE json_extract(data, '$.venv_path') = ? "
+            "OR (json_extract(data, '$.active_venv') = ? AND json_extract(data, '$.is_running'))",
+            (venv_path, venv_path),
+        ).fetchone()
+        return row[0]
+
+    # ---------- Фоновые задачи ----------
+
+    @staticmethod
+    def _job_from_row(row) -> Dict[str, Any]:
+        return dict(zip(JOB_COLUMNS, row))
+
+    def create_job(self, job: Dict[str, Any], unique: bool = False) -> Dict[str, Any]:
+        # unique=True: если у проекта уже есть активная задача того же типа, вернём её
+        with self.transaction() as conn:
+            if unique:
+                existing = self.active_job(job["project_id"], job["kind"])
+                if existing:
+                    return existing
+            conn.execute(
+                f"INSERT INTO jobs ({', '.join(JOB_COLUMNS)}) VALUES ({', '.join('?' * len(JOB_COLUMNS))})",
+                tuple(job.get(c) for c in JOB_COLUMNS),
+            )
+        return job
+
+    def update_job(self, job_id: str, **fields: Any) -> None:
+        cols = [c for c in fields if c in JOB_COLUMNS and c != "id"]
+        if not cols:
+            return
+        with self.transaction() as conn:
+            conn.execute(
+                f"UPDATE jobs SET {', '.join(c + ' = ?' for c in cols)} WHERE id = ?",
+                tuple(fields[c] for c in cols) + (job_id,),
+            )
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return self._job_from_row(row) if row else None
+
+    def active_job(self, project_id: str, kind: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE project_id = ? AND kind = ? "
+            f"AND {ACTIVE_JOBS_SQL} ORDER BY created_at DESC LIMIT 1",
+            (project_id, kind),
+        ).fetchone()
+        return self._job_from_row(row) if row else None
+
+    def latest_jobs(self, project_ids: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        # последняя задача каждого проекта (или только перечисленных) — для карточек на главной
+        where, params = "", ()
+        if project_ids is not None:
+            if not project_ids:
+                return {}
+            where = f" WHERE project_id IN ({', '.join('?' * len(project_ids))})"
+            params = tuple(project_ids)
+        rows = self._connect().execute(
+            f"SELECT {', '.join('j.' + c for c in JOB_COLUMNS)} FROM jobs j "
+            f"JOIN (SELECT project_id, MAX(created_at) AS m FROM jobs{where} GROUP BY project_id) last "
+            "ON j.project_id = last.project_id AND j.created_at = last.m",
+            params,
+        ).fetchall()
+        return {r[1]: self._job_from_row(r) for r in rows}
+
+    def active_jobs(self) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE {ACTIVE_JOBS_SQL}"
+        ).fetchall()
+        return [self._job_from_row(r) for r in rows]
+
+    def delete_jobs(self, project_id: str, keep: Optional[str] = None) -> List[Dict[str, Any]]:
+        # keep — задача, которая сама удаляет проект: её статус ещё будут опрашивать
+        with self.transaction() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE project_id = ? AND id IS NOT ?",
+                (project_id, keep),
+            ).fetchall()
+            conn.execute("DELETE FROM jobs WHERE project_id = ? AND id IS NOT ?", (project_id, keep))
+        return [self._job_from_row(r) for r in rows]
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: Optional[str]) -> None:
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, value),
+            )
+
+    # ---------- Кэш для чтения ----------
+
+    def _cache_signature(self) -> tuple:
+        # data_version меняется, когда коммитит любое другое соединение (в т.ч. второй
+        # воркер gunicorn); свои записи считаем сами. Inode ловит подмену файла БД.
+        # Вызывается под _cache_lock.
+        if self._version_conn is None or self._version_pid != os.getpid():
+            self._version_conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                                 check_same_thread=False)
+            self._version_pid = os.getpid()
+        try:
+            st = os.stat(self.path)
+            file_id = (st.st_dev, st.st_ino)
+        except OSError:
+            file_id = None
+        data_version = self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+        return file_id, data_version, self._local_writes
+
+    def _refresh_cache(self) -> None:
+        with self._cache_lock:
+            key = self._cache_signature()
+            if key == self._cache_key:
+                return
+            projects = self.list_projects()
+            self._cache_list = projects
+            self._cache_index = {p["id"]: p for p in projects}
+            self._cache_key = key
+
+    # Возвращают общие объекты кэша — перед изменением их нужно копировать
+    def cached_projects(self) -> List[Dict[str, Any]]:
+        self._refresh_cache()
+        return self._cache_list
+
+    def cached_project(self, project_id: str) -> Optional[Dict[str, Any]]:
+        self._refresh_cache()
+        return self._cache_index.get(project_id)
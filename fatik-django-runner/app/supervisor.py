@@ -0,0 +1,464 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Dict, Any, List, Tuple
+
+from config import (
+    SUPERVISOR_FILE, SUPERVISOR_WORKERS, RESTART_BACKOFF_MAX, SWITCH_GRACE_SECONDS, METRICS_INTERVAL,
+)
+from store import ProjectStore
+from jobs import JobContext, execute_job, new_job, proc_starttime, same_process
+from launcher import (
+    LaunchError,
+    prepare_launch,
+    gunicorn_command,
+    spawn_gunicorn,
+    wait_healthy,
+    static_changed,
+    run_collectstatic,
+)
+from proxy import allocate_port, allocate_spare_port, project_prefix
+from runtime import runtime_profile, launch_profile
+from metrics import Collector
+from installer import release_venv
+from httpstats import RequestStats, read_access_log, write_snapshot
+
+# команды, которые панель ставит в таблицу jobs, а выполняет супервизор
+COMMANDS = ("start", "stop", "reload", "redeploy")
+TICK = 0.5
+HEARTBEAT_INTERVAL = 2.0
+HEARTBEAT_STALE = 10.0
+# проработал столько без падений — пауза перед перезапуском снова минимальная
+STABLE_SECONDS = 60.0
+# сверх graceful_timeout проекта, прежде чем добить SIGKILL
+STOP_GRACE = 5.0
+
+
+class SupervisorUnavailable(Exception):
+    pass
+
+
+# ---------- Процессы ----------
+
+def signal_project(project: Dict[str, Any], sig: int) -> bool:
+    # сигнал уходит, только если под run_pid всё ещё тот самый gunicorn
+    pid = project.get("run_pid")
+    if not same_process(pid, project.get("run_starttime")):
+        return False
+    try:
+        os.kill(pid, sig)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def kill_group(pid: int, starttime: Optional[int] = None) -> None:
+    # воркеры gunicorn без мастера ещё какое-то время держат порт проекта;
+    # пока в группе есть живые процессы, её номер не достанется никому другому.
+    # Если же номер уже занят другим процессом (не тем мастером, что с starttime),
+    # старой группы нет, а killpg ударил бы по чужой.
+    current = proc_starttime(pid)
+    if current is not None and current != starttime:
+        return
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def supervisor_status() -> Dict[str, Any]:
+    try:
+        with open(SUPERVISOR_FILE) as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        return {"alive": False, "pid": None, "at": None}
+    status["alive"] = time.time() - status.get("at", 0) < HEARTBEAT_STALE and same_process(
+        status.get("pid"), status.get("starttime"))
+    return status
+
+
+def submit_command(store: ProjectStore, project_id: str, kind: str, message: str = "Queued") -> Dict[str, Any]:
+    status = supervisor_status()
+    if not status["alive"]:
+        raise SupervisorUnavailable("Process supervisor is not running, try again in a few seconds")
+    return store.create_job(new_job(project_id, kind, message, status["pid"], status.get("starttime")),
+                            unique=True)
+
+
+# ---------- Супервизор ----------
+
+# Единственный владелец процессов gunicorn проектов: запускает, собирает завершившихся,
+# перезапускает упавших с нарастающей паузой и пишет в базу фактическое состояние.
+class Supervisor:
+    def __init__(self, store: ProjectStore):
+        self.store = store
+        self.pid = os.getpid()
+        self.starttime = proc_starttime(self.pid)
+        self.lock = threading.Lock()
+        # текущий gunicorn проекта; старые версии после blue/green дорабатывают в draining
+        self.children: Dict[str, subprocess.Popen] = {}
+        self.draining: List[subprocess.Popen] = []
+        # процессы, пережившие перезапуск супервизора: waitpid недоступен, следим по starttime
+        self.adopted: Dict[str, Tuple[int, int]] = {}
+        self.backoff: Dict[str, Dict[str, float]] = {}
+        self.busy = set()
+        self.pool = ThreadPoolExecutor(SUPERVISOR_WORKERS, thread_name_prefix="supervisor")
+        self.collector = Collector()
+        # задержки запросов из access-логов; счётчики проекта переживают reload и blue/green
+        self.http_stats: Dict[str, RequestStats] = {}
+        self._beat_at = 0.0
+        self._published_at = 0.0
+
+    def boot(self) -> None:
+        restore = []
+        for project in self.store.list_projects():
+            # записи до появления супервизора знают только is_running
+            desired = project.get("desired") or ("running" if project.get("is_running") else "stopped")
+            if project.get("is_running") and same_process(project.get("run_pid"), project.get("run_starttime")):
+                self.adopted[project["id"]] = (project["run_pid"], project["run_starttime"])
+            elif desired == "running":
+                # после рестарта контейнера процесса нет, а run_pid из базы — чужой или ничей
+                self.mark_stopped(project["id"], state="restoring", desired="running")
+                restore.append(project["id"])
+            elif project.get("is_running"):
+                self.mark_stopped(project["id"])
+        self.restore(restore)
+
+    def restore(self, project_ids: List[str]) -> None:
+        # Поднимаем всё, что работало до рестарта, параллельно, но не больше CPU за раз:
+        # загрузка Django упирается в процессор. Путь к wsgi.py и отпечаток статики уже
+        # лежат в записи проекта, поэтому дерево не обходится и collectstatic не повторяется.
+        if not project_ids:
+            return
+        pool = ThreadPoolExecutor(os.cpu_count() or 1, thread_name_prefix="restore")
+        for project_id in project_ids:
+            job = new_job(project_id, "start", "Restoring after restart", self.pid, self.starttime)
+            with self.lock:
+                self.busy.add(project_id)
+            self.store.create_job(job)
+            pool.submit(self._execute, job, lambda ctx: self.cmd_start(ctx, restore=True))
+        pool.shutdown(wait=False)
+
+    def run(self) -> None:
+        self.boot()
+        while True:
+            try:
+                self.heartbeat()
+                self.reap()
+                self.restart_due()
+                self.claim_commands()
+                self.collector.tick(self.running_pids())
+                self.publish_http_stats()
+            except Exception as e:
+                print(f"supervisor: {e!r}", file=sys.stderr, flush=True)
+            time.sleep(TICK)
+
+    def heartbeat(self) -> None:
+        now = time.time()
+        if now - self._beat_at < HEARTBEAT_INTERVAL:
+            return
+        self._beat_at = now
+        # пульс — файлом, а не в базе: запись в SQLite сбрасывала бы кэш проектов у панели
+        tmp = SUPERVISOR_FILE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"pid": self.pid, "starttime": self.starttime, "at": now,
+                       "children": len(self.children) + len(self.adopted)}, f)
+        os.replace(tmp, SUPERVISOR_FILE)
+
+    def publish_http_stats(self) -> None:
+        now = time.time()
+        if now - self._published_at < METRICS_INTERVAL:
+            return
+        self._published_at = now
+        # снимок — файлом рядом с кольцом метрик, панель читает его на /metrics
+        for project_id, stats in list(self.http_stats.items()):
+            write_snapshot(project_id, stats.snapshot(now))
+
+    # ---------- Слежение ----------
+
+    def track(self, project_id: str, process: subprocess.Popen) -> None:
+        with self.lock:
+            old = self.children.get(project_id)
+            if old is not None and old.pid != process.pid:
+                self.draining.append(old)
+            self.children[project_id] = process
+            self.adopted.pop(project_id, None)
+
+    def reap(self) -> None:
+        with self.lock:
+            exited = [(project_id, p) for project_id, p in self.children.items() if p.poll() is not None]
+            for project_id, _ in exited:
+                del self.children[project_id]
+            self.draining = [p for p in self.draining if p.poll() is None]
+            gone = [(project_id, pid, start) for project_id, (pid, start) in self.adopted.items()
+                    if not same_process(pid, start)]
+            for project_id, _, _ in gone:
+                del self.adopted[project_id]
+        for project_id, process in exited:
+            self.on_exit(project_id, process.pid, process.returncode)
+        for project_id, pid, start in gone:
+            self.on_exit(project_id, pid, None, start)
+
+    def on_exit(self, project_id: str, pid: int, code: Optional[int], starttime: Optional[int] = None) -> None:
+        kill_group(pid, starttime)
+        project = self.store.get_project(project_id)
+        if not project or project.get("run_pid") != pid:
+            # проект удалён или уже работает другая версия
+            return
+        if project.get("desired") != "running":
+            self.mark_stopped(project_id)
+            return
+        info = self.backoff.setdefault(project_id, {"failures": 0, "next_at": 0.0})
+        if time.time() - (project.get("started_at") or 0) >= STABLE_SECONDS:
+            info["failures"] = 0
+        delay = min(2 ** info["failures"], RESTART_BACKOFF_MAX)
+        info["failures"] += 1
+        info["next_at"] = time.time() + delay
+        self.mark_stopped(
+            project_id,
+            state="crashed",
+            restarts=(project.get("restarts") or 0) + 1,
+            last_error=f"Gunicorn exited (code {code if code is not None else 'unknown'}), restarting in {delay}s",
+        )
+
+    def restart_due(self) -> None:
+        now = time.time()
+        for project_id, info in list(self.backoff.items()):
+            if not info["next_at"] or info["next_at"] > now or project_id in self.busy:
+                continue
+            info["next_at"] = 0.0
+            project = self.store.get_project(project_id)
+            if not project or project.get("desired") != "running" or project.get("is_running"):
+                continue
+            try:
+                self.launch(project)
+            except Exception as e:
+                # ошибка конфигурации сама не пройдёт — перестаём перезапускать
+                self.store.update_project(project_id, desired="stopped", state="stopped",
+                                          last_error=f"Restart failed: {e}")
+
+    def mark_stopped(self, project_id: str, state: str = "stopped", **fields: Any) -> None:
+        self.store.update_project(project_id, is_running=False, run_pid=None, run_starttime=None,
+                                  started_at=None, state=state, **fields)
+
+    def running_pids(self) -> Dict[str, int]:
+        with self.lock:
+            pids = {project_id: p.pid for project_id, p in self.children.items()}
+            pids.update({project_id: pid for project_id, (pid, _) in self.adopted.items()})
+        return pids
+
+    def is_alive(self, project: Dict[str, Any]) -> bool:
+        return same_process(project.get("run_pid"), project.get("run_starttime"))
+
+    # ---------- Команды ----------
+
+    def claim_commands(self) -> None:
+        for job in self.store.active_jobs():
+            if (job["status"] != "queued" or job["kind"] not in COMMANDS
+                    or (job["owner_pid"], job["owner_starttime"]) != (self.pid, self.starttime)):
+                continue
+            # команды одного проекта выполняются по очереди
+            with self.lock:
+                if job["project_id"] in self.busy:
+                    continue
+                self.busy.add(job["project_id"])
+            self.pool.submit(self._execute, job)
+
+    def _execute(self, job: Dict[str, Any], func: Optional[Callable[[JobContext], str]] = None) -> None:
+        try:
+            execute_job(self.store, job, func or getattr(self, f"cmd_{job['kind']}"))
+        finally:
+            with self.lock:
+                self.busy.discard(job["project_id"])
+
+    def spawn(self, launch: Dict[str, Any], port: int) -> subprocess.Popen:
+        project_id = launch["project"]["id"]
+        if not runtime_profile(launch["project"])["request_metrics"]:
+            return spawn_gunicorn(launch, port)
+        # Access-лог идёт в pipe, который читает поток супервизора: разбор построчный,
+        # в памяти только гистограмма. Процессы, подхваченные после рестарта супервизора,
+        # замеров не шлют до следующего reload/redeploy — читающий конец pipe был у прошлого.
+        read_fd, write_fd = os.pipe()
+        try:
+            process = spawn_gunicorn(launch, port, write_fd)
+        except Exception:
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+        stats = self.http_stats.setdefault(project_id, RequestStats())
+        threading.Thread(target=read_access_log, args=(read_fd, stats), daemon=True,
+                         name=f"access-{project_id[:8]}").start()
+        return process
+
+    def launch(self, project: Dict[str, Any], port: Optional[int] = None) -> Dict[str, Any]:
+        launch = prepare_launch(self.store, project)
+        port = port or allocate_port(self.store, project["id"])
+        process = self.spawn(launch, port)
+        self.track(project["id"], process)
+        self.store.update_project(
+            project["id"],
+            port=port,
+            spare_port=None,
+            run_pid=process.pid,
+            run_starttime=proc_starttime(process.pid),
+            is_running=True,
+            state="running",
+            desired="running",
+            started_at=time.time(),
+            log_file=launch["project"]["log_file"],
+            last_error=launch["env_error"],
+            active_runtime=launch_profile(launch["project"]),
+            active_venv=launch["project"].get("venv_path"),
+        )
+        return launch
+
+    def cmd_start(self, ctx: JobContext, restore: bool = False) -> str:
+        project = self.store.get_project(ctx.project_id)
+        if not project:
+            raise RuntimeError("Project was deleted")
+        if project.get("is_running") and self.is_alive(project):
+            return "Already running"
+        self.backoff.pop(ctx.project_id, None)
+        try:
+            launch = self.launch(project)
+        except LaunchError as e:
+            self.mark_stopped(ctx.project_id, desired="stopped", last_error=str(e))
+            raise RuntimeError(str(e))
+
+        if restore:
+            # место в пуле освобождается, только когда проект реально отвечает
+            ctx.set_message("Waiting for the project to answer")
+            with self.lock:
+                process = self.children.get(ctx.project_id)
+            project = self.store.get_project(ctx.project_id) or project
+            if process and not wait_healthy(process, project["port"], project_prefix(project)):
+                return "Restarted, but the project does not answer yet"
+
+        # collectstatic — пока gunicorn загружается, и только если статика изменилась
+        if static_changed(launch):
+            ctx.set_message("Collecting static files")
+            if run_collectstatic(self.store, ctx, launch):
+                return "Started, collectstatic failed"
+            return "Started, static files collected"
+        return "Started"
+
+    def cmd_stop(self, ctx: JobContext) -> str:
+        project = self.store.update_project(ctx.project_id, desired="stopped")
+        if not project:
+            raise RuntimeError("Project was deleted")
+        self.backoff.pop(ctx.project_id, None)
+        with self.lock:
+            process = self.children.pop(ctx.project_id, None)
+            self.adopted.pop(ctx.project_id, None)
+        self.stop_process(project, process)
+        self.mark_stopped(ctx.project_id)
+        self.release_old_venv(project, project.get("venv_path"))
+        return "Stopped"
+
+    def stop_process(self, project: Dict[str, Any], process: Optional[subprocess.Popen]) -> None:
+        # SIGTERM: gunicorn дорабатывает начатые запросы (graceful_timeout), потом SIGKILL
+        if not signal_project(project, signal.SIGTERM):
+            return
+        deadline = time.time() + runtime_profile(project)["graceful_timeout"] + STOP_GRACE
+        if process is not None and process.pid == project["run_pid"]:
+            try:
+                process.wait(max(deadline - time.time(), 0))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        else:
+            while time.time() < deadline and self.is_alive(project):
+                time.sleep(0.2)
+            signal_project(project, signal.SIGKILL)
+        kill_group(project["run_pid"], project.get("run_starttime"))
+
+    def cmd_reload(self, ctx: JobContext) -> str:
+        project = self.store.get_project(ctx.project_id)
+        if not project or not signal_project(project, signal.SIGHUP):
+            raise RuntimeError("Project is not running")
+        # HUP: мастер gunicorn плавно заменяет воркеров, порт не закрывается ни на миг
+        return "Workers are being replaced"
+
+    def cmd_redeploy(self, ctx: JobContext) -> str:
+        # Blue/green: новая версия поднимается на запасном порту, проверяется по HTTP,
+        # прокси переключается на неё, старая дорабатывает начатые запросы и гасится.
+        project = self.store.get_project(ctx.project_id)
+        if not project:
+            raise RuntimeError("Project was deleted")
+        if not project.get("is_running") or not self.is_alive(project):
+            return self.cmd_start(ctx)
+        try:
+            launch = prepare_launch(self.store, project)
+        except LaunchError as e:
+            self.store.update_project(ctx.project_id, last_error=str(e))
+            raise RuntimeError(str(e))
+        project = launch["project"]
+
+        # статику новой версии собираем до переключения трафика; сбой не мешает переключению
+        static_error = None
+        if static_changed(launch):
+            ctx.set_message("Collecting static files")
+            static_error = run_collectstatic(self.store, ctx, launch)
+
+        port = allocate_spare_port(self.store, ctx.project_id)
+        ctx.set_message(f"Booting new version on port {port}")
+        ctx.write(f"$ {' '.join(gunicorn_command(launch, port))}\n")
+        process = self.spawn(launch, port)
+        if not wait_healthy(process, port, project_prefix(project)):
+            process.terminate()
+            process.wait()
+            self.store.update_project(ctx.project_id, spare_port=None,
+                                      last_error="Redeploy: the new version did not pass the health check")
+            raise RuntimeError("New version did not pass the health check, the old one keeps serving")
+
+        old = dict(project)
+        with self.lock:
+            old_process = self.children.get(ctx.project_id)
+        self.track(ctx.project_id, process)
+        self.store.update_project(
+            ctx.project_id,
+            port=port,
+            spare_port=None,
+            run_pid=process.pid,
+            run_starttime=proc_starttime(process.pid),
+            is_running=True,
+            state="running",
+            started_at=time.time(),
+            log_file=project["log_file"],
+            last_error=launch["env_error"] or static_error,
+            active_runtime=launch_profile(launch["project"]),
+            active_venv=launch["project"].get("venv_path"),
+        )
+
+        # запросы, которые прокси уже направил на старый порт, ещё успевают дойти
+        ctx.set_message("Draining old version")
+        time.sleep(SWITCH_GRACE_SECONDS)
+        if old_process is None or old_process.pid != old.get("run_pid"):
+            old_process = None
+        self.stop_process(old, old_process)
+        # старый gunicorn погашен — его venv (если зависимости сменились) больше не нужен
+        self.release_old_venv(old, launch["project"].get("venv_path"))
+        if static_error:
+            return f"Serving new version on port {port}, collectstatic failed"
+        return f"Serving new version on port {port}"
+
+    def release_old_venv(self, project: Dict[str, Any], current: Optional[str]) -> None:
+        old_venv = project.get("active_venv")
+        if old_venv and old_venv != current:
+            release_venv(self.store, old_venv)
+
+
+def main() -> None:
+    # дочерние gunicorn переживают супервизор: новый экземпляр подхватит их по starttime
+    signal.signal(signal.SIGTERM, lambda *_: os._exit(0))
+    Supervisor(ProjectStore()).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+import hashlib
+import json
+import os
+import struct
+import zlib
+from typing import Optional, List, Iterator, Dict, Any
+
+from werkzeug.sansio.multipart import MultipartDecoder, File, Field, Data, Epilogue, NeedData
+
+from config import MAX_UPLOAD_BYTES, MAX_UNZIPPED_BYTES, MAX_ZIP_ENTRIES, MAX_COMPRESSION_RATIO, MANIFESTS_DIR
+from scanner import PRUNE_DIRS, STATIC_DIR_NAMES
+
+READ_CHUNK = 64 * 1024
+FIELD_LIMIT = 1024
+# распакованный кусок за один вызов zlib — память не зависит от размера файла
+OUT_CHUNK = 256 * 1024
+# маленькие файлы жмутся очень сильно, поэтому коэффициент проверяем только после этого порога
+RATIO_MIN_BYTES = 1024 * 1024
+
+LOCAL_HEADER_SIG = b"PK\x03\x04"
+CENTRAL_DIR_SIG = b"PK\x01\x02"
+END_OF_DIR_SIG = b"PK\x05\x06"
+ZIP64_END_SIG = b"PK\x06\x06"
+DESCRIPTOR_SIG = b"PK\x07\x08"
+# sig, version, flags, method, time, date, crc32, compressed, uncompressed, name_len, extra_len
+LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+
+FLAG_ENCRYPTED = 0x1
+FLAG_DESCRIPTOR = 0x8
+FLAG_UTF8 = 0x800
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+
+
+class UploadError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+# суффикс файлов, которые при обновлении проекта ждут конца архива
+STAGED_SUFFIX = ".runner-staged"
+
+
+# Потоковая распаковка ZIP по локальным заголовкам: архив целиком нигде не сохраняется,
+# каждый файл пишется на диск по мере прихода байтов из запроса.
+#
+# С previous (манифест прошлой версии: путь -> size, crc, sha256) распаковка обновляет
+# существующее дерево: файл с тем же размером и CRC из локального заголовка пропускается
+# без распаковки, изменённые пишутся рядом и подменяют старые только в commit() —
+# работающий проект не увидит наполовину обновлённое дерево.
+class StreamingUnzip:
+    def __init__(self, dest_dir: str, previous: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.dest = os.path.realpath(dest_dir)
+        self.entries = 0
+        self.files = 0
+        self.total_bytes = 0
+        self.paths: List[str] = []
+        self.done = False
+        self.previous = previous
+        # путь -> size, crc, sha256 для каждого файла архива
+        self.manifest: Dict[str, Dict[str, Any]] = {}
+        self.unchanged = 0
+        self.changed: List[str] = []
+        self._staged: List[str] = []
+
+        self._buf = bytearray()
+        self._state = "header"
+        self._entry = None
+        self._out = None
+        self._decomp = None
+        self._remaining = 0
+        self._consumed = 0
+        self._written = 0
+        self._crc = 0
+        self._sha = None
+        self._target = None
+        self._rel = None
+
+    def feed(self, data: bytes) -> None:
+        if self.done:
+            return
+        self._buf += data
+        try:
+            while self._step():
+                pass
+        except Exception:
+            self.close()
+            raise
+
+    def finish(self) -> None:
+        if not self.done:
+            self.close()
+            raise UploadError("Unexpected end of ZIP archive")
+
+    def close(self) -> None:
+        if self._out:
+            self._out.close()
+            self._out = None
+
+    def commit(self) -> None:
+        # подмена изменённых файлов — после того как весь архив прочитан и проверен
+        for staged in self._staged:
+            os.replace(staged, staged[:-len(STAGED_SUFFIX)])
+        self._staged = []
+
+    def discard(self) -> None:
+        self.close()
+        for staged in self._staged:
+            try:
+                os.remove(staged)
+            except OSError:
+                pass
+        self._staged = []
+
+    # ---------- Разбор ----------
+
+    def _step(self) -> bool:
+        if self._state == "header":
+            return self._read_header()
+        if self._state == "data":
+            return self._read_data()
+        if self._state == "descriptor":
+            return self._read_descriptor()
+        if self._state == "skip":
+            return self._skip_data()
+        return False
+
+    def _skip_data(self) -> bool:
+        if self._remaining and not self._buf:
+            return False
+        n = min(self._remaining, len(self._buf))
+        del self._buf[:n]
+        self._remaining -= n
+        if self._remaining:
+            return False
+        self._state = "header"
+        return True
+
+    def _read_header(self) -> bool:
+        buf = self._buf
+        if len(buf) < 4:
+            return False
+        sig = bytes(buf[:4])
+        if sig in (CENTRAL_DIR_SIG, END_OF_DIR_SIG, ZIP64_END_SIG):
+            # дальше только центральный каталог — всё уже распаковано
+            if self.entries == 0 and sig != END_OF_DIR_SIG:
+                raise UploadError("Error: The uploaded file is not a valid ZIP archive.")
+            self.done = True
+            buf.clear()
+            return False
+        if sig != LOCAL_HEADER_SIG:
+            raise UploadError("Error: The uploaded file is not a valid ZIP archive.")
+        if len(buf) < LOCAL_HEADER.size:
+            return False
+        (_, _, flags, method, _, _, crc, csize, usize, name_len, extra_len) = LOCAL_HEADER.unpack_from(buf)
+        header_len = LOCAL_HEADER.size + name_len + extra_len
+        if len(buf) < header_len:
+            return False
+
+        raw_name = bytes(buf[LOCAL_HEADER.size:LOCAL_HEADER.size + name_len])
+        extra = bytes(buf[LOCAL_HEADER.size + name_len:header_len])
+        del buf[:header_len]
+
+        name = raw_name.decode("utf-8" if flags & FLAG_UTF8 else "cp437", errors="replace")
+        zip64 = False
+        if csize == 0xFFFFFFFF or usize == 0xFFFFFFFF:
+            zip64 = True
+            usize, csize = self._zip64_sizes(extra, usize, csize)
+
+        if flags & FLAG_ENCRYPTED:
+            raise UploadError(f"Encrypted entries are not supported: {name}")
+        if method not in (METHOD_STORED, METHOD_DEFLATED):
+            raise UploadError(f"Unsupported compression method {method} for {name}")
+        if method == METHOD_STORED and flags & FLAG_DESCRIPTOR:
+            # длину такого файла можно узнать только из центрального каталога в конце архива
+            raise UploadError(f"Streamed stored entries are not supported: {name}")
+
+        self.entries += 1
+        if self.entries > MAX_ZIP_ENTRIES:
+            raise UploadError(f"Too many entries in archive (limit {MAX_ZIP_ENTRIES})", 413)
+
+        target, is_dir = self._safe_target(name)
+        self._entry = {"name": name, "flags": flags, "method": method, "crc": crc,
+                       "usize": usize, "zip64": zip64}
+        self._remaining = csize
+        self._consumed = 0
+        self._written = 0
+        self._crc = 0
+        self._decomp = zlib.decompressobj(-15) if method == METHOD_DEFLATED else None
+        self._state = "data"
+        self._target = None
+        if is_dir:
+            os.makedirs(target, exist_ok=True)
+            self._out = None
+            return True
+
+        rel = os.path.relpath(target, self.dest).replace(os.sep, "/")
+        self.files += 1
+        self.paths.append(rel)
+        self._rel = rel
+        old = self.previous.get(rel) if self.previous is not None else None
+        if (old and not flags & FLAG_DESCRIPTOR and old["size"] == usize and old["crc"] == crc
+                and os.path.isfile(target) and os.path.getsize(target) == usize):
+            # не изменился: сжатые байты пропускаются, не распаковываясь
+            self.manifest[rel] = old
+            self.unchanged += 1
+            self._decomp = None
+            self._state = "skip"
+            return True
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if self.previous is not None:
+            self._target = target + STAGED_SUFFIX
+            self._staged.append(self._target)
+        else:
+            self._target = target
+        self._out = open(self._target, "wb")
+        self._sha = hashlib.sha256()
+        return True
+
+    @staticmethod
+    def _zip64_sizes(extra: bytes, usize: int, csize: int):
+        pos = 0
+        while pos + 4 <= len(extra):
+            tag, size = struct.unpack_from("<HH", extra, pos)
+            if tag == 0x0001:
+                values = extra[pos + 4:pos + 4 + size]
+                off = 0
+                if usize == 0xFFFFFFFF and off + 8 <= len(values):
+                    usize = struct.unpack_from("<Q", values, off)[0]
+                    off += 8
+                if csize == 0xFFFFFFFF and off + 8 <= len(values):
+                    csize = struct.unpack_from("<Q", values, off)[0]
+                break
+            pos += 4 + size
+        return usize, csize
+
+    def _safe_target(self, name: str):
+        # защита от zip-slip: никаких абсолютных путей, дисков и ".."
+        norm = name.replace("\\", "/")
+        parts = [p for p in norm.split("/") if p not in ("", ".")]
+        if not parts or norm.startswith("/") or ".." in parts or ":" in parts[0]:
+            raise UploadError(f"Unsafe path in archive: {name!r}")
+        target = os.path.realpath(os.path.join(self.dest, *parts))
+        if not target.startswith(self.dest + os.sep):
+            raise UploadError(f"Unsafe path in archive: {name!r}")
+        return target, norm.endswith("/")
+
+    def _read_data(self) -> bool:
+        if self._decomp is None and self._remaining == 0:
+            # пустой файл или каталог
+            self._end_entry()
+            return True
+        if not self._buf:
+            return False
+        if self._decomp is None:
+            n = min(self._remaining, len(self._buf))
+            chunk = bytes(self._buf[:n])
+            del self._buf[:n]
+            self._consumed += n
+            self._remaining -= n
+            self._write(chunk)
+            if self._remaining == 0:
+                self._end_entry()
+            return True
+
+        data = bytes(self._buf)
+        self._buf.clear()
+        self._consumed += len(data)
+        while not self._decomp.eof:
+            out = self._decomp.decompress(data, OUT_CHUNK)
+            self._write(out)
+            data = self._decomp.unconsumed_tail
+            if not data and len(out) < OUT_CHUNK:
+                break
+        if self._decomp.eof:
+            # всё, что после конца deflate-потока, — дескриптор или следующий файл
+            # (после eof хвост может одновременно лежать и в unconsumed_tail — берём один раз)
+            rest = self._decomp.unused_data or data
+            self._consumed -= len(rest)
+            self._buf = bytearray(rest)
+            self._end_entry()
+        return bool(self._buf)
+
+    def _write(self, data: bytes) -> None:
+        if not data:
+            return
+        if self._out is None:
+            raise UploadError(f"Directory entry with data: {self._entry['name']}")
+        self._crc = zlib.crc32(data, self._crc)
+        self._written += len(data)
+        self.total_bytes += len(data)
+        if self.total_bytes > MAX_UNZIPPED_BYTES:
+            raise UploadError(f"Archive expands beyond {MAX_UNZIPPED_BYTES} bytes", 413)
+        if self._written > RATIO_MIN_BYTES and self._written > MAX_COMPRESSION_RATIO * max(self._consumed, 1):
+            raise UploadError(f"Suspicious compression ratio for {self._entry['name']} (zip bomb?)", 413)
+        self._out.write(data)
+        self._sha.update(data)
+
+    def _end_entry(self) -> None:
+        self.close()
+        if self._entry["flags"] & FLAG_DESCRIPTOR:
+            self._state = "descriptor"
+        else:
+            self._check_crc(self._entry["crc"])
+            self._state = "header"
+            self._record()
+
+    def _record(self) -> None:
+        if self._target is None:
+            return
+        entry = {"size": self._written, "crc": self._crc, "sha256": self._sha.hexdigest()}
+        old = self.previous.get(self._rel) if self.previous is not None else None
+        if old and old.get("sha256") == entry["sha256"] and os.path.isfile(os.path.join(self.dest, self._rel)):
+            # архив с дескрипторами (CRC известен только в конце) — то же содержимое, не подменяем
+            os.remove(self._target)
+            self._staged.remove(self._target)
+            self.unchanged += 1
+        elif self.previous is not None:
+            self.changed.append(self._rel)
+        self.manifest[self._rel] = entry
+
+    def _read_descriptor(self) -> bool:
+        buf = self._buf
+        if len(buf) < 4:
+            return False
+        has_sig = bytes(buf[:4]) == DESCRIPTOR_SIG
+        size = (4 if has_sig else 0) + 4 + (16 if self._entry["zip64"] else 8)
+        if len(buf) < size:
+            return False
+        crc = struct.unpack_from("<I", buf, 4 if has_sig else 0)[0]
+        del buf[:size]
+        self._check_crc(crc)
+        self._state = "header"
+        self._record()
+        return True
+
+    def _check_crc(self, expected: int) -> None:
+        if self._crc != expected:
+            raise UploadError(f"CRC mismatch for {self._entry['name']}: the archive is corrupted")
+
+
+# ---------- Чтение тела запроса ----------
+
+class UploadStream:
+    # Отдаёт байты ZIP из запроса кусками: либо «сырое» тело (application/zip, XHR-загрузка
+    # из панели и CI), либо поле zip_file из multipart-формы — без сохранения во временный файл.
+    def __init__(self, request, field: str = "zip_file"):
+        self.request = request
+        self.field = field
+        self.filename: Optional[str] = request.args.get("filename") or request.headers.get("X-Filename")
+        self.received = 0
+        self.fields: Dict[str, str] = {}
+
+    def _read(self) -> Iterator[bytes]:
+        stream = self.request.stream
+        while True:
+            chunk = stream.read(READ_CHUNK)
+            if not chunk:
+                return
+            self.received += len(chunk)
+            if self.received > MAX_UPLOAD_BYTES:
+                raise UploadError(f"Upload is larger than {MAX_UPLOAD_BYTES} bytes", 413)
+            yield chunk
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self.request.mimetype != "multipart/form-data":
+            yield from self._read()
+            return
+
+        boundary = self.request.mimetype_params.get("boundary", "").encode("latin-1")
+        if not boundary:
+            raise UploadError("Malformed multipart request")
+        # буфер разборщика ограничен: события забираются после каждого куска
+        decoder = MultipartDecoder(boundary, max_form_memory_size=16 * READ_CHUNK)
+        current = None
+        found = False
+        chunks = self._read()
+        while True:
+            chunk = next(chunks, None)
+            decoder.receive_data(chunk)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File):
+                    current = event.name
+                    if current == self.field:
+                        found = True
+                        self.filename = event.filename
+                elif isinstance(event, Field):
+                    current = event.name
+                    self.fields[current] = ""
+                elif isinstance(event, Data) and current == self.field:
+                    yield event.data
+                elif isinstance(event, Data) and current in self.fields:
+                    # обычные поля формы (флажки) — короткие, больше FIELD_LIMIT не храним
+                    if len(self.fields[current]) < FIELD_LIMIT:
+                        self.fields[current] += event.data.decode("utf-8", errors="replace")
+                event = decoder.next_event()
+            if isinstance(event, Epilogue) or chunk is None:
+                break
+        if not found:
+            raise UploadError("File not found in request (zip_file field expected)")
+
+
+# ---------- Манифест файлов проекта ----------
+
+def manifest_path(project_id: str, pending: bool = False) -> str:
+    return os.path.join(MANIFESTS_DIR, f"{project_id}{'.pending' if pending else ''}.json")
+
+
+def save_manifest(project_id: str, manifest: Dict[str, Dict[str, Any]], pending: bool = False) -> None:
+    path = manifest_path(project_id, pending)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+def load_manifest(project_id: str, pending: bool = False) -> Optional[Dict[str, Any]]:
+    try:
+        with open(manifest_path(project_id, pending)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# каталоги static/media в проекте — исходники и загруженные файлы, их не пропускаем
+MANIFEST_PRUNE_DIRS = PRUNE_DIRS - STATIC_DIR_NAMES - {"media"}
+
+
+def build_manifest(root: str, static_root: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    # проекты, загруженные до манифестов: один раз считаем по дереву на диске;
+    # пропускаем только собранный collectstatic STATIC_ROOT
+    manifest = {}
+    skip = os.path.realpath(static_root) if static_root else None
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [
+            d for d in dirnames
+            if d not in MANIFEST_PRUNE_DIRS and os.path.realpath(os.path.join(dirpath, d)) != skip
+        ]
+        for name in filenames:
+            if name.endswith(STAGED_SUFFIX):
+                continue
+            path = os.path.join(dirpath, name)
+            crc, size, sha = 0, 0, hashlib.sha256()
+            try:
+                with open(path, "rb") as f:
+                    for chunk in iter(lambda: f.read(OUT_CHUNK), b""):
+                        crc = zlib.crc32(chunk, crc)
+                        sha.update(chunk)
+                        size += len(chunk)
+            except OSError:
+                continue
+            manifest[os.path.relpath(path, root).replace(os.sep, "/")] = {
+                "size": size, "crc": crc, "sha256": sha.hexdigest(),
+            }
+    return manifest
@@ -0,0 +1,286 @@
+# Замеры производительности самой панели на синтетических данных:
+#
+#   python bench/bench.py --projects 1,10,100 --log-mb 1,10,100 --depth 5,20,80 -o bench.json
+#   python bench/bench.py --compare old.json new.json
+#
+# Каждая точка кривой считается в отдельном процессе со своим DATA_BASE_DIR (config читает
+# его при импорте) — кэши и соединения одной точки не влияют на другую. Меняется один
+# параметр, остальные берутся базовыми, поэтому в JSON получаются кривые: время от числа
+# проектов, от размера лога и от глубины дерева исходников.
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Any, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCH_DIR), "app")
+
+# значения по умолчанию для параметров, которые в данной кривой не меняются
+BASE = {"projects": 10, "log_mb": 1, "depth": 10}
+# что меряется в каждой кривой
+SWEEPS = {
+    "projects": ("store_load", "store_cached", "store_update", "index"),
+    "log_mb": ("tail_file", "tail_file_5000", "logs_tail"),
+    "depth": ("scan_project", "register_project", "register_project_paths"),
+}
+# на каждом уровне дерева: боковые каталоги и файлы в каждом из них
+TREE_FANOUT = 3
+TREE_FILES = 20
+LOG_LINE = ('127.0.0.1 - - [17/Oct/2026:12:00:{s:02d} +0000] "GET /items/{n}/?page=2 HTTP/1.1" '
+            '200 {size} "-" "Mozilla/5.0 (X11; Linux x86_64)"\n')
+REGRESSION_THRESHOLD = 1.2
+
+
+def measure(func: Callable[[], Any], min_time: float = 0.5, max_repeat: int = 200) -> Dict[str, Any]:
+    # прогрев, потом повторы, пока не наберётся min_time секунд (но не меньше 3 раз)
+    func()
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < max_repeat and (len(samples) < 3 or time.perf_counter() - started < min_time):
+        t0 = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "min_ms": round(min(samples), 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "repeat": len(samples),
+    }
+
+
+# ---------- синтетические данные ----------
+
+def write_log(path: str, size_bytes: int) -> int:
+    lines = 0
+    with open(path, "w") as f:
+        written = 0
+        while written < size_bytes:
+            line = LOG_LINE.format(s=lines % 60, n=lines, size=1000 + lines % 9000)
+            f.write(line)
+            written += len(line)
+            lines += 1
+    return lines
+
+
+def write_project_files(root: str) -> None:
+    os.makedirs(os.path.join(root, "proj"), exist_ok=True)
+    with open(os.path.join(root, "manage.py"), "w") as f:
+        f.write('os.environ.setdefault("DJANGO_SETTINGS_MODULE", "proj.settings")\n')
+    for name in ("settings.py", "wsgi.py"):
+        with open(os.path.join(root, "proj", name), "w") as f:
+            f.write("# bench\n")
+
+
+def write_deep_tree(root: str, depth: int) -> List[str]:
+    # цепочка из depth каталогов с боковыми ветками; manage.py и settings — на самом дне,
+    # requirements.txt и .env нет совсем: сканер обходит дерево целиком (худший случай)
+    paths = []
+    current = ""
+    for level in range(depth):
+        for branch in range(TREE_FANOUT):
+            side = os.path.join(current, f"pkg{level}_{branch}")
+            os.makedirs(os.path.join(root, side), exist_ok=True)
+            for i in range(TREE_FILES):
+                rel = os.path.join(side, f"module{i}.py")
+                with open(os.path.join(root, rel), "w") as f:
+                    f.write("x = 1\n")
+                paths.append(rel)
+        current = os.path.join(current, f"level{level}")
+        os.makedirs(os.path.join(root, current), exist_ok=True)
+    write_project_files(os.path.join(root, current))
+    for rel in ("manage.py", os.path.join("proj", "settings.py"), os.path.join("proj", "wsgi.py")):
+        paths.append(os.path.join(current, rel))
+    return paths
+
+
+def build_projects(store, count: int, log_kb: int = 32) -> List[str]:
+    from actions import register_project
+    from config import PROJECTS_DIR
+    from jobs import new_job, proc_starttime
+
+    ids = []
+    for i in range(count):
+        project_id = f"bench-{i:05d}"
+        root = os.path.join(PROJECTS_DIR, project_id)
+        write_project_files(root)
+        paths = ["manage.py", "proj/settings.py", "proj/wsgi.py"]
+        project = register_project(store, root, f"bench{i}.zip", paths)
+        write_log(project["log_file"], log_kb * 1024)
+        job = new_job(project_id, "install", "Dependencies installed", os.getpid(),
+                      proc_starttime(os.getpid()))
+        job.update(status="done", started_at=time.time(), finished_at=time.time())
+        store.create_job(job)
+        ids.append(project_id)
+    return ids
+
+
+# ---------- одна точка кривой (в дочернем процессе) ----------
+
+def run_point(sweep: str, params: Dict[str, int]) -> Dict[str, Any]:
+    sys.path.insert(0, APP_DIR)
+    from config import PROJECTS_DIR, LOGS_DIR
+    from store import ProjectStore
+    from logs import tail_file
+    from scanner import scan_project
+    from actions import register_project
+
+    store = ProjectStore()
+    results: Dict[str, Any] = {}
+
+    if sweep == "projects":
+        ids = build_projects(store, params["projects"])
+        results["store_load"] = measure(store.list_projects)
+        results["store_cached"] = measure(store.cached_projects)
+        counter = iter(range(10 ** 9))
+        results["store_update"] = measure(lambda: store.update_project(ids[-1], bench_counter=next(counter)))
+        import main
+        client = main.app.test_client()
+
+        def index():
+            resp = client.get("/")
+            assert resp.status_code == 200, resp.status_code
+        results["index"] = measure(index)
+
+    elif sweep == "log_mb":
+        project_id = build_projects(store, 1)[0]
+        log_path = os.path.join(LOGS_DIR, f"{project_id}.log")
+        size = params["log_mb"] * 1024 * 1024
+        results["log_lines"] = write_log(log_path, size)
+        results["tail_file"] = measure(lambda: tail_file(log_path, lines=100))
+        results["tail_file_5000"] = measure(lambda: tail_file(log_path, lines=5000))
+        import main
+        client = main.app.test_client()
+        body_bytes = []
+
+        def logs_tail():
+            resp = client.get(f"/projects/{project_id}/logs/tail?lines=500")
+            assert resp.status_code == 200, resp.status_code
+            body_bytes.append(len(resp.data))
+        results["logs_tail"] = measure(logs_tail)
+        # пропускная способность роута: запросов и мегабайт ответа в секунду
+        per_request = results["logs_tail"]["median_ms"] / 1000
+        results["logs_tail"]["requests_per_s"] = round(1 / per_request, 1) if per_request else None
+        results["logs_tail"]["mb_per_s"] = round(body_bytes[-1] / 1048576 / per_request, 2) if per_request else None
+
+    elif sweep == "depth":
+        root = os.path.join(PROJECTS_DIR, "bench-tree")
+        paths = write_deep_tree(root, params["depth"])
+        results["files"] = len(paths)
+        results["scan_project"] = measure(lambda: scan_project(root))
+        results["register_project"] = measure(lambda: register_project(store, root, "tree.zip"))
+        results["register_project_paths"] = measure(lambda: register_project(store, root, "tree.zip", paths))
+
+    return results
+
+
+def child_main(sweep: str, params: Dict[str, int]) -> None:
+    json.dump(run_point(sweep, params), sys.stdout)
+
+
+def spawn_point(sweep: str, params: Dict[str, int], keep: bool) -> Dict[str, Any]:
+    data_dir = tempfile.mkdtemp(prefix=f"runner-bench-{sweep}-")
+    env = dict(os.environ, DATA_BASE_DIR=data_dir)
+    try:
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", sweep, json.dumps(params)],
+            env=env, check=True, stdout=subprocess.PIPE,
+        ).stdout
+    finally:
+        if not keep:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    return json.loads(out)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=BENCH_DIR,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+# ---------- сравнение двух прогонов ----------
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> int:
+    # медианы по совпадающим точкам; медленнее в REGRESSION_THRESHOLD раз — регрессия
+    regressions = 0
+    print(f"{'benchmark':<28}{'point':>10}{'old ms':>12}{'new ms':>12}{'ratio':>8}")
+    for sweep, points in new["sweeps"].items():
+        old_points = {p[sweep]: p for p in old.get("sweeps", {}).get(sweep, [])}
+        for point in points:
+            before = old_points.get(point[sweep])
+            if not before:
+                continue
+            for name in SWEEPS[sweep]:
+                if name not in point or name not in before:
+                    continue
+                a, b = before[name]["median_ms"], point[name]["median_ms"]
+                ratio = b / a if a else 0.0
+                flag = "  <-- slower" if ratio > REGRESSION_THRESHOLD else ""
+                regressions += bool(flag)
+                print(f"{name:<28}{point[sweep]:>10}{a:>12.3f}{b:>12.3f}{ratio:>8.2f}{flag}")
+    return 1 if regressions else 0
+
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the runner control plane on synthetic /data trees.")
+    parser.add_argument("--projects", type=int_list, default=[1, 10, 50, 200],
+                        help="project counts for the store and index curve")
+    parser.add_argument("--log-mb", type=int_list, default=[1, 10, 100],
+                        help="log sizes in MB for the tail curve")
+    parser.add_argument("--depth", type=int_list, default=[5, 20, 80],
+                        help="source tree depths for the scanner curve")
+    parser.add_argument("--only", choices=list(SWEEPS), action="append",
+                        help="run only these curves (repeatable)")
+    parser.add_argument("-o", "--output", help="write JSON here instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="keep the generated data directories")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two result files; exit code 1 on regressions")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child_main(args.child[0], json.loads(args.child[1]))
+        return
+    if args.compare:
+        with open(args.compare[0]) as f_old, open(args.compare[1]) as f_new:
+            sys.exit(compare(json.load(f_old), json.load(f_new)))
+
+    values = {"projects": args.projects, "log_mb": args.log_mb, "depth": args.depth}
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "at": time.time(),
+        "base": BASE,
+        "sweeps": {},
+    }
+    for sweep in args.only or list(SWEEPS):
+        points = []
+        for value in values[sweep]:
+            params = dict(BASE, **{sweep: value})
+            print(f"{sweep}={value} ...", file=sys.stderr, flush=True)
+            points.append(dict(spawn_point(sweep, params, args.keep), **{sweep: value}))
+        report["sweeps"][sweep] = points
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()